@@ -0,0 +1,223 @@
+import os
+import time
+import heapq
+import threading
+
+from typing import Callable, Dict, List
+from termcolor import colored
+
+# Encoder threads all running renders may use together, defaults to the amount of CPUs
+ADMISSION_CPU_BUDGET = int(os.getenv("ADMISSION_CPU_BUDGET", 0)) or os.cpu_count() or 2
+
+# Memory all running renders may use together in MB, defaults to 80% of the RAM
+ADMISSION_MEMORY_BUDGET_MB = int(os.getenv("ADMISSION_MEMORY_BUDGET_MB", 0))
+
+# Jobs which may wait for resources at once, more are rejected, 0 queues without limit
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 10))
+
+# Encoder threads a job gets if the request doesn't ask for a number
+DEFAULT_THREADS = 2
+
+# Seconds of narration a paragraph of script produces
+SECONDS_PER_PARAGRAPH = float(os.getenv("ADMISSION_SECONDS_PER_PARAGRAPH", 25))
+
+# Wall clock seconds to render one second of video with one encoder thread
+RENDER_SECONDS_PER_VIDEO_SECOND = float(os.getenv("ADMISSION_RENDER_SECONDS_PER_VIDEO_SECOND", 6))
+
+# Memory of the backend's share of a job, decoders and buffered frames come on top, in MB
+BASE_MEMORY_MB = 400
+DECODER_MEMORY_MB = 120
+THREAD_MEMORY_MB = 60
+
+# Frames of the output held in memory at once (compositing, encoder lookahead)
+FRAMES_IN_FLIGHT = 40
+
+
+class AdmissionRejected(Exception):
+    """Raised when a job can't be admitted, now or ever."""
+
+
+def _memory_budget_mb() -> float:
+    if ADMISSION_MEMORY_BUDGET_MB:
+        return ADMISSION_MEMORY_BUDGET_MB
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 / 1024 * 0.8
+    except (ValueError, OSError, AttributeError):
+        # No way to tell on this platform, don't limit memory
+        return float("inf")
+
+
+def estimate(data: dict, clips: int, size: tuple = (1080, 1920), max_open_decoders: int = 4, duration: float = None) -> dict:
+    """
+    Estimates what a generation costs, from the expected duration of the
+    video, its resolution and the amount of stock clips it combines.
+
+    Args:
+        data (dict): The request of the generation.
+        clips (int): The amount of stock clips.
+        size (tuple): The resolution of the output.
+        max_open_decoders (int): Decoders running at once while combining.
+        duration (float): The duration of the video, if known, estimated from the paragraphs otherwise.
+
+    Returns:
+        dict: The encoder threads asked for, the memory in MB and the render time in seconds.
+    """
+    if duration is None:
+        duration = int(data.get("paragraphNumber") or 1) * SECONDS_PER_PARAGRAPH
+    threads = max(1, min(int(data.get("threads") or DEFAULT_THREADS), ADMISSION_CPU_BUDGET))
+
+    width, height = size
+    frame_mb = width * height * 3 / 1024 / 1024
+    memory_mb = (
+        BASE_MEMORY_MB
+        + min(clips, max_open_decoders) * DECODER_MEMORY_MB
+        + threads * THREAD_MEMORY_MB
+        + FRAMES_IN_FLIGHT * frame_mb
+    )
+
+    return {
+        "threads": threads,
+        "memoryMb": round(memory_mb),
+        "seconds": duration * RENDER_SECONDS_PER_VIDEO_SECOND / threads,
+    }
+
+
+class AdmissionController:
+    """
+    Admits generations in order of arrival as long as their estimated CPU
+    and memory cost fits into the budgets, granting every job encoder
+    threads out of the CPU budget. Jobs which don't fit wait in a queue.
+    """
+
+    def __init__(self, cpu_budget: int = ADMISSION_CPU_BUDGET, memory_budget_mb: float = None, max_queue: int = ADMISSION_MAX_QUEUE):
+        self.cpu_budget = cpu_budget
+        self.memory_budget_mb = memory_budget_mb if memory_budget_mb is not None else _memory_budget_mb()
+        self.max_queue = max_queue
+        self.running: Dict[str, dict] = {}
+        self.waiting: List[dict] = []
+        self._changed = threading.Condition()
+
+    def _free(self) -> tuple:
+        cpu = self.cpu_budget - sum(job["threads"] for job in self.running.values())
+        memory = self.memory_budget_mb - sum(job["memoryMb"] for job in self.running.values())
+        return cpu, memory
+
+    def admit(self, job_id: str, cost: dict, cancelled: Callable[[], bool] = lambda: False) -> dict:
+        """
+        Waits until a job may run.
+
+        Args:
+            job_id (str): The ID of the job.
+            cost (dict): The estimated cost of the job, see estimate().
+            cancelled (Callable): Tells whether the job was cancelled while waiting.
+
+        Returns:
+            dict: The admitted job with its granted "threads", or None if it was cancelled.
+        """
+        if cost["memoryMb"] > self.memory_budget_mb:
+            raise AdmissionRejected(f"The video needs about {cost['memoryMb']} MB of memory, more than the {self.memory_budget_mb:.0f} MB available.")
+
+        job = {"id": job_id, **cost, "queuedAt": time.time()}
+        with self._changed:
+            if self.max_queue and len(self.waiting) >= self.max_queue:
+                raise AdmissionRejected("Too many videos are waiting to be generated, try again later.")
+            self.waiting.append(job)
+
+            try:
+                while True:
+                    cpu, memory = self._free()
+                    if self.waiting[0] is job and cpu >= 1 and memory >= job["memoryMb"]:
+                        break
+                    if cancelled():
+                        return None
+                    self._changed.wait(1)
+            finally:
+                self.waiting.remove(job)
+                self._changed.notify_all()
+
+            # Grant what is asked for, or whatever is left
+            cpu, _ = self._free()
+            granted = max(1, min(job["threads"], cpu))
+            job["seconds"] *= job["threads"] / granted
+            job["threads"] = granted
+            job["startedAt"] = time.time()
+            self.running[job_id] = job
+
+        if job["startedAt"] - job["queuedAt"] > 1:
+            print(colored(f"[+] Admitted job {job_id} after {job['startedAt'] - job['queuedAt']:.0f}s with {job['threads']} threads", "green"))
+        return job
+
+    def release(self, job_id: str) -> None:
+        """
+        Gives the resources of a finished job back.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            None
+        """
+        with self._changed:
+            if self.running.pop(job_id, None) is not None:
+                self._changed.notify_all()
+
+    def _schedule(self) -> Dict[str, float]:
+        # Replays the queue against the expected end of every running job
+        now = time.time()
+        cpu, memory = self._free()
+        releases = [
+            (max(now, job["startedAt"] + job["seconds"]), job["threads"], job["memoryMb"])
+            for job in self.running.values()
+        ]
+        heapq.heapify(releases)
+
+        starts = {}
+        clock = now
+        for job in self.waiting:
+            while (cpu < 1 or memory < job["memoryMb"]) and releases:
+                end, threads, memory_mb = heapq.heappop(releases)
+                clock = max(clock, end)
+                cpu += threads
+                memory += memory_mb
+            starts[job["id"]] = clock
+
+            threads = max(1, min(job["threads"], cpu))
+            cpu -= threads
+            memory -= job["memoryMb"]
+            heapq.heappush(releases, (clock + job["seconds"] * job["threads"] / threads, threads, job["memoryMb"]))
+
+        return starts
+
+    def position(self, job_id: str) -> dict:
+        """
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict: The "queuePosition" (1 is next) and "estimatedStart" of a waiting job, or None.
+        """
+        with self._changed:
+            for index, job in enumerate(self.waiting):
+                if job["id"] == job_id:
+                    return {"queuePosition": index + 1, "estimatedStart": round(self._schedule()[job_id])}
+        return None
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: The budgets, and what running and waiting jobs use of them.
+        """
+        with self._changed:
+            cpu, memory = self._free()
+            return {
+                "cpuBudget": self.cpu_budget,
+                "memoryBudgetMb": None if self.memory_budget_mb == float("inf") else round(self.memory_budget_mb),
+                "cpuFree": cpu,
+                "memoryFreeMb": None if memory == float("inf") else round(memory),
+                "running": [{"id": job["id"], "threads": job["threads"], "memoryMb": job["memoryMb"]} for job in self.running.values()],
+                "waiting": [job["id"] for job in self.waiting],
+            }
+
+
+# The controller shared by every request
+ADMISSION = AdmissionController()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import hashlib
+
+# Shared content-addressed store, a directory every node can reach (NFS, SMB, ...)
+ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", "../artifacts")
+
+
+def _object_path(key: str) -> str:
+    if os.path.basename(key) != key:
+        raise ValueError(f"Invalid artifact key: {key}")
+    return os.path.join(ARTIFACT_STORE_DIR, key[:2], key)
+
+
+def digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Args:
+        path (str): The path of the file.
+        chunk_size (int): Bytes hashed at once.
+
+    Returns:
+        str: The SHA-256 of the contents of the file.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def put(path: str) -> str:
+    """
+    Adds a file to the store. Files with the same contents are only
+    stored once.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The key of the artifact, its digest followed by the extension of the file.
+    """
+    key = digest(path) + os.path.splitext(path)[1].lower()
+    object_path = _object_path(key)
+
+    if os.path.exists(object_path):
+        # Stored again, the janitor expires it by its last use
+        os.utime(object_path)
+    else:
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # Copy next to the object first, so readers never see a partial file
+        temp_path = f"{object_path}.{os.getpid()}.tmp"
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, object_path)
+
+    return key
+
+
+def exists(key: str) -> bool:
+    """
+    Args:
+        key (str): The key of the artifact.
+
+    Returns:
+        bool: Whether the artifact is in the store.
+    """
+    return os.path.exists(_object_path(key))
+
+
+def get(key: str, directory: str) -> str:
+    """
+    Makes an artifact available in a local directory. The object is hard
+    linked if the store is on the same filesystem, else it is copied.
+
+    Args:
+        key (str): The key of the artifact.
+        directory (str): The directory to place the artifact in.
+
+    Returns:
+        str: The local path of the artifact, named after its key.
+    """
+    object_path = _object_path(key)
+    if not os.path.exists(object_path):
+        raise FileNotFoundError(f"Artifact not found: {key}")
+
+    # The janitor expires objects by their last use
+    os.utime(object_path)
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key)
+    if os.path.exists(path):
+        return path
+
+    try:
+        os.link(object_path, path)
+    except OSError:
+        shutil.copyfile(object_path, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    return path
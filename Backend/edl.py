@@ -0,0 +1,231 @@
+import providers
+
+from typing import Dict, List, Tuple
+
+# Resolution and frame rate of the final video
+OUTPUT_SIZE = (1080, 1920)
+FPS = 30
+
+# Longest a single stock clip is shown in seconds
+MAX_CLIP_DURATION = 5
+
+# Shortest a source may be to be shown, one frame
+MIN_CLIP_DURATION = 1 / FPS
+
+# Most segments a timeline may have, so tiny clips can't make planning run for ages
+MAX_SEGMENTS = 5000
+
+# Version of the EDL format, bumped on incompatible changes
+EDL_VERSION = 1
+
+
+def probe(path: str) -> dict:
+    """
+    Reads the duration and resolution of a media file from its header,
+    without decoding it.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        dict: The duration in seconds, and the width and height in pixels (0 for audio).
+    """
+    providers.get("moviepy")
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(path)
+    width, height = infos.get("video_size") or (0, 0)
+    return {"duration": infos.get("duration") or 0, "width": width, "height": height}
+
+
+def crop_box(width: int, height: int, size: Tuple[int, int] = OUTPUT_SIZE) -> dict:
+    """
+    Returns the centered crop of a source which has the aspect ratio of the output.
+
+    Args:
+        width (int): The width of the source.
+        height (int): The height of the source.
+        size (Tuple[int, int]): The output resolution.
+
+    Returns:
+        dict: The x and y of the top left corner, and the width and height of the crop.
+    """
+    ratio = size[0] / size[1]
+    if round(width / height, 4) < ratio:
+        crop_width, crop_height = width, round(width / ratio)
+    else:
+        crop_width, crop_height = round(ratio * height), height
+    return {
+        "x": width / 2 - crop_width / 2,
+        "y": height / 2 - crop_height / 2,
+        "width": crop_width,
+        "height": crop_height,
+    }
+
+
+def plan_segments(video_paths: List[str], durations: dict, max_duration: float, max_clip_duration: float) -> List[dict]:
+    """
+    Lays out the timeline of the combined video: the clips are added over
+    and over until the duration of the audio (max_duration) has been reached.
+
+    Args:
+        video_paths (List[str]): The paths to the source videos.
+        durations (dict): The duration of every source video.
+        max_duration (float): The duration of the combined video.
+        max_clip_duration (float): The maximum duration of each clip.
+
+    Returns:
+        List[dict]: The segments, with their source, in/out points and timeline position.
+
+    Raises:
+        ValueError: If no source is at least a frame long, or the timeline needs more than MAX_SEGMENTS segments.
+    """
+    if max_clip_duration < MIN_CLIP_DURATION:
+        raise ValueError(f"Clips must be allowed to last at least {MIN_CLIP_DURATION:.3f}s")
+
+    # Sources without a duration (e.g. unreadable files) would never fill the timeline
+    video_paths = [video_path for video_path in video_paths if durations[video_path] >= MIN_CLIP_DURATION]
+    if not video_paths:
+        raise ValueError("No source video with a duration to plan")
+
+    # Required duration of each clip
+    req_dur = max_duration / len(video_paths)
+
+    segments = []
+    tot_dur = 0
+    while tot_dur < max_duration:
+        for video_path in video_paths:
+            if tot_dur >= max_duration:
+                break
+
+            source_duration = durations[video_path]
+
+            # Check if clip is longer than the remaining audio
+            if (max_duration - tot_dur) < source_duration:
+                seg_dur = max_duration - tot_dur
+            # Only shorten clips if the calculated clip length (req_dur) is shorter than the actual clip to prevent still image
+            elif req_dur < source_duration:
+                seg_dur = req_dur
+            else:
+                seg_dur = source_duration
+            seg_dur = min(seg_dur, max_clip_duration)
+
+            if len(segments) == MAX_SEGMENTS:
+                raise ValueError(f"The timeline would need more than {MAX_SEGMENTS} segments")
+
+            segments.append({
+                "source": video_path,
+                "start": 0,
+                "end": seg_dur,
+                "duration": seg_dur,
+                "timelineStart": tot_dur,
+            })
+            tot_dur += seg_dur
+
+    return segments
+
+
+def snap_to_frames(segments: List[dict], fps: int = FPS) -> List[dict]:
+    """
+    Moves the cuts of a timeline onto whole frames, so segments rendered
+    on their own don't drift from the audio once joined. Segments shorter
+    than a frame are dropped.
+
+    Args:
+        segments (List[dict]): The segments, see plan_segments().
+        fps (int): The frame rate of the output.
+
+    Returns:
+        List[dict]: The snapped segments.
+    """
+    snapped = []
+    for segment in segments:
+        start_frame = round(segment["timelineStart"] * fps)
+        end_frame = round((segment["timelineStart"] + segment["duration"]) * fps)
+        if end_frame <= start_frame:
+            continue
+        duration = (end_frame - start_frame) / fps
+        snapped.append({
+            **segment,
+            "end": segment["start"] + duration,
+            "duration": duration,
+            "timelineStart": start_frame / fps,
+        })
+    return snapped
+
+
+def read_cues(subtitles_path: str) -> List[dict]:
+    """
+    Args:
+        subtitles_path (str): The path of an SRT file.
+
+    Returns:
+        List[dict]: The start, end and text of every cue.
+    """
+    providers.get("moviepy")
+    from moviepy.video.tools.subtitles import file_to_subtitles
+
+    return [{"start": ta, "end": tb, "text": text} for (ta, tb), text in file_to_subtitles(subtitles_path)]
+
+
+def build(video_paths: List[str], audio_path: str = None, audio_duration: float = None, media: Dict[str, dict] = None,
+          subtitles_path: str = None, subtitles_position: str = None, text_color: str = None, music: dict = None,
+          size: Tuple[int, int] = OUTPUT_SIZE, fps: int = FPS, max_clip_duration: float = MAX_CLIP_DURATION) -> dict:
+    """
+    Plans the final video as an edit decision list: which part of which
+    source is shown when, how it is cropped, the subtitle cues and the
+    audio layers. Only file headers are read, nothing is decoded, and any
+    render backend can consume the result.
+
+    Args:
+        video_paths (List[str]): The stock videos, in order.
+        audio_path (str): The voice over, its duration sets the length of the video.
+        audio_duration (float): The length of the video, when there is no voice over yet.
+        media (Dict[str, dict]): Known duration, width and height of sources, the rest is probed.
+        subtitles_path (str): The SRT file of the subtitles, or None.
+        subtitles_position (str): Where the subtitles are placed, e.g. "center,bottom".
+        text_color (str): The color of the subtitles.
+        music (dict): The source and gain of the background music, or None.
+        size (Tuple[int, int]): The output resolution.
+        fps (int): The output frame rate.
+        max_clip_duration (float): The longest a clip is shown in seconds.
+
+    Returns:
+        dict: The EDL.
+    """
+    media = dict(media or {})
+    for path in video_paths:
+        if path not in media:
+            media[path] = probe(path)
+    if audio_path is not None:
+        audio_duration = probe(audio_path)["duration"]
+
+    segments = plan_segments(video_paths, {path: media[path]["duration"] for path in video_paths}, audio_duration, max_clip_duration)
+    clips = [
+        {
+            **segment,
+            "sourceSize": [media[segment["source"]]["width"], media[segment["source"]]["height"]],
+            "crop": crop_box(media[segment["source"]]["width"], media[segment["source"]]["height"], size),
+        }
+        for segment in snap_to_frames(segments, fps)
+    ]
+
+    audio = [{"role": "voice", "source": audio_path, "start": 0, "duration": audio_duration, "gain": 1.0}]
+    if music:
+        audio.append({"role": "music", "source": music.get("source"), "start": 0, "duration": audio_duration, "gain": music.get("gain")})
+
+    return {
+        "version": EDL_VERSION,
+        "size": list(size),
+        "fps": fps,
+        "duration": audio_duration,
+        "clips": clips,
+        "subtitles": {
+            "source": subtitles_path,
+            "position": subtitles_position,
+            "color": text_color,
+            "cues": read_cues(subtitles_path) if subtitles_path else [],
+        },
+        "audio": audio,
+    }
+
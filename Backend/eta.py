@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import threading
+
+from typing import Callable, Dict
+from jobs import STAGES
+
+# Timings of past generations, per stage
+TIMINGS_PATH = "../final_videos/.timings.json"
+
+# Samples kept per stage, older ones are forgotten
+TIMING_SAMPLES = 50
+
+# Seconds per unit of work of every stage, used until there is history
+#   script: paragraphs, search_terms/clips: stock clips, voice/subtitles: sentences,
+#   combine/render/music: seconds of video, metadata: one per video
+DEFAULT_RATES = {
+    "script": 8.0,
+    "search_terms": 1.0,
+    "clips": 4.0,
+    "voice": 2.0,
+    "subtitles": 0.5,
+    "combine": 1.5,
+    "render": 3.0,
+    "metadata": 5.0,
+    "music": 1.5,
+    "upload": 0.0,
+}
+
+# Seconds between two reports of the progress inside a stage
+REPORT_INTERVAL = 0.5
+
+
+class EtaModel:
+    """
+    Predicts how long every stage takes from the timings of past
+    generations, as seconds per unit of work, so the prediction scales
+    with the length of the script and the amount of clips.
+    """
+
+    def __init__(self, path: str = TIMINGS_PATH):
+        self.path = path
+        self.samples: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    self.samples = json.load(file)
+            except ValueError:
+                self.samples = {}
+
+    def rate(self, stage: str) -> float:
+        """
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            float: The seconds a unit of work of the stage takes.
+        """
+        samples = self.samples.get(stage) or []
+        units = sum(sample["units"] for sample in samples)
+        if not units:
+            return DEFAULT_RATES.get(stage, 1.0)
+        return sum(sample["seconds"] for sample in samples) / units
+
+    def predict(self, stage: str, units: float) -> float:
+        """
+        Args:
+            stage (str): The name of the stage.
+            units (float): The work the stage has to do.
+
+        Returns:
+            float: The seconds the stage is expected to take.
+        """
+        return self.rate(stage) * units
+
+    def record(self, stage: str, units: float, seconds: float) -> None:
+        """
+        Adds the timing of a finished stage to the history.
+
+        Args:
+            stage (str): The name of the stage.
+            units (float): The work the stage did.
+            seconds (float): How long it took.
+
+        Returns:
+            None
+        """
+        if units <= 0:
+            return
+
+        with self._lock:
+            samples = self.samples.setdefault(stage, [])
+            samples.append({"units": units, "seconds": round(seconds, 3)})
+            del samples[:-TIMING_SAMPLES]
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(self.samples, file)
+            os.replace(self.path + ".tmp", self.path)
+
+
+# The model shared by every generation
+MODEL = EtaModel()
+
+
+class ProgressTracker:
+    """
+    Turns the work done inside every stage (frames encoded, bytes
+    downloaded, sentences spoken) into the overall progress and the
+    remaining time of a generation, weighting every stage by its
+    predicted duration.
+    """
+
+    def __init__(self, units: Dict[str, float], report: Callable[[int, str, float], None], model: EtaModel = MODEL, on_stage: Callable[[str], None] = None):
+        """
+        Args:
+            units (Dict[str, float]): The expected work of every stage.
+            report (Callable): Called with the progress in percent, the message and the remaining seconds.
+            model (EtaModel): The model predicting the stage durations.
+            on_stage (Callable): Called with the stage which starts, or None when it finishes.
+        """
+        self.units = {stage: units.get(stage, 0) for stage in STAGES}
+        self.report = report
+        self.model = model
+        self.on_stage = on_stage
+        self.done = set()
+        self.stage = None
+        self.message = ""
+        self.fraction = 0.0
+        self.started = None
+        self._last_report = 0.0
+        self._last_progress = 0
+        self._lock = threading.Lock()
+
+    def expect(self, stage: str, units: float) -> None:
+        """
+        Updates the expected work of a stage, once it is known better.
+
+        Args:
+            stage (str): The name of the stage.
+            units (float): The expected work.
+
+        Returns:
+            None
+        """
+        self.units[stage] = units
+
+    def skip(self, stage: str) -> None:
+        """
+        Marks a stage as done without timing it, e.g. when it completed
+        before a resume or doesn't run at all.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            None
+        """
+        self.done.add(stage)
+
+    def start(self, stage: str, message: str, units: float = None) -> None:
+        """
+        Starts timing a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            message (str): What is happening.
+            units (float): The work the stage has to do, if known better now.
+
+        Returns:
+            None
+        """
+        if self.stage is not None:
+            self.finish()
+        if units is not None:
+            self.units[stage] = units
+
+        # A stage which completed before may run again after a resume
+        self.done.discard(stage)
+        self.stage = stage
+        self.message = message
+        self.fraction = 0.0
+        self.started = time.time()
+        if self.on_stage:
+            self.on_stage(stage)
+        self._emit(force=True)
+
+    def advance(self, fraction: float, message: str = None) -> None:
+        """
+        Reports the progress inside the current stage. Safe to call from
+        any thread and as often as wanted, reports are throttled.
+
+        Args:
+            fraction (float): The share of the stage which is done, between 0 and 1.
+            message (str): What is happening, keeps the previous message if omitted.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.fraction = min(max(fraction, self.fraction), 1.0)
+            if message:
+                self.message = message
+        self._emit()
+
+    def finish(self) -> None:
+        """
+        Stops timing the current stage and records how long it took.
+
+        Returns:
+            None
+        """
+        if self.stage is None:
+            return
+        self.model.record(self.stage, self.units[self.stage], time.time() - self.started)
+        self.done.add(self.stage)
+        self.stage = None
+        if self.on_stage:
+            self.on_stage(None)
+
+    def _current_remaining(self) -> float:
+        predicted = self.model.predict(self.stage, self.units[self.stage])
+        elapsed = time.time() - self.started
+        if self.fraction <= 0.05:
+            return max(predicted - elapsed, 0)
+
+        # Average the prediction with what the stage's own pace says
+        observed = elapsed * (1 - self.fraction) / self.fraction
+        return (predicted * (1 - self.fraction) + observed) / 2
+
+    def status(self) -> tuple:
+        """
+        Returns:
+            tuple: The progress in percent and the predicted remaining seconds.
+        """
+        predictions = {stage: self.model.predict(stage, units) for stage, units in self.units.items()}
+        total = sum(predictions.values()) or 1
+
+        done = sum(predictions[stage] for stage in self.done)
+        remaining = sum(predictions[stage] for stage in STAGES if stage not in self.done and stage != self.stage)
+        if self.stage is not None:
+            done += predictions[self.stage] * self.fraction
+            remaining += self._current_remaining()
+
+        return min(int(done / total * 100), 99), remaining
+
+    def _emit(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self._last_report < REPORT_INTERVAL:
+            return
+        self._last_report = now
+
+        # Never go backwards when the expected work of a stage grows
+        progress, remaining = self.status()
+        self._last_progress = max(progress, self._last_progress)
+        self.report(self._last_progress, self.message, remaining)
@@ -0,0 +1,337 @@
+"""
+Renders segments by moving raw frames from a decoding ffmpeg to an
+encoding ffmpeg through a ring of preallocated frame slots. ffmpeg crops and scales while decoding, frames are read straight
+into a slot and written straight out of it, and subtitles are blended
+into the slot in place, so no frame is allocated or copied in Python.
+
+Segments use it with FRAME_TRANSPORT=ring. Compare its throughput with
+the moviepy path on a stock clip:
+
+    python framering.py <video> [seconds]
+"""
+import os
+import sys
+import time
+import threading
+import subprocess
+
+import providers
+import processes
+
+from typing import Callable, List
+from termcolor import colored
+from preview import keyframe_params
+
+# Frame slots of a ring, decoding may run this many frames ahead of encoding
+FRAME_RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", 8))
+
+
+class RingAborted(Exception):
+    """Raised in every stage of a ring once one of them failed."""
+
+
+class FrameRing:
+    """
+    A fixed amount of preallocated frame slots, passed around by a
+    pipeline of stages. Every slot goes through stage 0, 1, ... in order
+    and then back to stage 0, each stage is run by a single thread.
+    """
+
+    def __init__(self, slots: int, shape: tuple, stages: int):
+        np = providers.get("numpy")
+        self.slots = slots
+        self.stages = stages
+        self.frames = np.empty((slots,) + tuple(shape), dtype=np.uint8)
+        # Flat byte views of the slots, for reading and writing pipes
+        self.buffers = [memoryview(frame).cast("B") for frame in self.frames]
+
+        # Slots ready for every stage, all of them start at the first one
+        self._ready = [threading.Semaphore(slots if stage == 0 else 0) for stage in range(stages)]
+        self._cursor = [0] * stages
+        self._ended = [False] * stages
+        self.error = None
+
+    def acquire(self, stage: int) -> int:
+        """
+        Waits for the next slot of a stage.
+
+        Args:
+            stage (int): The stage.
+
+        Returns:
+            int: The index of the slot, None once the previous stage ended and every slot was handled.
+        """
+        while not self._ready[stage].acquire(timeout=0.1):
+            if self.error is not None:
+                raise RingAborted() from self.error
+
+        if self.error is not None:
+            raise RingAborted() from self.error
+        if stage > 0 and self._ended[stage - 1] and self._cursor[stage] == self._cursor[stage - 1]:
+            return None
+
+        index = self._cursor[stage] % self.slots
+        self._cursor[stage] += 1
+        return index
+
+    def release(self, stage: int, index: int) -> None:
+        """
+        Hands a slot on to the next stage.
+
+        Args:
+            stage (int): The stage which is done with the slot.
+            index (int): The index of the slot.
+
+        Returns:
+            None
+        """
+        self._ready[(stage + 1) % self.stages].release()
+
+    def end(self, stage: int) -> None:
+        """
+        Marks a stage as done, the next one ends once it handled every slot.
+
+        Args:
+            stage (int): The stage.
+
+        Returns:
+            None
+        """
+        self._ended[stage] = True
+        if stage + 1 < self.stages:
+            self._ready[stage + 1].release()
+
+    def abort(self, error: BaseException) -> None:
+        """
+        Stops every stage.
+
+        Args:
+            error (BaseException): Why.
+
+        Returns:
+            None
+        """
+        if self.error is None:
+            self.error = error
+
+
+class Overlay:
+    """
+    A subtitle cue, blended into frames in place with preallocated
+    scratch memory: (frame * (256 - alpha) + text * alpha) >> 8.
+    """
+
+    def __init__(self, start: float, end: float, rgb, alpha, position: tuple, size: tuple):
+        np = providers.get("numpy")
+        width, height = size
+        h, w = alpha.shape
+        x = _place(position[0], {"left": 0, "center": (width - w) // 2, "right": width - w})
+        y = _place(position[1], {"top": 0, "center": (height - h) // 2, "bottom": height - h})
+
+        # Only the part of the text inside the frame
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + w, width), min(y + h, height)
+        rgb = rgb[top - y:bottom - y, left - x:right - x]
+        alpha = np.rint(alpha[top - y:bottom - y, left - x:right - x] * 256).astype(np.uint16)[:, :, None]
+
+        self.start = start
+        self.end = end
+        self.region = (slice(top, bottom), slice(left, right))
+        self.inverse = 256 - alpha
+        self.text = rgb.astype(np.uint16) * alpha
+        self.scratch = np.empty(self.text.shape, dtype=np.uint16)
+
+    def apply(self, frame) -> None:
+        np = providers.get("numpy")
+        region = frame[self.region]
+        np.multiply(region, self.inverse, out=self.scratch)
+        np.add(self.scratch, self.text, out=self.scratch)
+        np.right_shift(self.scratch, 8, out=self.scratch)
+        np.copyto(region, self.scratch, casting="unsafe")
+
+
+def _place(value, named: dict) -> int:
+    # moviepy positions are names or pixels
+    if value in named:
+        return named[value]
+    return int(float(value))
+
+
+def _overlays(spec: dict, size: tuple) -> List[Overlay]:
+    from render import _segment_subtitles
+    from video import subtitle_generator
+
+    if not spec.get("subtitlesPath"):
+        return []
+
+    make = subtitle_generator(spec["textColor"])
+    overlays = []
+    for (start, end), text in _segment_subtitles(spec["subtitlesPath"], spec["timelineStart"], spec["timelineStart"] + spec["duration"]):
+        clip = make(text)
+        overlays.append(Overlay(start, end, clip.get_frame(0), clip.mask.get_frame(0), spec["subtitlesPosition"], size))
+        clip.close()
+    return overlays
+
+
+def _read_into(stream, buffer: memoryview) -> bool:
+    # A pipe may return less than asked for, fill the slot completely
+    filled = 0
+    while filled < len(buffer):
+        read = stream.readinto(buffer[filled:])
+        if not read:
+            return False
+        filled += read
+    return True
+
+
+def _write_from(stream, buffer: memoryview) -> None:
+    # An unbuffered pipe may take less than offered
+    written = 0
+    while written < len(buffer):
+        written += stream.write(buffer[written:])
+
+
+def _stage(ring: FrameRing, work: Callable[[], None]) -> threading.Thread:
+    def run():
+        try:
+            work()
+        except RingAborted:
+            pass
+        except BaseException as e:
+            ring.abort(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def render_segment(spec: dict, size: tuple = (1080, 1920), fps: int = 30) -> str:
+    """
+    Renders one segment of the final video without audio, like
+    render._render_segment(), moving the frames through a FrameRing.
+
+    Args:
+        spec (dict): The segment, a clip of the EDL with the render settings, see render.render_parallel().
+        size (tuple): The output resolution.
+        fps (int): The output frame rate.
+
+    Returns:
+        str: The path of the rendered segment.
+    """
+    np = providers.get("numpy")
+    providers.get("moviepy")
+    from moviepy.config import get_setting
+
+    ffmpeg = get_setting("FFMPEG_BINARY")
+    width, height = size
+    frames = round(spec["duration"] * fps)
+    crop = spec["crop"]
+    overlays = _overlays(spec, size)
+
+    decoder = processes.TrackedPopen([
+        ffmpeg, "-v", "error",
+        "-ss", str(spec["start"]), "-i", spec["source"], "-t", str(spec["duration"]),
+        "-vf", f"crop={crop['width']}:{crop['height']}:{crop['x']}:{crop['y']},scale={width}:{height}:flags=lanczos,fps={fps}",
+        "-an", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+    encoder = processes.TrackedPopen([
+        ffmpeg, "-y", "-v", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+        "-an", "-c:v", "libx264", "-preset", "medium", "-threads", str(spec["threads"]),
+        "-pix_fmt", "yuv420p", *keyframe_params(fps), spec["path"]
+    ], stdin=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+
+    stages = 3 if overlays else 2
+    ring = FrameRing(FRAME_RING_SLOTS, (height, width, 3), stages)
+
+    def decode():
+        last = None
+        for number in range(frames):
+            index = ring.acquire(0)
+            # Sources shorter than the segment hold their last frame, like moviepy does
+            if not _read_into(decoder.stdout, ring.buffers[index]):
+                if last is None:
+                    raise RuntimeError(f"Could not decode {spec['source']}")
+                np.copyto(ring.frames[index], ring.frames[last])
+            last = index
+            ring.release(0, index)
+        ring.end(0)
+
+    def blend():
+        number = 0
+        while (index := ring.acquire(1)) is not None:
+            t = number / fps
+            for overlay in overlays:
+                if overlay.start <= t < overlay.end:
+                    overlay.apply(ring.frames[index])
+            number += 1
+            ring.release(1, index)
+        ring.end(1)
+
+    def encode():
+        while (index := ring.acquire(stages - 1)) is not None:
+            _write_from(encoder.stdin, ring.buffers[index])
+            ring.release(stages - 1, index)
+
+    threads = [_stage(ring, decode)] + ([_stage(ring, blend)] if overlays else []) + [_stage(ring, encode)]
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        decoder.kill()
+        encoder.stdin.close()
+        encoder.wait()
+        decoder.wait()
+
+    if ring.error is not None:
+        raise ring.error
+    if encoder.returncode != 0:
+        raise RuntimeError(f"Encoding {spec['path']} failed with exit code {encoder.returncode}")
+    return spec["path"]
+
+
+def benchmark(source: str, seconds: float = 10, threads: int = 2) -> dict:
+    """
+    Renders the same segment with moviepy and through a FrameRing.
+
+    Args:
+        source (str): A stock video.
+        seconds (float): The length of the segment.
+        threads (int): Encoder threads.
+
+    Returns:
+        dict: Frames per second of both transports.
+    """
+    import edl
+    import tempfile
+    from render import _render_segment
+
+    info = edl.probe(source)
+    seconds = min(seconds, info["duration"])
+    spec = {
+        "source": os.path.abspath(source),
+        "start": 0,
+        "end": seconds,
+        "duration": seconds,
+        "timelineStart": 0,
+        "crop": edl.crop_box(info["width"], info["height"]),
+        "index": 0,
+        "videoId": "benchmark",
+        "subtitlesPath": None,
+        "subtitlesPosition": ("center", "bottom"),
+        "textColor": "white",
+        "threads": threads,
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for transport in ("moviepy", "ring"):
+            started = time.perf_counter()
+            _render_segment({**spec, "path": os.path.join(directory, f"{transport}.mp4"), "transport": transport})
+            results[transport] = round(seconds * 30 / (time.perf_counter() - started), 1)
+            print(colored(f"[+] {transport}: {results[transport]} frames per second", "green"))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 10)
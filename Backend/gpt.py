@@ -1,95 +1,519 @@
-import re
 import os
-import g4f
+import re
 import json
-import openai
-import google.generativeai as genai
+import time
+import threading
+import providers
 
-from g4f.client import Client
+from collections import deque
 from termcolor import colored
 from dotenv import load_dotenv
-from typing import Tuple, List
+from keywords import search_terms as local_search_terms, tags as local_tags
+from typing import Callable, Dict, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Load environment variables
 load_dotenv("../.env")
 
-# Set environment variables
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-openai.api_key = OPENAI_API_KEY
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-genai.configure(api_key=GOOGLE_API_KEY)
+# Requests a provider may start per minute, and how many it may start at once after idling
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", 60))
+LLM_BURST = int(os.getenv("LLM_BURST", 5))
 
+# Requests a provider may run at once
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
 
-def generate_response(prompt: str, ai_model: str) -> str:
-    """
-    Generate a script for a video, depending on the subject of the video.
+# Seconds a request may take before it counts as failed
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
 
-    Args:
-        video_subject (str): The subject of the video.
-        ai_model (str): The AI model to use for generation.
+# Overrides of the limits above per model, e.g. {"gpt4": {"ratePerMinute": 20, "concurrency": 2}}
+LLM_LIMITS = json.loads(os.getenv("LLM_LIMITS", "{}"))
 
+# Models tried, in order, when the selected one fails, times out or is saturated
+LLM_FALLBACKS = [name.strip() for name in os.getenv("LLM_FALLBACKS", "").split(",") if name.strip()]
 
-    Returns:
+# Times the models are tried again after all of them failed
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 1))
 
-        str: The response from the AI model.
+# Seconds after which a slow request is hedged with the next model, 0 only fails over
+LLM_HEDGE_SECONDS = float(os.getenv("LLM_HEDGE_SECONDS", 0))
 
-    """
+# Seconds to wait for a rate limited or busy model before moving on to the next one
+LLM_QUEUE_SECONDS = float(os.getenv("LLM_QUEUE_SECONDS", 5))
 
-    if ai_model == 'g4f':
-        # Newest G4F Architecture
-        client = Client()
-        response = client.chat.completions.create(
+# Where search terms and tags come from: "llm", "local" (keyword extraction from the script)
+# or "fallback" (the model, local extraction when it fails or returns garbage)
+KEYWORD_EXTRACTION = os.getenv("KEYWORD_EXTRACTION", "fallback")
+
+# Latencies kept per model for the stats
+LATENCY_SAMPLES = 200
+
+
+class LLMUnavailable(Exception):
+    """Raised when no model could answer a prompt."""
+
+
+class G4FClient:
+    """The free g4f provider."""
+
+    def __init__(self):
+        self.client = None
+
+    def complete(self, prompt: str, timeout: float) -> str:
+        g4f = providers.get("g4f")
+        if self.client is None:
+            self.client = g4f.client.Client()
+        return self.client.chat.completions.create(
             model="gpt-3.5-turbo",
-            provider=g4f.Provider.You, 
+            provider=g4f.Provider.You,
             messages=[{"role": "user", "content": prompt}],
         ).choices[0].message.content
 
-    elif ai_model in ["gpt3.5-turbo", "gpt4"]:
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        g4f = providers.get("g4f")
+        if self.client is None:
+            self.client = g4f.client.Client()
+        for chunk in self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            provider=g4f.Provider.You,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        ):
+            yield chunk.choices[0].delta.content or ""
 
-        model_name = "gpt-3.5-turbo" if ai_model == "gpt3.5-turbo" else "gpt-4-1106-preview"
 
-        response = openai.chat.completions.create(
+class OpenAIClient:
+    """An OpenAI chat model."""
 
-            model=model_name,
+    def __init__(self, model: str):
+        self.model = model
 
+    def complete(self, prompt: str, timeout: float) -> str:
+        return providers.get("openai").chat.completions.create(
+            model=self.model,
             messages=[{"role": "user", "content": prompt}],
-
+            timeout=timeout,
         ).choices[0].message.content
-    elif ai_model == 'gemmini':
-        model = genai.GenerativeModel('gemini-pro')
-        response_model = model.generate_content(prompt)
-        response = response_model.text
 
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        for chunk in providers.get("openai").chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=timeout,
+            stream=True,
+        ):
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+
+
+class GeminiClient:
+    """Google's Gemini Pro."""
+
+    def __init__(self):
+        self.model = None
+
+    def complete(self, prompt: str, timeout: float) -> str:
+        if self.model is None:
+            self.model = providers.get("genai").GenerativeModel('gemini-pro')
+        return self.model.generate_content(prompt).text
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        if self.model is None:
+            self.model = providers.get("genai").GenerativeModel('gemini-pro')
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, and `burst` at once."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Takes a token, waiting for one at most `timeout` seconds.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: Whether a token was taken.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                missing = (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+            if now + missing > deadline:
+                return False
+            time.sleep(missing)
+
+
+class PooledModel:
+    """
+    A model of the pool: its client, rate limit, concurrency cap, timeout
+    and stats. The client is anything with a
+    `complete(prompt, timeout) -> str` method, so fake local models can
+    stand in for the real ones.
+    """
+
+    def __init__(self, name: str, client, rate_per_minute: float = LLM_RATE_PER_MINUTE, burst: int = LLM_BURST,
+                 concurrency: int = LLM_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+        self.name = name
+        self.client = client
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.saturated = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Reserves a slot and a token to start a request.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: Whether the request may start, release() must follow if so.
+        """
+        started = time.monotonic()
+        if not self.slots.acquire(timeout=timeout):
+            self.saturated += 1
+            return False
+        if not self.bucket.acquire(max(timeout - (time.monotonic() - started), 0)):
+            self.slots.release()
+            self.saturated += 1
+            return False
+
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        return True
+
+    def release(self, latency: float, error: bool = False) -> None:
+        """
+        Frees the slot of a finished request and records how it went.
+
+        Args:
+            latency (float): Seconds the request took.
+            error (bool): Whether it failed.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+            else:
+                self.latencies.append(latency)
+        self.slots.release()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Streams a request, acquire() must have succeeded. Clients without a
+        `stream(prompt, timeout)` method answer in a single chunk.
+
+        Args:
+            prompt (str): The prompt.
+
+        Yields:
+            str: The chunks of the response.
+        """
+        started = time.monotonic()
+        error = False
+        try:
+            if hasattr(self.client, "stream"):
+                yield from self.client.stream(prompt, self.timeout)
+            else:
+                yield self.client.complete(prompt, self.timeout)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.release(time.monotonic() - started, error=error)
+
+    def call(self, prompt: str) -> str:
+        """
+        Runs a request, acquire() must have succeeded.
+
+        Args:
+            prompt (str): The prompt.
+
+        Returns:
+            str: The response.
+        """
+        started = time.monotonic()
+        try:
+            response = self.client.complete(prompt, self.timeout)
+            if not response or not response.strip():
+                raise LLMUnavailable(f"{self.name} returned an empty response")
+        except Exception:
+            self.release(time.monotonic() - started, error=True)
+            raise
+        self.release(time.monotonic() - started)
+        return response
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Request, error and timeout counts, and latency percentiles in seconds.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(share: float) -> float:
+            return round(latencies[min(int(len(latencies) * share), len(latencies) - 1)], 3) if latencies else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "saturated": self.saturated,
+            "inFlight": self.in_flight,
+            "concurrency": self.concurrency,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+        }
+
+
+class LLMPool:
+    """
+    Long-lived clients of every model. A prompt goes to the selected
+    model first; when it fails, times out or is saturated the fallbacks are
+    tried in order, and a request which is slower than `hedge_after` is
+    raced against the next model. The first answer wins, requests which
+    lost are left to finish in the background.
+    """
+
+    def __init__(self, models: Dict[str, PooledModel], fallbacks: List[str] = LLM_FALLBACKS, retries: int = LLM_RETRIES,
+                 hedge_after: float = LLM_HEDGE_SECONDS, queue_seconds: float = LLM_QUEUE_SECONDS, max_workers: int = 16):
+        self.models = models
+        self.fallbacks = fallbacks
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.queue_seconds = queue_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    def chain(self, ai_model: str) -> List[PooledModel]:
+        """
+        Args:
+            ai_model (str): The selected model.
+
+        Returns:
+            List[PooledModel]: The models to try, in order.
+        """
+        if ai_model not in self.models:
+            raise ValueError("Invalid AI model selected.")
+        names = [ai_model] + [name for name in self.fallbacks if name != ai_model and name in self.models]
+        return [self.models[name] for name in names] * (self.retries + 1)
+
+    def complete(self, prompt: str, ai_model: str) -> str:
+        """
+        Args:
+            prompt (str): The prompt.
+            ai_model (str): The selected model.
+
+        Returns:
+            str: The first answer of any model of the chain.
+        """
+        candidates = self.chain(ai_model)
+        pending = {}
+        errors = []
+
+        while True:
+            # Start the next model when nothing runs, or hedge a slow request
+            now = time.monotonic()
+            latest = max((started for _, started in pending.values()), default=None)
+            if candidates and (latest is None or (self.hedge_after and now - latest >= self.hedge_after)):
+                model = candidates.pop(0)
+                # The last resort waits as long as it takes to get a slot
+                if model.acquire(self.queue_seconds if candidates or pending else model.timeout):
+                    pending[self.executor.submit(model.call, prompt)] = (model, time.monotonic())
+                else:
+                    errors.append(f"{model.name}: saturated")
+                continue
+
+            if not pending:
+                raise LLMUnavailable("No model could answer: " + "; ".join(errors))
+
+            # Wake up for the first answer, the next hedge or the first timeout
+            deadlines = [started + model.timeout for model, started in pending.values()]
+            if candidates and self.hedge_after:
+                deadlines.append(latest + self.hedge_after)
+            done, _ = wait(list(pending), timeout=max(min(deadlines) - now, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                model, _ = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    errors.append(f"{model.name}: {e}")
+                    print(colored(f"[-] {model.name} failed: {e}", "red"))
+
+            now = time.monotonic()
+            for future, (model, started) in list(pending.items()):
+                if now - started >= model.timeout:
+                    # The call can't be interrupted, its slot frees up once it returns
+                    del pending[future]
+                    model.timeouts += 1
+                    errors.append(f"{model.name}: timed out after {model.timeout:g}s")
+                    print(colored(f"[-] {model.name} timed out after {model.timeout:g}s", "red"))
+
+    def stream(self, prompt: str, ai_model: str) -> Iterator[str]:
+        """
+        Streams the answer of the first model of the chain which starts
+        answering. Once a model has answered the first chunk there is no
+        failing over any more, its errors are raised.
+
+        Args:
+            prompt (str): The prompt.
+            ai_model (str): The selected model.
+
+        Yields:
+            str: The chunks of the answer.
+        """
+        candidates = self.chain(ai_model)
+        errors = []
+
+        while candidates:
+            model = candidates.pop(0)
+            if not model.acquire(self.queue_seconds if candidates else model.timeout):
+                errors.append(f"{model.name}: saturated")
+                continue
+
+            chunks = model.stream(prompt)
+            try:
+                # Skip chunks without text, e.g. the role announcement
+                first = ""
+                while not first.strip():
+                    first += next(chunks)
+            except StopIteration:
+                errors.append(f"{model.name}: returned an empty response")
+                continue
+            except Exception as e:
+                chunks.close()
+                errors.append(f"{model.name}: {e}")
+                print(colored(f"[-] {model.name} failed: {e}", "red"))
+                continue
+
+            try:
+                yield first
+                yield from chunks
+            finally:
+                chunks.close()
+            return
+
+        raise LLMUnavailable("No model could answer: " + "; ".join(errors))
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: The stats of every model, see PooledModel.stats().
+        """
+        return {name: model.stats() for name, model in self.models.items()}
+
+
+def _pooled(name: str, client) -> PooledModel:
+    limits = LLM_LIMITS.get(name, {})
+    return PooledModel(
+        name,
+        client,
+        rate_per_minute=limits.get("ratePerMinute", LLM_RATE_PER_MINUTE),
+        burst=limits.get("burst", LLM_BURST),
+        concurrency=limits.get("concurrency", LLM_CONCURRENCY),
+        timeout=limits.get("timeout", LLM_TIMEOUT),
+    )
+
+
+# The pool shared by every generation, keyed by the names the frontend selects
+POOL = LLMPool({
+    "g4f": _pooled("g4f", G4FClient()),
+    "gpt3.5-turbo": _pooled("gpt3.5-turbo", OpenAIClient("gpt-3.5-turbo")),
+    "gpt4": _pooled("gpt4", OpenAIClient("gpt-4-1106-preview")),
+    "gemmini": _pooled("gemmini", GeminiClient()),
+})
+
+
+def generate_response(prompt: str, ai_model: str) -> str:
+    """
+    Generate a response to a prompt, see LLMPool.complete().
+
+    Args:
+        prompt (str): The prompt.
+        ai_model (str): The AI model to use for generation.
+
+    Returns:
+        str: The response from the AI model.
+    """
+    return POOL.complete(prompt, ai_model)
+
+def _script_prompt(video_subject: str, paragraph_number: int, voice: str, customPrompt: str) -> str:
+    # Build prompt
+    if customPrompt:
+        prompt = customPrompt
     else:
+        prompt = """
+            Generate a script for a video, depending on the subject of the video.
+            The script is to be returned as a string with the specified number of paragraphs.
+            Do not under any circumstance reference this prompt in your response.
+            Get straight to the point, don't start with unnecessary things like, "welcome to this video".
+            YOU MUST NOT INCLUDE ANY TYPE OF MARKDOWN OR FORMATTING IN THE SCRIPT, NEVER USE A TITLE.
+            YOU MUST WRITE THE SCRIPT IN THE LANGUAGE SPECIFIED IN [LANGUAGE].
+            ONLY RETURN THE RAW CONTENT OF THE SCRIPT.
+        """
+
+    prompt += f"""
+    Subject: {video_subject}
+    Number of paragraphs: {paragraph_number}
+    Language: {voice}
+    """
+    return prompt
+
+
+def _clean_script(response: str) -> List[str]:
+    # Clean the script
+    response = response.replace("*", "").replace("#", "")
+    response = re.sub(r"\[.*\]", "", response)
+    response = re.sub(r"\(.*\)", "", response)
 
-        raise ValueError("Invalid AI model selected.")
+    # Split into paragraphs, all of them, the caller keeps the ones it needs
+    return response.split("\n\n")
+
+
+def split_sentences(script: str) -> List[str]:
+    """
+    Args:
+        script (str): The script of a video.
+
+    Returns:
+        List[str]: The sentences spoken one by one.
+    """
+    return [sentence for sentence in script.split(". ") if sentence != ""]
 
-    return response
 
 def generate_script(video_subject: str, paragraph_number: int, ai_model: str, voice: str, customPrompt: str) -> str:
     """
     Generate a script for a video.
     """
     try:
-        # Build prompt
-        if customPrompt:
-            prompt = customPrompt
-        else:
-            prompt = """
-                Generate a script for a video, depending on the subject of the video.
-                The script is to be returned as a string with the specified number of paragraphs.
-                Do not under any circumstance reference this prompt in your response.
-                Get straight to the point, don't start with unnecessary things like, "welcome to this video".
-                YOU MUST NOT INCLUDE ANY TYPE OF MARKDOWN OR FORMATTING IN THE SCRIPT, NEVER USE A TITLE.
-                YOU MUST WRITE THE SCRIPT IN THE LANGUAGE SPECIFIED IN [LANGUAGE].
-                ONLY RETURN THE RAW CONTENT OF THE SCRIPT.
-            """
-
-        prompt += f"""
-        Subject: {video_subject}
-        Number of paragraphs: {paragraph_number}
-        Language: {voice}
-        """
+        prompt = _script_prompt(video_subject, paragraph_number, voice, customPrompt)
 
         # Generate script
         response = generate_response(prompt, ai_model)
@@ -98,19 +522,82 @@ def generate_script(video_subject: str, paragraph_number: int, ai_model: str, vo
             print(colored("[-] GPT returned an empty response.", "red"))
             return "Error generating script. Please try again."
 
-        # Clean the script
-        response = response.replace("*", "").replace("#", "")
-        response = re.sub(r"\[.*\]", "", response)
-        response = re.sub(r"\(.*\)", "", response)
-
         # Split and join paragraphs
-        paragraphs = response.split("\n\n")
-        selected_paragraphs = paragraphs[:paragraph_number]
+        selected_paragraphs = _clean_script(response)[:paragraph_number]
+        final_script = "\n\n".join(selected_paragraphs)
+
+        if not final_script.strip():
+            return "Error generating script. Please try again."
+
+        print(colored(f"Number of paragraphs used: {len(selected_paragraphs)}", "green"))
+        return final_script
+
+    except Exception as e:
+        print(colored(f"[-] Error generating script: {str(e)}", "red"))
+        return "Error generating script. Please try again."
+
+
+def stream_script(video_subject: str, paragraph_number: int, ai_model: str, voice: str, customPrompt: str,
+                  on_sentence: Callable[[str], None]) -> str:
+    """
+    Generate a script for a video like generate_script(), streaming it
+    from the model. Every sentence is handed to `on_sentence` as soon as
+    it is complete, so it can be spoken while the rest is generated. The
+    sentences are the ones split_sentences() returns for the script.
+
+    Args:
+        video_subject (str): The subject of the video.
+        paragraph_number (int): The amount of paragraphs.
+        ai_model (str): The AI model to use for generation.
+        voice (str): The voice, names the language of the script.
+        customPrompt (str): A prompt replacing the default one.
+        on_sentence (Callable): Called with every sentence, in order.
+
+    Returns:
+        str: The script, or an error message starting with "Error".
+    """
+    try:
+        prompt = _script_prompt(video_subject, paragraph_number, voice, customPrompt)
+
+        response = ""
+        emitted = 0
+
+        def emit(script: str, final: bool = False) -> None:
+            nonlocal emitted
+            # The last piece may still grow, unless the script is complete
+            pieces = script.split(". ")
+            pieces = pieces if final else pieces[:-1]
+            for sentence in pieces[emitted:]:
+                if sentence != "":
+                    on_sentence(sentence)
+            emitted = max(emitted, len(pieces))
+
+        chunks = POOL.stream(prompt, ai_model)
+        try:
+            for chunk in chunks:
+                response += chunk
+
+                # Cleaning can't change ended lines, nor the current one before its first bracket
+                line = response.rfind("\n") + 1
+                brackets = [index for index in (response.find("[", line), response.find("(", line)) if index != -1]
+                stable = response[:min(brackets)] if brackets else response
+
+                paragraphs = _clean_script(stable)
+                emit("\n\n".join(paragraphs[:paragraph_number]))
+
+                # Paragraphs past the requested number are cut anyway
+                if len(paragraphs) > paragraph_number:
+                    break
+        finally:
+            chunks.close()
+
+        selected_paragraphs = _clean_script(response)[:paragraph_number]
         final_script = "\n\n".join(selected_paragraphs)
 
         if not final_script.strip():
             return "Error generating script. Please try again."
 
+        emit(final_script, final=True)
         print(colored(f"Number of paragraphs used: {len(selected_paragraphs)}", "green"))
         return final_script
 
@@ -158,8 +645,25 @@ def get_search_terms(video_subject: str, amount: int, script: str, ai_model: str
     {script}
     """
 
+    if KEYWORD_EXTRACTION == "local":
+        search_terms = local_search_terms(video_subject, amount, script)
+        print(colored(f"\nExtracted {len(search_terms)} search terms: {', '.join(search_terms)}", "cyan"))
+        return search_terms
+
+    def fallback() -> List[str]:
+        if KEYWORD_EXTRACTION == "fallback":
+            print(colored("[*] Extracting search terms from the script instead.", "yellow"))
+            return local_search_terms(video_subject, amount, script)
+        return [video_subject]  # Fallback to using the video subject as a search term
+
     # Generate search terms
-    response = generate_response(prompt, ai_model)
+    try:
+        response = generate_response(prompt, ai_model)
+    except Exception as e:
+        if KEYWORD_EXTRACTION != "fallback":
+            raise
+        print(colored(f"[-] Could not generate search terms: {e}", "red"))
+        response = ""
     print(response)
 
     # Parse response into a list of search terms
@@ -184,14 +688,14 @@ def get_search_terms(video_subject: str, amount: int, script: str, ai_model: str
                     search_terms = json.loads(match.group())
                 except json.JSONDecodeError:
                     print(colored("[-] Could not parse response.", "red"))
-                    search_terms = [video_subject]  # Fallback to using the video subject as a search term
+                    search_terms = fallback()
             else:
                 print(colored("[-] Could not find valid JSON array in response.", "red"))
-                search_terms = [video_subject]  # Fallback to using the video subject as a search term
+                search_terms = fallback()
                 
         except Exception as e:
             print(colored(f"[-] Error processing response: {str(e)}", "red"))
-            search_terms = [video_subject]  # Fallback to using the video subject as a search term
+            search_terms = fallback()
 
     # Let user know
     print(colored(f"\nGenerated {len(search_terms)} search terms: {', '.join(search_terms)}", "cyan"))
@@ -232,6 +736,9 @@ def generate_metadata(video_subject: str, script: str, ai_model: str) -> Tuple[s
     description = generate_response(description_prompt, ai_model).strip()  
   
     # Generate keywords  
-    keywords = get_search_terms(video_subject, 6, script, ai_model)  
+    if KEYWORD_EXTRACTION == "local":
+        keywords = local_tags(video_subject, script, 6)
+    else:
+        keywords = get_search_terms(video_subject, 6, script, ai_model)  
 
     return title, description, keywords  
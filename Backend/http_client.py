@@ -0,0 +1,181 @@
+import os
+import shutil
+import threading
+import requests
+
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterable, List
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Seconds to wait for a connection, and for data once connected
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+
+# Keep-alive connections kept open per host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+# Requests in flight per host at once
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", 4))
+
+# Threads running concurrent requests
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", 16))
+
+# Retries of idempotent requests on connection errors and 502/503/504
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+
+_SESSION = None
+_EXECUTOR = None
+_HOST_LIMITS: Dict[str, threading.BoundedSemaphore] = {}
+_LOCK = threading.Lock()
+
+
+def session() -> requests.Session:
+    """
+    Returns the shared session. It keeps a pool of keep-alive connections
+    per host, so consecutive requests skip the TCP and TLS handshake.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _SESSION
+
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=[502, 503, 504],
+                    allowed_methods=["GET", "HEAD"],
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=32, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+                new_session = requests.Session()
+                new_session.mount("http://", adapter)
+                new_session.mount("https://", adapter)
+                _SESSION = new_session
+
+    return _SESSION
+
+
+def _host_limit(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _LOCK:
+        if host not in _HOST_LIMITS:
+            _HOST_LIMITS[host] = threading.BoundedSemaphore(HTTP_HOST_CONCURRENCY)
+        return _HOST_LIMITS[host]
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Sends a request through the shared session, with default timeouts and
+    at most HTTP_HOST_CONCURRENCY requests in flight per host.
+
+    The per host slot is released once the response headers are in, so
+    streamed bodies should be read with download() instead.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        **kwargs: Passed on to requests.
+
+    Returns:
+        requests.Response: The response.
+    """
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    with _host_limit(url):
+        return session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Sends a GET request, see request()."""
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """Sends a POST request, see request()."""
+    return request("POST", url, **kwargs)
+
+
+def download(url: str, path: str, chunk_size: int = 1024 * 1024, on_progress: Callable[[int, int], None] = None, **kwargs) -> int:
+    """
+    Streams a response body to a file, without holding it in memory.
+
+    Args:
+        url (str): The URL.
+        path (str): The file to write to.
+        chunk_size (int): Bytes copied at once.
+        on_progress (Callable): Called with the bytes written so far and
+            the total size (0 if the server doesn't tell) after every chunk.
+        **kwargs: Passed on to requests.
+
+    Returns:
+        int: The amount of bytes written.
+    """
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    with _host_limit(url):
+        with session().get(url, stream=True, **kwargs) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(path, "wb") as file:
+                if on_progress is None:
+                    shutil.copyfileobj(response.raw, file, length=chunk_size)
+                else:
+                    total = int(response.headers.get("Content-Length") or 0)
+                    written = 0
+                    for chunk in iter(lambda: response.raw.read(chunk_size), b""):
+                        file.write(chunk)
+                        written += len(chunk)
+                        on_progress(written, total)
+
+    return os.path.getsize(path)
+
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    """
+    Runs a function on the shared request threads.
+
+    Args:
+        fn (Callable): The function, usually one making requests.
+
+    Returns:
+        Future: The future of the call.
+    """
+    global _EXECUTOR
+
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix="http")
+
+    return _EXECUTOR.submit(fn, *args, **kwargs)
+
+
+def map_concurrent(fn: Callable, items: Iterable, return_exceptions: bool = False) -> List:
+    """
+    Calls a function for every item concurrently, the per host limits
+    still apply.
+
+    Args:
+        fn (Callable): The function.
+        items (Iterable): The items.
+        return_exceptions (bool): Return exceptions in place of results
+            instead of raising the first one.
+
+    Returns:
+        List: The results, in the order of the items.
+    """
+    futures = [submit(fn, item) for item in items]
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
@@ -0,0 +1,229 @@
+import os
+import time
+import shutil
+import threading
+
+from typing import Callable, List
+from termcolor import colored
+from artifacts import ARTIFACT_STORE_DIR
+
+# Directories the janitor looks after
+TEMP_DIR = "../temp"
+SUBTITLES_DIR = "../subtitles"
+FINAL_VIDEOS_DIR = "../final_videos"
+
+# Seconds between two janitor runs
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL", 300))
+
+# Disk budget for all of the above directories and the artifact store in MB, 0 disables the budget
+JANITOR_DISK_BUDGET_MB = int(os.getenv("JANITOR_DISK_BUDGET_MB", 0))
+
+# Hours after which job workspaces (temp, subtitles) expire
+JANITOR_TEMP_RETENTION_HOURS = float(os.getenv("JANITOR_TEMP_RETENTION_HOURS", 24))
+
+# Hours after which artifacts of distributed stage tasks expire
+JANITOR_ARTIFACT_RETENTION_HOURS = float(os.getenv("JANITOR_ARTIFACT_RETENTION_HOURS", 24))
+
+# Hours after which final videos expire, 0 keeps them until the budget is exceeded
+JANITOR_FINAL_RETENTION_HOURS = float(os.getenv("JANITOR_FINAL_RETENTION_HOURS", 0))
+
+# Entries modified more recently than this are never touched, in seconds
+JANITOR_MIN_AGE = int(os.getenv("JANITOR_MIN_AGE", 600))
+
+# Report of the last run, served by the API
+LAST_REPORT = {}
+
+
+def _size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def _mtime(path: str) -> float:
+    # A workspace counts as used as long as anything inside it changes
+    latest = os.path.getmtime(path)
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for file in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, file)))
+                except OSError:
+                    pass
+    return latest
+
+
+def scan() -> List[dict]:
+    """
+    Lists everything the janitor may remove, grouped by job.
+
+    Every directory inside temp/subtitles is a job workspace, loose files
+    there are intermediates. Final videos are grouped by generation ID, so
+    a video is removed together with its script and metadata. Every
+    object of the artifact store is an entry of its own.
+
+    Returns:
+        List[dict]: The entries, oldest first.
+    """
+    entries = {}
+
+    for directory, kind in [(TEMP_DIR, "temp"), (SUBTITLES_DIR, "temp"), (FINAL_VIDEOS_DIR, "final")]:
+        if not os.path.isdir(directory):
+            continue
+
+        for name in os.listdir(directory):
+            # Hidden files are indexes, not job outputs
+            if name.startswith("."):
+                continue
+
+            path = os.path.join(directory, name)
+            job_id = name.split(".")[0]
+            key = (kind, directory, job_id)
+
+            try:
+                entry = entries.setdefault(key, {
+                    "kind": kind,
+                    "jobId": job_id,
+                    "paths": [],
+                    "bytes": 0,
+                    "mtime": 0,
+                })
+                entry["paths"].append(path)
+                entry["bytes"] += _size(path)
+                entry["mtime"] = max(entry["mtime"], _mtime(path))
+            except OSError:
+                # Removed while scanning
+                pass
+
+    # Objects are kept as <store>/<first two characters of the key>/<key>
+    if os.path.isdir(ARTIFACT_STORE_DIR):
+        for shard in os.listdir(ARTIFACT_STORE_DIR):
+            shard_path = os.path.join(ARTIFACT_STORE_DIR, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                path = os.path.join(shard_path, name)
+                try:
+                    entries[("artifact", shard_path, name)] = {
+                        "kind": "artifact",
+                        "jobId": name,
+                        "paths": [path],
+                        "bytes": _size(path),
+                        "mtime": _mtime(path),
+                    }
+                except OSError:
+                    # Removed while scanning
+                    pass
+
+    return sorted(entries.values(), key=lambda entry: entry["mtime"])
+
+
+def _remove(entry: dict) -> int:
+    reclaimed = 0
+    for path in entry["paths"]:
+        try:
+            size = _size(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            reclaimed += size
+        except OSError as e:
+            print(colored(f"[-] Janitor could not remove {path}: {e}", "red"))
+    return reclaimed
+
+
+def run(is_active: Callable[[str], bool] = lambda job_id: False) -> dict:
+    """
+    Removes expired job workspaces, artifacts and final videos, then evicts the
+    oldest entries until the disk budget is met. Entries of active jobs
+    and entries which changed recently are never touched.
+
+    Args:
+        is_active (Callable): Tells whether a job ID belongs to an active job.
+
+    Returns:
+        dict: The report of the run.
+    """
+    now = time.time()
+    scanned = scan()
+    used = sum(entry["bytes"] for entry in scanned)
+    entries = [
+        entry for entry in scanned
+        if not is_active(entry["jobId"]) and now - entry["mtime"] >= JANITOR_MIN_AGE
+    ]
+    removed = []
+
+    # Expired entries first
+    retention = {
+        "temp": JANITOR_TEMP_RETENTION_HOURS * 3600,
+        "artifact": JANITOR_ARTIFACT_RETENTION_HOURS * 3600,
+        "final": JANITOR_FINAL_RETENTION_HOURS * 3600,
+    }
+    for entry in list(entries):
+        if retention[entry["kind"]] and now - entry["mtime"] >= retention[entry["kind"]]:
+            entry["reclaimed"] = _remove(entry)
+            removed.append(entry)
+            entries.remove(entry)
+
+    # Then oldest first until we're within budget, intermediates before final videos
+    budget = JANITOR_DISK_BUDGET_MB * 1024 * 1024
+    remaining = used - sum(entry["reclaimed"] for entry in removed)
+    if budget and remaining > budget:
+        for entry in sorted(entries, key=lambda entry: (entry["kind"] == "final", entry["mtime"])):
+            if remaining <= budget:
+                break
+            entry["reclaimed"] = _remove(entry)
+            remaining -= entry["reclaimed"]
+            removed.append(entry)
+
+    reclaimed = sum(entry["reclaimed"] for entry in removed)
+    report = {
+        "finishedAt": now,
+        "usedBytes": remaining,
+        "budgetBytes": budget or None,
+        "removed": [{"jobId": entry["jobId"], "kind": entry["kind"], "bytes": entry["reclaimed"]} for entry in removed],
+        "reclaimedBytes": reclaimed,
+    }
+    LAST_REPORT.clear()
+    LAST_REPORT.update(report)
+
+    if removed:
+        print(colored(f"[+] Janitor removed {len(removed)} entries and reclaimed {reclaimed / 1024 / 1024:.1f} MB", "green"))
+
+    return report
+
+
+def start(is_active: Callable[[str], bool]) -> threading.Thread:
+    """
+    Runs the janitor every JANITOR_INTERVAL seconds in a background thread.
+    Does nothing if JANITOR_INTERVAL is 0.
+
+    Args:
+        is_active (Callable): Tells whether a job ID belongs to an active job.
+
+    Returns:
+        threading.Thread: The janitor thread.
+    """
+    def loop():
+        while True:
+            try:
+                run(is_active)
+            except Exception as e:
+                print(colored(f"[-] Janitor run failed: {e}", "red"))
+            time.sleep(JANITOR_INTERVAL)
+
+    if not JANITOR_INTERVAL:
+        return None
+
+    thread = threading.Thread(target=loop, name="janitor", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from typing import Dict, List, Tuple
+
+# Directory holding the workspace of every job
+JOBS_DIR = "../temp"
+
+# The stages of a generation, in the order they run
+STAGES = ["script", "search_terms", "clips", "voice", "subtitles", "combine", "render", "metadata", "music", "upload"]
+
+
+class JobManifest:
+    """
+    Records the request of a job and the output of every completed stage
+    in ../temp/<id>/manifest.json, so a failed or interrupted job can be
+    resumed from its last completed stage.
+    """
+
+    def __init__(self, generation_id: str, request: dict = None, stages: dict = None, created: float = None):
+        self.generation_id = generation_id
+        self.request = request or {}
+        self.stages = stages or {}
+        self.created = created or time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return manifest_path(self.generation_id)
+
+    def done(self, stage: str) -> bool:
+        """
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            bool: Whether the stage has completed.
+        """
+        return stage in self.stages
+
+    def output(self, stage: str) -> dict:
+        """
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            dict: The recorded output of the stage, or None if it hasn't completed.
+        """
+        return self.stages.get(stage, {}).get("output")
+
+    def complete(self, stage: str, **output) -> None:
+        """
+        Records the output of a stage and saves the manifest.
+
+        Args:
+            stage (str): The name of the stage.
+            **output: The output of the stage, must be JSON serializable.
+
+        Returns:
+            None
+        """
+        self.stages[stage] = {"completedAt": time.time(), "output": output}
+        self.save()
+
+    def invalidate(self, stage: str) -> None:
+        """
+        Forgets a stage and every stage after it.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            None
+        """
+        for later in STAGES[STAGES.index(stage):]:
+            self.stages.pop(later, None)
+        self.save()
+
+    def verify(self, stage: str, paths: List[str]) -> bool:
+        """
+        Checks that the files a completed stage produced still exist,
+        invalidating the stage (and every later one) if they don't.
+
+        Args:
+            stage (str): The name of the stage.
+            paths (List[str]): The files the stage produced.
+
+        Returns:
+            bool: Whether the stage is still complete.
+        """
+        if not self.done(stage):
+            return False
+        if all(path and os.path.exists(path) for path in paths):
+            return True
+        self.invalidate(stage)
+        return False
+
+    def last_stage(self) -> str:
+        """
+        Returns:
+            str: The last completed stage, or None.
+        """
+        completed = [stage for stage in STAGES if stage in self.stages]
+        return completed[-1] if completed else None
+
+    def save(self) -> None:
+        """
+        Writes the manifest to disk atomically.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({
+                    "generationId": self.generation_id,
+                    "created": self.created,
+                    "request": self.request,
+                    "stages": self.stages,
+                }, file, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+def manifest_path(generation_id: str) -> str:
+    """
+    Args:
+        generation_id (str): The ID of the generation.
+
+    Returns:
+        str: The path of the manifest of a generation.
+    """
+    return os.path.join(JOBS_DIR, generation_id, "manifest.json")
+
+
+def load_manifest(generation_id: str) -> JobManifest:
+    """
+    Loads the manifest of a generation.
+
+    Args:
+        generation_id (str): The ID of the generation.
+
+    Returns:
+        JobManifest: The manifest, or None if the job has no manifest.
+    """
+    if os.path.basename(generation_id) != generation_id:
+        return None
+
+    path = manifest_path(generation_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    return JobManifest(data["generationId"], data["request"], data["stages"], data["created"])
+
+
+# Request fields which decide what a generation produces
+FINGERPRINT_FIELDS = {
+    "videoSubject": "",
+    "aiModel": "",
+    "customPrompt": "",
+    "voice": "en_us_001",
+    "paragraphNumber": 1,
+    "subtitlesPosition": "",
+    "color": "#FFFF00",
+    "useMusic": False,
+    "zipUrl": "",
+    "automateYoutubeUpload": False,
+    "youtubeChannel": "",
+    "progressive": "",
+}
+
+# Fingerprint fields whose letter case matters, e.g. YouTube channel IDs
+CASE_SENSITIVE_FIELDS = ("customPrompt", "youtubeChannel")
+
+# Index of completed generations by fingerprint
+ARTIFACT_INDEX_PATH = "../final_videos/.index.json"
+
+# Seconds a completed generation may be handed out again for an identical request, 0 disables
+REUSE_COMPLETED_SECONDS = int(os.getenv("REUSE_COMPLETED_SECONDS", 0))
+
+_INDEX_LOCK = threading.Lock()
+
+
+def flag(value) -> bool:
+    """
+    Args:
+        value: A boolean field of a request, JSON booleans or strings like "false".
+
+    Returns:
+        bool: Whether the field is set.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "on")
+    return bool(value)
+
+
+def fingerprint(data: dict) -> str:
+    """
+    Computes a canonical fingerprint of a generation request. Requests
+    that only differ in whitespace, letter case or omitted defaults get
+    the same fingerprint.
+
+    Args:
+        data (dict): The request.
+
+    Returns:
+        str: The fingerprint.
+    """
+    canonical = {}
+    for field, default in FINGERPRINT_FIELDS.items():
+        value = data.get(field)
+        if value is None or value == "":
+            value = default
+        if isinstance(default, bool):
+            value = flag(value)
+        elif isinstance(default, int):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                # Invalid numbers fail the generation later, they only need a stable fingerprint
+                value = " ".join(str(value).split())
+        else:
+            value = " ".join(str(value).split())
+            if field not in CASE_SENSITIVE_FIELDS:
+                value = value.lower()
+        canonical[field] = value
+
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+class Flight:
+    """A generation which identical requests can attach to."""
+
+    def __init__(self, generation_id: str):
+        self.generation_id = generation_id
+        self.result = None
+        self._done = threading.Event()
+
+    def wait(self) -> dict:
+        """
+        Waits for the generation to finish.
+
+        Returns:
+            dict: The result of the generation.
+        """
+        self._done.wait()
+        return self.result
+
+
+class SingleFlight:
+    """
+    Makes sure only one generation runs per fingerprint. Identical
+    requests arriving while it runs attach to it instead of starting
+    another render.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str, generation_id: str) -> Tuple[Flight, bool]:
+        """
+        Joins the generation in flight for a fingerprint, or starts one.
+
+        Args:
+            key (str): The fingerprint of the request.
+            generation_id (str): The ID to use if a new generation starts.
+
+        Returns:
+            Tuple[Flight, bool]: The flight, and whether the caller leads it.
+        """
+        with self._lock:
+            if key in self._flights:
+                return self._flights[key], False
+            flight = Flight(generation_id)
+            self._flights[key] = flight
+            return flight, True
+
+    def finish(self, key: str, result: dict) -> None:
+        """
+        Hands the result of a generation to everyone attached to it.
+
+        Args:
+            key (str): The fingerprint of the request.
+            result (dict): The result of the generation.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.result = result
+            flight._done.set()
+
+
+def _load_artifact_index() -> dict:
+    if not os.path.exists(ARTIFACT_INDEX_PATH):
+        return {}
+    try:
+        with open(ARTIFACT_INDEX_PATH, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except ValueError:
+        return {}
+
+
+def record_completed(key: str, generation_id: str) -> None:
+    """
+    Adds a completed generation to the artifact index.
+
+    Args:
+        key (str): The fingerprint of the request.
+        generation_id (str): The ID of the generation.
+
+    Returns:
+        None
+    """
+    with _INDEX_LOCK:
+        index = _load_artifact_index()
+        index[key] = {"generationId": generation_id, "completedAt": time.time()}
+
+        # Forget entries which can't be reused anymore
+        if REUSE_COMPLETED_SECONDS:
+            index = {k: v for k, v in index.items() if time.time() - v["completedAt"] < REUSE_COMPLETED_SECONDS}
+
+        os.makedirs(os.path.dirname(ARTIFACT_INDEX_PATH), exist_ok=True)
+        with open(ARTIFACT_INDEX_PATH + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(index, file)
+        os.replace(ARTIFACT_INDEX_PATH + ".tmp", ARTIFACT_INDEX_PATH)
+
+
+def find_completed(key: str) -> str:
+    """
+    Looks up a recent completed generation for a fingerprint.
+
+    Args:
+        key (str): The fingerprint of the request.
+
+    Returns:
+        str: The ID of the generation, or None if there's none to reuse.
+    """
+    if not REUSE_COMPLETED_SECONDS:
+        return None
+
+    entry = _load_artifact_index().get(key)
+    if entry is None or time.time() - entry["completedAt"] >= REUSE_COMPLETED_SECONDS:
+        return None
+    return entry["generationId"]
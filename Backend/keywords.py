@@ -0,0 +1,187 @@
+import re
+import math
+
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+# Words carrying no meaning of their own, phrases are split at them
+STOPWORDS = frozenset("""
+a about above across after again against all almost alone along already also although always am among an and
+another any anybody anyone anything anywhere are aren't around as at away back be became because become becomes
+been before behind being below beside besides between beyond both but by can can't cannot could couldn't did
+didn't do does doesn't doing don't done down during each either else enough even ever every everybody everyone
+everything everywhere few first for from further get gets getting give given gives go goes going gone got had
+hadn't has hasn't have haven't having he he'd he'll he's her here here's hers herself him himself his how how's
+however i i'd i'll i'm i've if in indeed instead into is isn't it it's its itself just keep kept know known last
+least less let let's like likely made make makes making many may maybe me might mine more most mostly much must
+mustn't my myself near nearly need needs neither never new next no nobody none nor not nothing now nowhere of off
+often oh on once one only onto or other others otherwise ought our ours ourselves out over own per perhaps put
+quite rather really right said same say says see seem seemed seems seen several shall shan't she she'd she'll
+she's should shouldn't since so some somebody someone something sometimes somewhere soon still such take takes
+than that that's the their theirs them themselves then there there's therefore these they they'd they'll they're
+they've thing things this those though through throughout thus to today together too took toward towards under
+until up upon us use used uses using very via want wants was wasn't way ways we we'd we'll we're we've well went
+were weren't what what's whatever when when's whenever where where's whether which while who who's whole whom
+whose why why's will with within without won't would wouldn't yet you you'd you'll you're you've your yours
+yourself yourselves
+video videos watch subscribe channel today let's lot lots kind sort bit
+zero two three four five six seven eight nine ten hundred thousand million billion
+""".split())
+
+# Longest search term in words, longer runs of content words are split
+MAX_PHRASE_WORDS = 3
+
+# Punctuation ending a phrase
+PHRASE_BREAKS = re.compile(r"[.!?,;:()\[\]\"“”\n\t–—-]+")
+
+# Words of a phrase, letters of any script, digits and inner apostrophes
+WORD = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+
+
+def _words(text: str) -> List[str]:
+    return [word.lower() for word in WORD.findall(text)]
+
+
+def _content(word: str) -> bool:
+    return word not in STOPWORDS and len(word) > 1 and not word.isdigit()
+
+
+def _stem(word: str) -> str:
+    # Enough to treat "cats" and "cat" as one term
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def candidates(text: str) -> List[tuple]:
+    """
+    Splits a text into candidate phrases: runs of up to MAX_PHRASE_WORDS
+    content words between stopwords and punctuation.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[tuple]: The phrases as tuples of lower case words, in order of appearance.
+    """
+    phrases = []
+    for fragment in PHRASE_BREAKS.split(text):
+        run = []
+        for word in _words(fragment) + [""]:
+            if word and _content(word):
+                run.append(word)
+                continue
+            for start in range(0, len(run), MAX_PHRASE_WORDS):
+                phrases.append(tuple(run[start:start + MAX_PHRASE_WORDS]))
+            run = []
+    return phrases
+
+
+def score_words(phrases: List[tuple], sentence_frequency: Dict[str, int]) -> Dict[str, float]:
+    """
+    Scores every word RAKE style, by its degree over its frequency (words
+    appearing in longer phrases score higher), weighted by how many
+    sentences of the script mention it.
+
+    Args:
+        phrases (List[tuple]): The candidate phrases.
+        sentence_frequency (Dict[str, int]): The amount of sentences mentioning every stemmed word.
+
+    Returns:
+        Dict[str, float]: The score of every stemmed word.
+    """
+    frequency = Counter()
+    degree = Counter()
+    for phrase in phrases:
+        for word in phrase:
+            frequency[_stem(word)] += 1
+            degree[_stem(word)] += len(phrase)
+
+    # A word the whole script keeps coming back to is what it is about
+    return {
+        word: degree[word] / frequency[word] * (1 + math.log(1 + sentence_frequency.get(word, 0)))
+        for word in frequency
+    }
+
+
+def extract(text: str, amount: int) -> List[str]:
+    """
+    Ranks the key phrases of a text, without calling a model.
+
+    Args:
+        text (str): The text, e.g. the script of a video.
+        amount (int): The maximum amount of phrases.
+
+    Returns:
+        List[str]: The phrases, best first.
+    """
+    sentences = [sentence for sentence in re.split(r"[.!?\n]+", text) if sentence.strip()]
+    sentence_frequency = Counter()
+    for sentence in sentences:
+        sentence_frequency.update({_stem(word) for word in _words(sentence) if _content(word)})
+
+    phrases = candidates(text)
+    scores = score_words(phrases, sentence_frequency)
+
+    # A phrase scores the sum of its words, and counts once per mention
+    phrase_scores = defaultdict(float)
+    surface = {}
+    for phrase in phrases:
+        key = tuple(sorted({_stem(word) for word in phrase}))
+        phrase_scores[key] += sum(scores[_stem(word)] for word in phrase)
+        surface.setdefault(key, " ".join(phrase))
+
+    ranked = sorted(phrase_scores, key=lambda key: (-phrase_scores[key], surface[key]))
+    return [surface[key] for key in ranked[:amount]]
+
+
+def search_terms(video_subject: str, amount: int, script: str) -> List[str]:
+    """
+    Picks stock video search terms from a script like get_search_terms()
+    does with a model: 1-3 words each, mentioning the subject.
+
+    Args:
+        video_subject (str): The subject of the video.
+        amount (int): The amount of search terms.
+        script (str): The script of the video.
+
+    Returns:
+        List[str]: The search terms, best first.
+    """
+    subject_words = [word for word in _words(video_subject) if _content(word)]
+    subject_stems = {_stem(word) for word in subject_words}
+
+    # The subject word the script talks about most names the subject shortly
+    counts = Counter(_stem(word) for word in _words(script))
+    subject = max(subject_words, key=lambda word: counts[_stem(word)], default=video_subject.strip().lower())
+
+    terms = []
+    for phrase in extract(script, amount * 3):
+        words = phrase.split()
+        if not subject_stems & {_stem(word) for word in words}:
+            words = [subject] + words[:MAX_PHRASE_WORDS - 1]
+        term = " ".join(words)
+        if term not in terms:
+            terms.append(term)
+        if len(terms) == amount:
+            break
+
+    if not terms:
+        terms = [video_subject]
+    return terms
+
+
+def tags(video_subject: str, script: str, amount: int = 6) -> List[str]:
+    """
+    Args:
+        video_subject (str): The subject of the video.
+        script (str): The script of the video.
+        amount (int): The amount of tags.
+
+    Returns:
+        List[str]: Keywords of the video for its metadata, the subject first.
+    """
+    subject = video_subject.strip().lower()
+    return [subject] + [phrase for phrase in extract(script, amount) if phrase != subject][:amount - 1]
@@ -0,0 +1,280 @@
+"""
+Speaks sentences with the TikTok TTS service, or with a local engine
+running in a pool of long-lived worker processes which keep their voice
+model loaded between jobs. A worker is started as
+
+    python local_tts.py <engine>
+
+and speaks batches of sentences it reads as JSON lines from stdin.
+"""
+import os
+import sys
+import json
+import math
+import queue
+import threading
+import subprocess
+
+from uuid import uuid4
+from typing import Callable, List
+from termcolor import colored
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+# The engine speaking the voice over: "tiktok" (the web service), "coqui" or "pyttsx3" (local)
+TTS_ENGINE = os.getenv("TTS_ENGINE", "tiktok")
+
+# Worker processes of a local engine, each keeps its own copy of the model in memory
+LOCAL_TTS_WORKERS = int(os.getenv("LOCAL_TTS_WORKERS", 0)) or max(1, (os.cpu_count() or 2) // 2)
+
+# Most sentences a worker is handed at once
+LOCAL_TTS_BATCH = int(os.getenv("LOCAL_TTS_BATCH", 8))
+
+# Seconds a worker may take per sentence, and once more to load its model after starting, before it is killed
+LOCAL_TTS_TIMEOUT = float(os.getenv("LOCAL_TTS_TIMEOUT", 60))
+LOCAL_TTS_LOAD_TIMEOUT = float(os.getenv("LOCAL_TTS_LOAD_TIMEOUT", 600))
+
+# The Coqui model, and its speaker for multi-speaker models
+LOCAL_TTS_MODEL = os.getenv("LOCAL_TTS_MODEL", "tts_models/en/ljspeech/vits")
+LOCAL_TTS_SPEAKER = os.getenv("LOCAL_TTS_SPEAKER")
+
+# The pyttsx3 voice ID, the system default if unset
+LOCAL_TTS_VOICE = os.getenv("LOCAL_TTS_VOICE")
+
+# Local engines write WAV, the service answers with MP3
+AUDIO_EXTENSION = "mp3" if TTS_ENGINE == "tiktok" else "wav"
+
+
+class TTSWorker:
+    """A worker process of a local engine, started on first use."""
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        self.process = None
+
+    def _ensure_started(self) -> bool:
+        if self.process is not None and self.process.poll() is None:
+            return False
+        self._stop()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self.engine],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        print(colored(f"[+] Started {self.engine} TTS worker {self.process.pid}", "green"))
+        return True
+
+    def _stop(self) -> None:
+        # Kill and reap the process, so dead workers don't linger as zombies
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def _read_reply(self, timeout: float) -> str:
+        # readline() can't time out, a stuck engine is left to a reader thread
+        reply = []
+        reader = threading.Thread(target=lambda: reply.append(self.process.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(timeout)
+        return reply[0] if reply else None
+
+    def speak(self, items: List[tuple]) -> None:
+        """
+        Speaks a batch of sentences.
+
+        Args:
+            items (List[tuple]): The text and output path of every sentence.
+
+        Returns:
+            None
+        """
+        started = self._ensure_started()
+        timeout = LOCAL_TTS_TIMEOUT * len(items) + (LOCAL_TTS_LOAD_TIMEOUT if started else 0)
+        try:
+            self.process.stdin.write(json.dumps({"items": items}) + "\n")
+            self.process.stdin.flush()
+            reply = self._read_reply(timeout)
+        except (BrokenPipeError, OSError):
+            reply = ""
+
+        if reply is None:
+            # The engine is stuck, the next batch starts a new worker
+            self._stop()
+            raise RuntimeError(f"The {self.engine} TTS worker took longer than {timeout:.0f}s")
+        if not reply:
+            # The worker died, the next batch starts a new one
+            self._stop()
+            raise RuntimeError(f"The {self.engine} TTS worker exited")
+
+        error = json.loads(reply).get("error")
+        if error:
+            raise RuntimeError(error)
+
+
+class TTSPool:
+    """
+    Hands batches of sentences to idle workers. Workers are started on
+    first use and stay alive, so only the first job pays for loading the
+    model. They are never started at import, which keeps pre-fork servers
+    from sharing their pipes.
+    """
+
+    def __init__(self, engine: str, size: int = LOCAL_TTS_WORKERS, batch_size: int = LOCAL_TTS_BATCH):
+        self.size = size
+        self.batch_size = batch_size
+        self.workers = [TTSWorker(engine) for _ in range(size)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="tts")
+
+    def _speak(self, items: List[tuple]) -> int:
+        worker = self.idle.get()
+        try:
+            worker.speak(items)
+        finally:
+            self.idle.put(worker)
+        return len(items)
+
+    def speak(self, items: List[tuple], on_progress: Callable[[int, int], None] = None, cancelled: Callable[[], bool] = lambda: False) -> bool:
+        """
+        Speaks sentences on all workers.
+
+        Args:
+            items (List[tuple]): The text and output path of every sentence.
+            on_progress (Callable): Called with the spoken and total amount of sentences.
+            cancelled (Callable): Returns True once the generation is cancelled.
+
+        Returns:
+            bool: False if cancelled.
+        """
+        # Enough batches to keep every worker busy, few enough to save round trips
+        size = max(1, min(self.batch_size, math.ceil(len(items) / self.size)))
+        pending = {self.executor.submit(self._speak, items[start:start + size]) for start in range(0, len(items), size)}
+
+        spoken = 0
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_EXCEPTION)
+            for future in done:
+                spoken += future.result()
+            if on_progress and done:
+                on_progress(spoken, len(items))
+            if cancelled():
+                for future in pending:
+                    future.cancel()
+                return False
+        return True
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def pool() -> TTSPool:
+    """
+    Returns:
+        TTSPool: The worker pool of the local engine, shared by every generation.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = TTSPool(TTS_ENGINE)
+    return _POOL
+
+
+def speak_batch(sentences: List[str], voice: str, directory: str, on_progress: Callable[[int, int], None] = None,
+                cancelled: Callable[[], bool] = lambda: False) -> List[str]:
+    """
+    Speaks every sentence into its own audio file, with TTS_ENGINE.
+    The TikTok service speaks one sentence after the other, local engines
+    speak batches on all workers at once.
+
+    Args:
+        sentences (List[str]): The sentences.
+        voice (str): The TikTok voice, local engines use LOCAL_TTS_SPEAKER or LOCAL_TTS_VOICE.
+        directory (str): Where the audio files are written.
+        on_progress (Callable): Called with the spoken and total amount of sentences.
+        cancelled (Callable): Returns True once the generation is cancelled.
+
+    Returns:
+        List[str]: The audio files in the order of the sentences, None if cancelled.
+    """
+    paths = [os.path.abspath(os.path.join(directory, f"{uuid4()}.{AUDIO_EXTENSION}")) for _ in sentences]
+
+    if TTS_ENGINE == "tiktok":
+        # Workers of local engines don't need the service's HTTP stack
+        from tiktokvoice import tts
+
+        for index, (sentence, path) in enumerate(zip(sentences, paths)):
+            if cancelled():
+                return None
+            tts(sentence, voice, filename=path)
+            if on_progress:
+                on_progress(index + 1, len(sentences))
+    elif not pool().speak(list(zip(sentences, paths)), on_progress, cancelled):
+        return None
+
+    for sentence, path in zip(sentences, paths):
+        if not os.path.exists(path):
+            raise RuntimeError(f"TTS produced no audio for: {sentence}")
+    return paths
+
+
+def _load_engine(engine: str) -> Callable[[List[tuple]], None]:
+    import providers
+
+    if engine == "coqui":
+        model = providers.get("coqui").TTS(LOCAL_TTS_MODEL)
+        options = {"speaker": LOCAL_TTS_SPEAKER} if LOCAL_TTS_SPEAKER else {}
+
+        def speak(items):
+            for text, path in items:
+                model.tts_to_file(text=text, file_path=path, **options)
+        return speak
+
+    if engine == "pyttsx3":
+        voice_engine = providers.get("pyttsx3").init()
+        if LOCAL_TTS_VOICE:
+            voice_engine.setProperty("voice", LOCAL_TTS_VOICE)
+
+        def speak(items):
+            # pyttsx3 queues the whole batch and renders it in one run
+            for text, path in items:
+                voice_engine.save_to_file(text, path)
+            voice_engine.runAndWait()
+        return speak
+
+    raise ValueError(f"Unknown local TTS engine: {engine}")
+
+
+def serve(engine: str) -> None:
+    """
+    Runs a worker: loads the engine once, then speaks the batches read from
+    stdin and answers every one with a JSON line on stdout.
+
+    Args:
+        engine (str): The local engine.
+
+    Returns:
+        None
+    """
+    # Engines print to stdout, keep it for the replies only
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    speak = _load_engine(engine)
+    for line in sys.stdin:
+        try:
+            speak(json.loads(line)["items"])
+            reply = {}
+        except Exception as e:
+            reply = {"error": str(e)}
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1])
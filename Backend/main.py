@@ -1,19 +1,35 @@
+import time
+
+# Measure how long the backend takes to come up
+STARTUP_STARTED = time.perf_counter()
+
 import os
-from utils import *
-from dotenv import load_dotenv
-from moviepy.editor import *
-from moviepy.config import change_settings
 import shutil
+import threading
+import edl
+import music
+import janitor
+import providers
+import http_client
+import artifacts
+import processes
+import preview
+import profiling
+
 from uuid import uuid4
-from tiktokvoice import *
+from typing import Dict
+from urllib.parse import urlparse
 from flask_cors import CORS
 from termcolor import colored
-from youtube import upload_video
-from apiclient.errors import HttpError
-from flask import Flask, request, jsonify, send_file
-import time
-import threading
+from dotenv import load_dotenv
 from collections import defaultdict
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
+from utils import check_env_vars, fetch_songs
+from upload_queue import UPLOADS
+from taskqueue import TaskQueue
+from admission import ADMISSION, AdmissionRejected, estimate, SECONDS_PER_PARAGRAPH
+from eta import ProgressTracker
+from jobs import STAGES, JobManifest, SingleFlight, load_manifest, fingerprint, flag, record_completed, find_completed
 
 
 
@@ -23,34 +39,73 @@ load_dotenv("../.env")
 # This must happen before importing video which uses API keys without checking
 check_env_vars()
 
-from gpt import *
-from video import *
-from search import *
-from uuid import uuid4
-from tiktokvoice import *
-from flask_cors import CORS
-from termcolor import colored
-from youtube import upload_video
-from apiclient.errors import HttpError
-from flask import Flask, request, jsonify
+from gpt import generate_script, stream_script, split_sentences, get_search_terms, generate_metadata, POOL as LLM_POOL
+from render import render_parallel, RENDER_WORKERS
+from video import save_video, generate_subtitles, combine_videos, generate_video, save_video_metadata, progressive_path, frame_logger, PROGRESSIVE_MODES, MAX_OPEN_DECODERS
+import stock
+from quota import QUOTA as PEXELS_QUOTA, QuotaExhausted
+from narration import Narration
+from local_tts import speak_batch
 
 
 
 # Set environment variables
 SESSION_ID = os.getenv("TIKTOK_SESSION_ID")
 openai_api_key = os.getenv('OPENAI_API_KEY')
-change_settings({"IMAGEMAGICK_BINARY": os.getenv("IMAGEMAGICK_BINARY")})
 
 # Initialize Flask
 app = Flask(__name__)
 CORS(app)  # Enables CORS for all routes
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
+# Let Apache/lighttpd serve downloads via X-Sendfile
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "false").lower() == "true"
 
 # Constants
 HOST = "0.0.0.0"
 PORT = 8080
 AMOUNT_OF_STOCK_VIDEOS = 5
-GENERATING = False
+# Duration and resolution assumed for stock clips which aren't downloaded yet when planning
+PLAN_CLIP_DURATION = 10
+PLAN_CLIP_SIZE = (1920, 1080)
+# Largest clip count, duration in seconds and side in pixels a plan request may ask for
+PLAN_MAX_CLIPS = 50
+PLAN_MAX_DURATION = 3600
+PLAN_MAX_SIDE = 8192
+# Directories clips of a plan request may be read from
+PLAN_CLIP_DIRS = ("../temp", stock.STOCK_LIBRARY_DIR)
+# Sentences a paragraph of script is expected to have, until the script is there
+SENTENCES_PER_PARAGRAPH = 5
+# Where each downloadable artifact lives inside ../final_videos
+ARTIFACT_FILES = {
+    "video": "{id}.mp4",
+    "script": "{id}.script.txt",
+    "metadata": "{id}.txt",
+    "poster": "{id}.poster." + preview.PREVIEW_FORMAT,
+    "sprite": "{id}.sprite." + preview.PREVIEW_FORMAT,
+    "sprite_layout": "{id}.sprite.json",
+    **{f"profile_{fmt}": name for fmt, name in profiling.PROFILE_FILES.items()},
+}
+# Image mimetypes of the preview formats
+PREVIEW_MIMETYPES = {"jpg": "jpeg", "webp": "webp"}
+# Mimetypes and download names of the profile formats
+PROFILE_DOWNLOADS = {
+    "pstats": ("application/octet-stream", "profile.pstats"),
+    "speedscope": ("application/json", "profile.speedscope.json"),
+    "stages": ("application/json", "profile.json"),
+}
+# Seconds clients may cache artifacts for, they are immutable once written
+ARTIFACT_MAX_AGE = int(os.getenv("ARTIFACT_MAX_AGE", 3600))
+# Default progressive output of renders ("fmp4" or "hls"), off if unset
+PROGRESSIVE_OUTPUT = os.getenv("PROGRESSIVE_OUTPUT")
+# Internal nginx location mapped onto the project root, enables X-Accel-Redirect
+X_ACCEL_REDIRECT_ROOT = os.getenv("X_ACCEL_REDIRECT_ROOT")
+# Hand downloads, TTS and segment renders to worker nodes running worker.py
+DISTRIBUTED_WORKERS = os.getenv("DISTRIBUTED_WORKERS", "false").lower() == "true"
+TASKS = TaskQueue() if DISTRIBUTED_WORKERS else None
+# Cancel signal of every running generation, set by /api/cancel
+CANCEL_EVENTS: Dict[str, threading.Event] = {}
+# Identical requests attach to the generation already running for them
+IN_FLIGHT = SingleFlight()
 GENERATION_PROGRESS = defaultdict(lambda: {
     "status": "processing",
     "progress": 0,
@@ -58,41 +113,134 @@ GENERATION_PROGRESS = defaultdict(lambda: {
 })
 
 
-def update_progress(generation_id: str, status: str, progress: int, message: str, metadata_path: str = None, video_path: str = None):
+def update_progress(generation_id: str, status: str, progress: int, message: str, metadata_path: str = None, video_path: str = None, eta: float = None):
     """Update the progress of video generation"""
-    GENERATION_PROGRESS[generation_id] = {
+    record = dict(GENERATION_PROGRESS.get(generation_id, {}))
+    record.update({
         "status": status,
         "progress": progress,
         "message": message,
-        "metadataPath": metadata_path,
-        "videoPath": video_path
-    }
-
-    # Save script to file when it's generated
-    if status == "processing" and "script" in message.lower():
-        try:
-            script_dir = os.path.join("temp", generation_id)
-            os.makedirs(script_dir, exist_ok=True)
-            script_path = os.path.join(script_dir, "script.txt")
-            
-            # Extract script from the message or get it from your script generation
-            script_content = message  # Adjust this based on how you store the script
-            
-            with open(script_path, "w") as f:
-                f.write(script_content)
-        except Exception as e:
-            print(colored(f"[-] Error saving script: {str(e)}", "red"))
+        "eta": round(eta) if eta is not None else None,
+        "estimatedCompletion": round(time.time() + eta) if eta is not None else None,
+        "metadataPath": metadata_path or record.get("metadataPath"),
+        "videoPath": video_path or record.get("videoPath"),
+        "artifacts": record.get("artifacts", {})
+    })
+    GENERATION_PROGRESS[generation_id] = record
+
+
+def record_artifact(generation_id: str, kind: str, path: str) -> None:
+    """
+    Records the location of a finished artifact (video, script, metadata)
+    on the job record, so the download endpoints serve what was actually written.
+
+    Args:
+        generation_id (str): The ID of the generation.
+        kind (str): The kind of artifact, e.g. "video" or "script".
+        path (str): The path to the artifact on disk.
+
+    Returns:
+        None
+    """
+    GENERATION_PROGRESS[generation_id].setdefault("artifacts", {})[kind] = os.path.abspath(path)
+
+
+def resolve_artifact(generation_id: str, kind: str) -> str:
+    """
+    Resolves the path of an artifact of a generation.
+
+    The job record is consulted first; once it has expired, the
+    conventional location inside ../final_videos is used.
+
+    Args:
+        generation_id (str): The ID of the generation.
+        kind (str): The kind of artifact, one of ARTIFACT_FILES.
+
+    Returns:
+        str: The path to the artifact, or None if it does not exist.
+    """
+    # Never let the ID escape the output directory
+    if os.path.basename(generation_id) != generation_id or kind not in ARTIFACT_FILES:
+        return None
+
+    record = GENERATION_PROGRESS.get(generation_id, {})
+    path = record.get("artifacts", {}).get(kind)
+    if not path:
+        path = os.path.abspath(os.path.join("../final_videos", ARTIFACT_FILES[kind].format(id=generation_id)))
+
+    return path if os.path.isfile(path) else None
+
+
+def send_artifact(path: str, mimetype: str, download_name: str):
+    """
+    Sends a file with Range, If-Range and ETag support.
+
+    Werkzeug answers Range requests with 206 responses and hands the file
+    to the server's wsgi.file_wrapper, which lets gunicorn and friends use
+    sendfile(2). When a front proxy is configured (USE_X_SENDFILE or
+    X_ACCEL_REDIRECT_ROOT) the transfer is offloaded to it entirely.
+
+    Args:
+        path (str): The absolute path to the file.
+        mimetype (str): The mimetype of the file.
+        download_name (str): The filename suggested to the client.
+
+    Returns:
+        Response: The Flask response.
+    """
+    if X_ACCEL_REDIRECT_ROOT:
+        # Let nginx serve (and range) the file itself
+        relative_path = os.path.relpath(path, os.path.abspath(".."))
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = f"{X_ACCEL_REDIRECT_ROOT.rstrip('/')}/{relative_path}"
+        response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+        return response
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=True,
+        max_age=ARTIFACT_MAX_AGE
+    )
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+def is_generation_active(generation_id: str) -> bool:
+    """Whether a generation is still running, the janitor leaves its files alone"""
+    if generation_id in processes.JOBS:
+        return True
+    # Keep videos which are still being uploaded
+    if any(upload["generationId"] == generation_id for upload in UPLOADS.pending()):
+        return True
+    return GENERATION_PROGRESS.get(generation_id, {}).get("status") in ("queued", "started", "processing")
 
 
 def get_generation_progress(generation_id: str) -> dict:
     """Get the progress of a video generation"""
     if generation_id in GENERATION_PROGRESS:
         progress_data = GENERATION_PROGRESS[generation_id].copy()
+
+        # Where a waiting generation stands in the admission queue
+        if progress_data["status"] == "queued":
+            progress_data.update(ADMISSION.position(generation_id) or {})
         
         # Add download URLs if generation is complete
         if progress_data["status"] == "completed":
             progress_data["videoUrl"] = f"/download/video/{generation_id}"
             progress_data["scriptUrl"] = f"/download/script/{generation_id}"
+
+        # Previews are ready as soon as the video is rendered
+        if resolve_artifact(generation_id, "profile_stages"):
+            progress_data["profileUrl"] = f"/download/profile/{generation_id}"
+
+        if resolve_artifact(generation_id, "poster"):
+            progress_data["posterUrl"] = f"/download/poster/{generation_id}"
+            progress_data["spriteUrl"] = f"/download/sprite/{generation_id}"
+            progress_data["spriteLayoutUrl"] = f"/download/sprite/{generation_id}/layout"
         
         return progress_data
     
@@ -103,18 +251,242 @@ def get_generation_progress(generation_id: str) -> dict:
     }
 
 
+def cancelled_response(generation_id: str):
+    """Mark the generation as cancelled and return the response for it"""
+    # A terminal status, so the janitor may clean up and the generation can be resumed
+    progress = GENERATION_PROGRESS.get(generation_id, {}).get("progress", 0)
+    update_progress(generation_id, "cancelled", progress, "Video generation was cancelled.")
+    return jsonify(
+        {
+            "status": "error",
+            "message": "Video generation was cancelled.",
+            "data": [],
+            "generation_id": generation_id
+        }
+    )
+
+
 # Generation Endpoint
 @app.route("/api/generate", methods=["POST"])
 def generate():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({
+            "status": "error",
+            "message": "Could not generate video: the request body is not a JSON object.",
+            "data": [],
+        })
+    key = fingerprint(data)
+
+    # Hand out a recent identical generation, if reuse is enabled
+    completed_id = find_completed(key)
+    if completed_id and resolve_artifact(completed_id, "video"):
+        print(colored(f"[+] Reusing completed generation {completed_id}", "green"))
+        return jsonify({
+            "status": "success",
+            "message": f"Video generated! See final_videos/{completed_id}.mp4 for result.",
+            "data": f"{completed_id}.mp4",
+            "generation_id": completed_id,
+            "reused": True
+        })
+
+    # Generate a unique ID for this video generation
+    generation_id = str(uuid4())
+
+    # Attach to an identical generation which is already running
+    flight, leader = IN_FLIGHT.join(key, generation_id)
+    if not leader:
+        print(colored(f"[+] Attaching to running generation {flight.generation_id}", "blue"))
+        return jsonify(flight.wait())
+
+    result = {
+        "status": "error",
+        "message": "Could not generate video.",
+        "data": [],
+        "generation_id": generation_id
+    }
     try:
-        global GENERATING
-        GENERATING = True
+        # Record the request, every completed stage is added to this manifest
+        manifest = JobManifest(generation_id, data)
+        manifest.save()
+
+        response = run_generation(manifest)
+        result = response.get_json()
+        return response
+    finally:
+        IN_FLIGHT.finish(key, result)
+
+
+def _plan_number(value, default: float, limit: float, name: str, minimum: float = 1) -> float:
+    # Numbers of a plan request, bounded on both ends
+    number = float(default if value is None else value)
+    if not minimum <= number <= limit:
+        raise ValueError(f"{name} must be at least {minimum:g} and at most {limit}")
+    return number
+
+
+def _plan_clip_path(path: str) -> str:
+    # Clips are only read from the job and stock directories, not from anywhere on the server
+    real_path = os.path.realpath(path)
+    for directory in PLAN_CLIP_DIRS:
+        real_directory = os.path.realpath(directory)
+        if os.path.commonpath([real_path, real_directory]) == real_directory:
+            return real_path
+    raise ValueError(f"Clip is outside the job and stock directories: {path}")
+
+
+@app.route("/api/plan", methods=["POST"])
+def plan():
+    """
+    Plan a generation without rendering anything: the edit decision list
+    and what rendering it costs. With a generationId the clips, voice over
+    and subtitles of that generation are planned, otherwise the request of
+    a generation with optional "clips" (paths or {duration, width, height})
+    and "audioDuration".
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({
+            "status": "error",
+            "message": "Could not plan generation: the request body is not a JSON object.",
+        }), 400
+    media = {}
+
+    try:
+        generation_id = data.get("generationId")
+        if generation_id:
+            manifest = load_manifest(generation_id)
+            if manifest is None or not manifest.done("clips"):
+                return jsonify({
+                    "status": "error",
+                    "message": "Generation not found or its clips aren't downloaded yet.",
+                }), 404
+            request_data = manifest.request
+            video_paths = manifest.output("clips")["paths"]
+            audio_path = manifest.output("voice")["path"] if manifest.done("voice") else None
+            subtitles_path = manifest.output("subtitles")["path"] if manifest.done("subtitles") else None
+        else:
+            request_data = data
+            video_paths = []
+            clips = data.get("clips") or [{}] * AMOUNT_OF_STOCK_VIDEOS
+            if not isinstance(clips, list) or len(clips) > PLAN_MAX_CLIPS:
+                raise ValueError(f"clips must be a list of at most {PLAN_MAX_CLIPS} clips")
+            for index, clip in enumerate(clips):
+                if isinstance(clip, str):
+                    video_paths.append(_plan_clip_path(clip))
+                    continue
+                # A clip only described by its metadata
+                name = f"clip-{index}"
+                media[name] = {
+                    "duration": _plan_number(clip.get("duration"), PLAN_CLIP_DURATION, PLAN_MAX_DURATION, "duration", edl.MIN_CLIP_DURATION),
+                    "width": round(_plan_number(clip.get("width"), PLAN_CLIP_SIZE[0], PLAN_MAX_SIDE, "width")),
+                    "height": round(_plan_number(clip.get("height"), PLAN_CLIP_SIZE[1], PLAN_MAX_SIDE, "height")),
+                }
+                video_paths.append(name)
+            audio_path = None
+            subtitles_path = None
 
-        # Generate a unique ID for this video generation
-        generation_id = str(uuid4())
+        audio_duration = _plan_number(
+            data.get("audioDuration"),
+            int(request_data.get("paragraphNumber") or 1) * SECONDS_PER_PARAGRAPH,
+            PLAN_MAX_DURATION,
+            "audioDuration"
+        )
+        decision_list = edl.build(
+            video_paths,
+            audio_path=audio_path,
+            audio_duration=audio_duration,
+            media=media,
+            subtitles_path=subtitles_path,
+            subtitles_position=request_data.get("subtitlesPosition"),
+            text_color=request_data.get("color"),
+            # The song is picked when the music is mixed
+            music={"source": None, "gain": music.MUSIC_VOLUME} if flag(request_data.get("useMusic")) else None,
+        )
+    except Exception as e:
+        print(colored(f"[-] Error planning generation: {e}", "red"))
+        return jsonify({
+            "status": "error",
+            "message": f"Could not plan generation: {e}",
+        }), 400
+
+    return jsonify({
+        "status": "success",
+        "plan": decision_list,
+        "cost": estimate(
+            request_data,
+            len(set(video_paths)),
+            tuple(decision_list["size"]),
+            max_open_decoders=MAX_OPEN_DECODERS,
+            duration=decision_list["duration"]
+        ),
+    })
+
+
+@app.route("/api/generate/<generation_id>/resume", methods=["POST"])
+def resume(generation_id):
+    """Resume a failed or interrupted generation from its last completed stage"""
+    if is_generation_active(generation_id):
+        return jsonify({
+            "status": "error",
+            "message": "Video generation is still running.",
+            "data": [],
+        }), 409
+
+    manifest = load_manifest(generation_id)
+    if manifest is None:
+        return jsonify({
+            "status": "error",
+            "message": "Generation not found or not resumable.",
+            "data": [],
+        }), 404
+
+    print(colored(f"[+] Resuming generation {generation_id} after stage: {manifest.last_stage()}", "blue"))
+    return run_generation(manifest)
+
+
+def run_generation(manifest: JobManifest):
+    """
+    Runs every stage of a generation which hasn't completed yet.
+
+    Args:
+        manifest (JobManifest): The manifest of the generation.
+
+    Returns:
+        Response: The JSON response of the generation.
+    """
+    generation_id = manifest.generation_id
+    cancel_event = CANCEL_EVENTS[generation_id] = threading.Event()
+    cancelled = cancel_event.is_set
+    profiler = None
+    narration = None
+
+    try:
+        # Low priority (batch) generations leave the last of the Pexels quota to the others
+        if manifest.request.get('priority') == "low" and "pexels" in stock.STOCK_PROVIDERS and not manifest.done("clips") and PEXELS_QUOTA.low():
+            update_progress(generation_id, "queued", 0, "Waiting for the Pexels quota to reset...")
+            if not PEXELS_QUOTA.wait(cancelled=cancelled):
+                return cancelled_response(generation_id)
+
+        # Wait until the host has the CPU and memory this generation needs
+        update_progress(generation_id, "queued", 0, "Waiting for resources...")
+        admitted = ADMISSION.admit(
+            generation_id,
+            estimate(manifest.request, AMOUNT_OF_STOCK_VIDEOS, max_open_decoders=MAX_OPEN_DECODERS),
+            cancelled=cancelled
+        )
+        if admitted is None:
+            return cancelled_response(generation_id)
+
+        # Track the ffmpeg/ImageMagick processes started for this generation, its
+        # watchdog timeout counts from here rather than from when it was queued
+        processes.start_job(generation_id)
+
+        # Profile the generation if it asked for it, or a share of all generations
+        profiler = profiling.start(generation_id, bool(manifest.request.get('profile')))
         
         # Initialize progress
-        update_progress(generation_id, "started", 5, "Starting video generation...")
+        update_progress(generation_id, "started", 0, "Starting video generation...")
 
         # Create necessary directories if they don't exist
         os.makedirs("../temp", exist_ok=True)
@@ -128,18 +500,19 @@ def generate():
         os.makedirs(subtitles_dir, exist_ok=True)
 
         # Parse JSON
-        data = request.get_json()
+        data = manifest.request
         paragraph_number = int(data.get('paragraphNumber', 1))  # Default to 1 if not provided
         ai_model = data.get('aiModel')  # Get the AI model selected by the user
-        n_threads = data.get('threads')  # Amount of threads to use for video generation
+        n_threads = admitted["threads"]  # Encoder threads granted out of the CPU budget
         subtitles_position = data.get('subtitlesPosition')  # Position of the subtitles in the video
         text_color = data.get('color') # Color of subtitle text
+        progressive = data.get('progressive', PROGRESSIVE_OUTPUT) # Stream the render while it runs ("fmp4" or "hls")
 
         # Get 'useMusic' from the request data and default to False if not provided
-        use_music = data.get('useMusic', False)
+        use_music = flag(data.get('useMusic', False))
 
         # Get 'automateYoutubeUpload' from the request data and default to False if not provided
-        automate_youtube_upload = data.get('automateYoutubeUpload', False)
+        automate_youtube_upload = flag(data.get('automateYoutubeUpload', False))
 
         # Get the ZIP Url of the songs
         songs_zip_url = data.get('zipUrl')
@@ -153,22 +526,37 @@ def generate():
                 # Default to a ZIP file containing popular TikTok Songs
                 fetch_songs("https://filebin.net/2avx134kdibc4c3q/drive-download-20240209T180019Z-001.zip")
 
+        # Progress follows the work done in every stage, weighted by how long the stage is expected to take
+        expected_duration = paragraph_number * SECONDS_PER_PARAGRAPH
+        progress = ProgressTracker(
+            {
+                "script": paragraph_number,
+                "search_terms": AMOUNT_OF_STOCK_VIDEOS,
+                "clips": AMOUNT_OF_STOCK_VIDEOS,
+                "voice": paragraph_number * SENTENCES_PER_PARAGRAPH,
+                "subtitles": paragraph_number * SENTENCES_PER_PARAGRAPH,
+                "combine": expected_duration,
+                "render": expected_duration,
+                "metadata": 1,
+                "music": expected_duration if use_music else 0,
+            },
+            lambda percent, message, eta: update_progress(generation_id, "processing", percent, message, eta=eta),
+            on_stage=profiler.stage_changed if profiler else None
+        )
+        for stage in STAGES:
+            if manifest.done(stage):
+                progress.skip(stage)
+
         # Print little information about the video which is to be generated
         print(colored("[Video to be generated]", "blue"))
         print(colored("   Subject: " + data["videoSubject"], "blue"))
         print(colored("   AI Model: " + ai_model, "blue"))  # Print the AI model being used
-        print(colored("   Custom Prompt: " + data["customPrompt"], "blue"))  # Print the AI model being used
+        print(colored("   Custom Prompt: " + (data.get("customPrompt") or ""), "blue"))  # Print the AI model being used
 
 
 
-        if not GENERATING:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "Video generation was cancelled.",
-                    "data": [],
-                }
-            )
+        if cancelled():
+            return cancelled_response(generation_id)
         
         voice = data["voice"]
         voice_prefix = voice[:2]
@@ -179,212 +567,353 @@ def generate():
             voice = "en_us_001"
             voice_prefix = voice[:2]
 
+        # Script
+        script_path = f"../final_videos/{generation_id}.script.txt"
+        if manifest.verify("script", [script_path]):
+            script = manifest.output("script")["script"]
+        else:
+            progress.start("script", "Generating script...")
+            if TASKS is None and not manifest.done("voice"):
+                # Speak every sentence as soon as it is generated
+                narration = Narration(voice, temp_dir)
+                script = stream_script(
+                    data["videoSubject"],
+                    paragraph_number,
+                    ai_model,
+                    voice,
+                    data.get('customPrompt'),
+                    on_sentence=narration.add
+                )
+                narration.close()
+            else:
+                script = generate_script(
+                    data["videoSubject"], 
+                    paragraph_number,
+                    ai_model,
+                    voice,
+                    data.get('customPrompt')
+                )
 
-        update_progress(generation_id, "processing", 10, "Generating script...")
-        script = generate_script(
-            data["videoSubject"], 
-            paragraph_number,
-            ai_model,
-            voice,
-            data.get('customPrompt')
-        )
+            if script.startswith("Error"):
+                raise Exception(script)
 
-        if script.startswith("Error"):
-            raise Exception(script)
+            # Keep the script next to the final video, so it can be downloaded
+            with open(script_path, "w", encoding="utf-8") as f:
+                f.write(script)
+            manifest.complete("script", script=script)
+        record_artifact(generation_id, "script", script_path)
 
-        update_progress(generation_id, "processing", 20, "Generating search terms...")
-        search_terms = get_search_terms(data["videoSubject"], AMOUNT_OF_STOCK_VIDEOS, script, ai_model)
+        # Search terms
+        if manifest.done("search_terms"):
+            search_terms = manifest.output("search_terms")["terms"]
+        else:
+            progress.start("search_terms", "Generating search terms...")
+            search_terms = get_search_terms(data["videoSubject"], AMOUNT_OF_STOCK_VIDEOS, script, ai_model)
 
-        if not search_terms:
-            raise Exception("Failed to generate search terms")
+            if not search_terms:
+                raise Exception("Failed to generate search terms")
+            manifest.complete("search_terms", terms=search_terms)
 
-        # Search for a video of the given search term
-        video_urls = []
+        # Stock clips
+        if manifest.done("clips") and manifest.verify("clips", manifest.output("clips")["paths"]):
+            video_paths = manifest.output("clips")["paths"]
+        else:
+            progress.start("clips", "Searching for stock videos...", units=len(search_terms))
 
-        # Defines how many results it should query and search through
-        it = 15
+            # Search for a video of the given search term
+            video_urls = []
 
-        # Defines the minimum duration of each clip
-        min_dur = 10
+            # Defines how many results it should query and search through
+            it = 15
 
-        # Loop through all search terms,
-        # and search for a video of the given search term
-        for search_term in search_terms:
-            if not GENERATING:
-                return jsonify(
-                    {
-                        "status": "error",
-                        "message": "Video generation was cancelled.",
-                        "data": [],
-                    }
-                )
-            found_urls = search_for_stock_videos(
-                search_term, os.getenv("PEXELS_API_KEY"), it, min_dur
-            )
-            # Check for duplicates
-            for url in found_urls:
-                if url not in video_urls:
-                    video_urls.append(url)
-                    break
+            # Defines the minimum duration of each clip
+            min_dur = 10
 
-        # Check if video_urls is empty
-        if not video_urls:
-            print(colored("[-] No videos found to download.", "red"))
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "No videos found to download.",
-                    "data": [],
-                }
-            )
-            
-        # Define video_paths
-        video_paths = []
-
-        update_progress(generation_id, "processing", 40, f"Downloading {len(video_urls)} videos...")
-        # Save the videos
-        for video_url in video_urls:
-            if not GENERATING:
-                return jsonify(
-                    {
-                        "status": "error",
-                        "message": "Video generation was cancelled.",
-                        "data": [],
-                    }
-                )
-            try:
-                saved_video_path = save_video(video_url, directory=temp_dir)
-                video_paths.append(saved_video_path)
-            except Exception:
-                print(colored(f"[-] Could not download video: {video_url}", "red"))
-
-        # Let user know
-        print(colored("[+] Videos downloaded!", "green"))
+            if cancelled():
+                return cancelled_response(generation_id)
 
-        # Let user know
-        print(colored("[+] Script generated!\n", "green"))
-
-        if not GENERATING:
-            return jsonify(
-                {
-                    "status": "error",
-                    "message": "Video generation was cancelled.",
-                    "data": [],
-                }
+            # Search for a video of every search term concurrently, the local library first
+            search_results = http_client.map_concurrent(
+                lambda search_term: stock.search(search_term, it, min_dur),
+                search_terms,
+                return_exceptions=True
             )
 
-        # Split script into sentences
-        sentences = script.split(". ")
-
-        # Remove empty strings
-        sentences = list(filter(lambda x: x != "", sentences))
-        paths = []
-
-        update_progress(generation_id, "processing", 50, "Generating audio...")
-        # Generate TTS for every sentence
-        for sentence in sentences:
-            if not GENERATING:
+            # Don't quietly go on with fewer clips than search terms
+            failures = [result for result in search_results if isinstance(result, Exception)]
+            quota_error = next((e for e in failures if isinstance(e, QuotaExhausted)), None)
+            if quota_error:
+                raise quota_error
+            if failures and len(failures) == len(search_terms):
+                raise failures[0]
+            for search_term, result in zip(search_terms, search_results):
+                if isinstance(result, Exception):
+                    print(colored(f"[-] No clips for \"{search_term}\": {result}", "red"))
+
+            # The search term every clip was found for
+            video_terms = {}
+            for search_term, found_urls in zip(search_terms, search_results):
+                if isinstance(found_urls, Exception):
+                    continue
+                # Check for duplicates
+                for url in found_urls:
+                    if url not in video_urls:
+                        video_urls.append(url)
+                        video_terms[url] = search_term
+                        break
+
+            # Check if video_urls is empty
+            if not video_urls:
+                print(colored("[-] No videos found to download.", "red"))
+                update_progress(generation_id, "error", 0, "No videos found to download.")
                 return jsonify(
                     {
                         "status": "error",
-                        "message": "Video generation was cancelled.",
+                        "message": "No videos found to download.",
                         "data": [],
                     }
                 )
-            current_tts_path = f"{temp_dir}/{uuid4()}.mp3"
-            tts(sentence, voice, filename=current_tts_path)
-            audio_clip = AudioFileClip(current_tts_path)
-            paths.append(audio_clip)
-
-        # Combine all TTS files using moviepy
-        final_audio = concatenate_audioclips(paths)
-        tts_path = f"{temp_dir}/{uuid4()}.mp3"
-        final_audio.write_audiofile(tts_path)
+                
+            # Define video_paths
+            video_paths = []
+
+            progress.advance(0, f"Downloading {len(video_urls)} videos...")
+            if cancelled():
+                return cancelled_response(generation_id)
+
+            # Save the videos concurrently, keeping their order
+            if TASKS is not None:
+                results = TASKS.run(
+                    "download",
+                    [{"url": video_url} for video_url in video_urls],
+                    generation_id,
+                    on_progress=progress.advance,
+                    cancelled=cancelled,
+                    allow_failures=True
+                )
+                downloads = [
+                    artifacts.get(result["artifact"], temp_dir) if result else Exception("Download failed")
+                    for result in results
+                ]
+            else:
+                # Bytes downloaded and total size of every video
+                downloaded = {video_url: (0, 0) for video_url in video_urls}
+
+                def on_download(video_url, written, total):
+                    downloaded[video_url] = (written, total)
+                    progress.advance(sum(w / t for w, t in downloaded.values() if t) / len(video_urls))
+
+                downloads = http_client.map_concurrent(
+                    lambda video_url: save_video(
+                        video_url,
+                        directory=temp_dir,
+                        on_progress=lambda written, total: on_download(video_url, written, total)
+                    ),
+                    video_urls,
+                    return_exceptions=True
+                )
+            for video_url, saved_video_path in zip(video_urls, downloads):
+                if isinstance(saved_video_path, Exception):
+                    print(colored(f"[-] Could not download video: {video_url}", "red"))
+                else:
+                    video_paths.append(saved_video_path)
+
+            # Grow the local library with what Pexels returned
+            if stock.STOCK_INGEST_PEXELS:
+                ingest = [
+                    (saved_video_path, [video_terms[video_url]], os.path.basename(urlparse(video_url).path))
+                    for video_url, saved_video_path in zip(video_urls, downloads)
+                    if not isinstance(saved_video_path, Exception) and not stock.is_local(video_url)
+                ]
+                threading.Thread(
+                    target=stock.ingest_downloads,
+                    args=(ingest,),
+                    name="stock-ingest",
+                    daemon=True
+                ).start()
+
+            # Let user know
+            print(colored("[+] Videos downloaded!", "green"))
+            manifest.complete("clips", urls=video_urls, paths=video_paths)
+
+        if cancelled():
+            return cancelled_response(generation_id)
+
+        # Voice over
+        mpy = providers.get("moviepy")
+        if manifest.done("voice") and manifest.verify("voice", manifest.output("voice")["paths"] + [manifest.output("voice")["path"]]):
+            sentences = manifest.output("voice")["sentences"]
+            tts_path = manifest.output("voice")["path"]
+            paths = [mpy.AudioFileClip(path) for path in manifest.output("voice")["paths"]]
+        else:
+            # Split script into sentences
+            sentences = split_sentences(script)
+            paths = []
+            sentence_paths = []
+
+            progress.expect("subtitles", len(sentences))
+            progress.start("voice", "Generating audio...", units=len(sentences))
+            if TASKS is not None:
+                # Workers speak the sentences concurrently
+                results = TASKS.run(
+                    "tts",
+                    [{"text": sentence, "voice": voice} for sentence in sentences],
+                    generation_id,
+                    on_progress=progress.advance,
+                    cancelled=cancelled
+                )
+                sentence_paths = [artifacts.get(result["artifact"], temp_dir) for result in results]
+                paths = [mpy.AudioFileClip(path) for path in sentence_paths]
+            elif narration is not None:
+                # The sentences were spoken while the script streamed in
+                sentence_paths = narration.wait(on_progress=progress.advance, cancelled=cancelled)
+                if sentence_paths is None:
+                    return cancelled_response(generation_id)
+                paths = [mpy.AudioFileClip(path) for path in sentence_paths]
+            else:
+                # Generate TTS for every sentence, on the local workers or one after the other with the service
+                sentence_paths = speak_batch(
+                    sentences,
+                    voice,
+                    temp_dir,
+                    on_progress=lambda done, total: progress.advance(done / total, f"Generated audio for {done} of {total} sentences..."),
+                    cancelled=cancelled
+                )
+                if sentence_paths is None:
+                    return cancelled_response(generation_id)
+                paths = [mpy.AudioFileClip(path) for path in sentence_paths]
+
+            # Combine all TTS files using moviepy
+            final_audio = mpy.concatenate_audioclips(paths)
+            tts_path = f"{temp_dir}/{uuid4()}.mp3"
+            final_audio.write_audiofile(tts_path)
+            manifest.complete("voice", sentences=sentences, paths=sentence_paths, path=tts_path)
+
+        # The rest of the work scales with the length of the voice over
+        audio_duration = sum(clip.duration for clip in paths)
+        for stage in ("combine", "render", "music"):
+            if progress.units[stage]:
+                progress.expect(stage, audio_duration)
+
+        # Subtitles
+        if manifest.done("subtitles") and manifest.verify("subtitles", [p for p in [manifest.output("subtitles")["path"]] if p]):
+            subtitles_path = manifest.output("subtitles")["path"]
+        else:
+            progress.start("subtitles", "Generating subtitles...", units=len(sentences))
+            try:
+                subtitles_path = generate_subtitles(audio_path=tts_path, sentences=sentences, audio_clips=paths, voice=voice_prefix, directory=subtitles_dir)
+            except Exception as e:
+                print(colored(f"[-] Error generating subtitles: {e}", "red"))
+                subtitles_path = None
+            manifest.complete("subtitles", path=subtitles_path)
 
-        update_progress(generation_id, "processing", 60, "Generating subtitles...")
-        try:
-            subtitles_path = generate_subtitles(audio_path=tts_path, sentences=sentences, audio_clips=paths, voice=voice_prefix)
-        except Exception as e:
-            print(colored(f"[-] Error generating subtitles: {e}", "red"))
-            subtitles_path = None
+        # Segments render in parallel straight from the stock videos, progressive output needs a single pass
+        parallel = (RENDER_WORKERS > 1 or TASKS is not None) and progressive not in PROGRESSIVE_MODES
 
         # Concatenate videos
-        temp_audio = AudioFileClip(tts_path)
-        combined_video_path = combine_videos(video_paths, temp_audio.duration, 5, n_threads or 2)
+        if parallel:
+            combined_video_path = None
+            progress.skip("combine")
+        elif manifest.done("combine") and manifest.verify("combine", [manifest.output("combine")["path"]]):
+            combined_video_path = manifest.output("combine")["path"]
+        else:
+            progress.start("combine", "Combining videos...")
+            temp_audio = mpy.AudioFileClip(tts_path)
+            combined_video_path = combine_videos(video_paths, temp_audio.duration, 5, n_threads or 2, directory=temp_dir, on_progress=progress.advance)
+            temp_audio.close()
+            manifest.complete("combine", path=combined_video_path)
 
         # Put everything together
-        try:
-            update_progress(generation_id, "processing", 80, "Adding subtitles and audio...")
-            final_video_name = f"{generation_id}.mp4"
-            final_video_path = f"../final_videos/{final_video_name}"
-            # Unpack the tuple returned by generate_video
-            final_video_name, video_id = generate_video(
-                combined_video_path, 
-                tts_path, 
-                subtitles_path, 
-                n_threads or 2, 
-                subtitles_position, 
-                text_color or "#FFFF00"
-            )
+        final_video_name = f"{generation_id}.mp4"
+        final_video_path = f"../final_videos/{final_video_name}"
+        if not manifest.verify("render", [final_video_path]):
+            progress.start("render", "Adding subtitles and audio...")
+            if parallel:
+                final_video_name, video_id = render_parallel(
+                    video_paths,
+                    tts_path,
+                    subtitles_path,
+                    n_threads or 2,
+                    subtitles_position,
+                    text_color or "#FFFF00",
+                    video_id=generation_id,
+                    directory=temp_dir,
+                    cancelled=cancelled,
+                    queue=TASKS,
+                    on_progress=progress.advance
+                )
+            else:
+                if progressive in PROGRESSIVE_MODES:
+                    # Playback can start while the video is rendering
+                    GENERATION_PROGRESS[generation_id]["streamUrl"] = f"/stream/video/{generation_id}" + ("/index.m3u8" if progressive == "hls" else "")
+                # Unpack the tuple returned by generate_video
+                final_video_name, video_id = generate_video(
+                    combined_video_path, 
+                    tts_path, 
+                    subtitles_path, 
+                    n_threads or 2, 
+                    subtitles_position, 
+                    text_color or "#FFFF00",
+                    video_id=generation_id,
+                    progressive=progressive,
+                    on_progress=progress.advance
+                )
+            manifest.complete("render", path=final_video_path)
+        record_artifact(generation_id, "video", final_video_path)
 
-            # Generate metadata
+        # Poster and scrub preview, taken from keyframes of the rendered video
+        if not resolve_artifact(generation_id, "poster"):
+            try:
+                previews = preview.capture_previews(final_video_path, generation_id)
+                record_artifact(generation_id, "poster", previews["poster"])
+                record_artifact(generation_id, "sprite", previews["sprite"])
+                record_artifact(generation_id, "sprite_layout", previews["layout"])
+            except Exception as e:
+                # The video is fine without previews
+                print(colored(f"[-] Could not capture previews: {e}", "red"))
+
+        # Generate metadata
+        metadata_path = f"../final_videos/{generation_id}.txt"
+        if manifest.verify("metadata", [metadata_path]):
+            title, description, keywords = (manifest.output("metadata")[key] for key in ("title", "description", "keywords"))
+        else:
+            GENERATION_PROGRESS[generation_id]["metadataPath"] = metadata_path
+            progress.start("metadata", "Saving metadata...")
             title, description, keywords = generate_metadata(data["videoSubject"], script, ai_model)
-            
-            # Save metadata with the same video_id
-            metadata_path = f"../final_videos/{generation_id}.txt"
-            update_progress(generation_id, "processing", 50, "Saving metadata...", metadata_path=metadata_path)
-            save_video_metadata(video_id, title, description, keywords)
-
-            if use_music:
-                update_progress(generation_id, "processing", 90, "Adding background music...")
-                # Select a random song
-                song_path = choose_random_song()
-
-                # Add song to video at 30% volume using moviepy
-                video_clip = VideoFileClip(f"../final_videos/{final_video_name}")
-                original_duration = video_clip.duration
-                original_audio = video_clip.audio
-                song_clip = AudioFileClip(song_path).set_fps(44100)
-
-                # Set the volume of the song to 10% of the original volume
-                song_clip = song_clip.volumex(0.1).set_fps(44100)
-
-                # Add the song to the video
-                comp_audio = CompositeAudioClip([original_audio, song_clip])
-                video_clip = video_clip.set_audio(comp_audio)
-                video_clip = video_clip.set_fps(30)
-                video_clip = video_clip.set_duration(original_duration)
-                video_clip.write_videofile(f"../final_videos/{final_video_name}", threads=n_threads or 1)
-
-            GENERATING = False
-
-            # Clean up progress after some time
-            def cleanup_progress():
-                time.sleep(300)  # Keep progress for 5 minutes
-                if generation_id in GENERATION_PROGRESS:
-                    del GENERATION_PROGRESS[generation_id]
-            
-            threading.Thread(target=cleanup_progress).start()
-
-            # When video is complete
-            video_path = f"../final_videos/{generation_id}.mp4"
-            update_progress(generation_id, "completed", 100, "Video generation complete!", metadata_path=metadata_path, video_path=video_path)
-
-            # Return JSON with the path relative to final_videos directory
-            return jsonify({
-                "status": "success",
-                "message": f"Video generated! See final_videos/{final_video_name} for result.",
-                "data": final_video_name,
-                "generation_id": generation_id
-            })
 
-        except Exception as e:
-            print(colored(f"[-] Error generating final video: {e}", "red"))
-            final_video_path = None
+            # Save metadata with the same video_id
+            save_video_metadata(generation_id, title, description, keywords)
+            manifest.complete("metadata", title=title, description=description, keywords=keywords)
+        record_artifact(generation_id, "metadata", metadata_path)
+
+        if use_music and not manifest.done("music"):
+            progress.start("music", "Adding background music...")
+            # Select a random, pre-decoded song from the library
+            track = music.choose_track()
+            print(colored(f"[+] Chose song: {track['song']}", "green"))
+
+            # Add song to video using moviepy
+            video_clip = mpy.VideoFileClip(final_video_path)
+            original_duration = video_clip.duration
+            original_audio = video_clip.audio
+
+            # Only the part of the song under the video is read, at the track's mixing volume
+            song_clip = music.load_window(track, original_duration)
+
+            # Add the song to the video
+            comp_audio = mpy.CompositeAudioClip([original_audio, song_clip])
+            video_clip = video_clip.set_audio(comp_audio)
+            video_clip = video_clip.set_fps(30)
+            video_clip = video_clip.set_duration(original_duration)
+
+            # Don't overwrite the video while it is still being read
+            mixed_video_path = f"{temp_dir}/{uuid4()}.mp4"
+            video_clip.write_videofile(mixed_video_path, threads=n_threads or 1, logger=frame_logger(progress.advance))
+            video_clip.close()
+            shutil.move(mixed_video_path, final_video_path)
+            manifest.complete("music", song=track["song"])
 
         # Define metadata for the video, we will display this to the user, and use it for the YouTube upload
-        title, description, keywords = generate_metadata(data["videoSubject"], script, ai_model)
-
         print(colored("[-] Metadata for YouTube upload:", "blue"))
         print(colored("   Title: ", "blue"))
         print(colored(f"   {title}", "blue"))
@@ -393,7 +922,7 @@ def generate():
         print(colored("   Keywords: ", "blue"))
         print(colored(f"  {', '.join(keywords)}", "blue"))
 
-        if automate_youtube_upload:
+        if automate_youtube_upload and not manifest.done("upload"):
             # Start Youtube Uploader
             # Check if the CLIENT_SECRETS_FILE exists
             client_secrets_file = os.path.abspath("./client_secret.json")
@@ -409,7 +938,7 @@ def generate():
                 video_category_id = "28"  # Science & Technology
                 privacyStatus = "private"  # "public", "private", "unlisted"
                 video_metadata = {
-                    'video_path': os.path.abspath(f"../temp/{final_video_path}"),
+                    'video_path': os.path.abspath(final_video_path),
                     'title': title,
                     'description': description,
                     'category': video_category_id,
@@ -417,28 +946,21 @@ def generate():
                     'privacyStatus': privacyStatus,
                 }
 
-                # Upload the video to YouTube
-                try:
-                    # Unpack the video_metadata dictionary into individual arguments
-                    video_response = upload_video(
-                        video_path=video_metadata['video_path'],
-                        title=video_metadata['title'],
-                        description=video_metadata['description'],
-                        category=video_metadata['category'],
-                        keywords=video_metadata['keywords'],
-                        privacy_status=video_metadata['privacyStatus']
-                    )
-                    print(f"Uploaded video ID: {video_response.get('id')}")
-                except HttpError as e:
-                    print(f"An HTTP error {e.resp.status} occurred:\n{e.content}")
-
-        # Stop FFMPEG processes
-        if os.name == "nt":
-            # Windows
-            os.system("taskkill /f /im ffmpeg.exe")
-        else:
-            # Other OS
-            os.system("pkill -f ffmpeg")
+                # Upload the video to YouTube in the background
+                upload = UPLOADS.enqueue(
+                    generation_id,
+                    video_path=video_metadata['video_path'],
+                    title=video_metadata['title'],
+                    description=video_metadata['description'],
+                    category=video_metadata['category'],
+                    keywords=video_metadata['keywords'],
+                    privacy_status=video_metadata['privacyStatus'],
+                    channel=data.get('youtubeChannel')
+                )
+                manifest.complete("upload", upload_id=upload["id"])
+
+        # Stop the FFMPEG processes of this generation only
+        processes.end_job(generation_id)
 
         # After video generation is complete, clean up temporary files
         try:
@@ -448,30 +970,76 @@ def generate():
         except Exception as e:
             print(colored(f"[-] Error cleaning up temporary files: {e}", "red"))
 
+        # Clean up progress after some time
+        def cleanup_progress():
+            time.sleep(300)  # Keep progress for 5 minutes
+            if generation_id in GENERATION_PROGRESS:
+                del GENERATION_PROGRESS[generation_id]
+        
+        threading.Thread(target=cleanup_progress).start()
+
+        # Identical requests may reuse this generation
+        record_completed(fingerprint(data), generation_id)
+
+        # When video is complete
+        progress.finish()
+        update_progress(generation_id, "completed", 100, "Video generation complete!", metadata_path=metadata_path, video_path=final_video_path)
+
+        # Return JSON with the path relative to final_videos directory
         return jsonify({
             "status": "success",
             "message": f"Video generated! See final_videos/{final_video_name} for result.",
             "data": final_video_name,
             "generation_id": generation_id
         })
+    except AdmissionRejected as err:
+        print(colored(f"[-] Rejected generation {generation_id}: {err}", "red"))
+        update_progress(generation_id, "rejected", 0, str(err))
+        response = jsonify({
+            "status": "error",
+            "message": str(err),
+            "data": [],
+            "generation_id": generation_id
+        })
+        response.status_code = 503
+        return response
     except Exception as err:
-        GENERATING = False
         error_message = str(err)
         print(colored(f"[-] Error: {error_message}", "red"))
+        print(colored(f"[!] Completed stages are kept, resume with /api/generate/{generation_id}/resume", "yellow"))
         update_progress(generation_id, "error", 0, error_message)
         return jsonify({
             "status": "error",
             "message": f"Could not generate video: {error_message}",
             "data": [],
+            "generation_id": generation_id
         })
+    finally:
+        # Whatever happened, don't leave this generation's processes behind
+        if narration is not None:
+            narration.cancel()
+        processes.end_job(generation_id)
+        ADMISSION.release(generation_id)
+        if CANCEL_EVENTS.get(generation_id) is cancel_event:
+            del CANCEL_EVENTS[generation_id]
+        if profiler:
+            try:
+                for fmt, path in profiler.stop().items():
+                    record_artifact(generation_id, f"profile_{fmt}", path)
+            except Exception as e:
+                print(colored(f"[-] Could not save the profile of generation {generation_id}: {e}", "red"))
 
 
 @app.route("/api/cancel", methods=["POST"])
 def cancel():
     print(colored("[!] Received cancellation request...", "yellow"))
 
-    global GENERATING
-    GENERATING = False
+    # Cancel the given generation, or every running one
+    data = request.get_json(silent=True) or {}
+    generation_id = data.get("generationId")
+    for event_id, event in list(CANCEL_EVENTS.items()):
+        if generation_id in (None, event_id):
+            event.set()
 
     return jsonify({"status": "success", "message": "Cancelled video generation."})
 
@@ -480,7 +1048,7 @@ def cancel():
 def get_progress(generation_id):
     """Get the progress of video generation"""
     if generation_id in GENERATION_PROGRESS:
-        return jsonify(GENERATION_PROGRESS[generation_id])
+        return jsonify(get_generation_progress(generation_id))
     
     # Return processing status instead of not_found
     return jsonify({
@@ -494,18 +1062,13 @@ def get_progress(generation_id):
 @app.route("/download/video/<generation_id>")
 def download_video(generation_id):
     try:
-        video_path = os.path.join("temp", generation_id, "final_video.mp4")
-        if not os.path.exists(video_path):
+        video_path = resolve_artifact(generation_id, "video")
+        if not video_path:
             return jsonify({
                 "status": "error",
                 "message": "Video file not found"
             }), 404
-        return send_file(
-            video_path,
-            mimetype='video/mp4',
-            as_attachment=True,
-            download_name='video.mp4'
-        )
+        return send_artifact(video_path, "video/mp4", f"{generation_id}.mp4")
     except Exception as e:
         print(colored(f"[-] Error downloading video: {str(e)}", "red"))
         return jsonify({
@@ -513,21 +1076,71 @@ def download_video(generation_id):
             "message": "Error downloading video"
         }), 500
 
+@app.route("/stream/video/<generation_id>")
+def stream_video(generation_id):
+    """
+    Stream the fragmented MP4 of a generation while it is being rendered.
+    The response follows the file as it grows, until the render finishes.
+    """
+    if os.path.basename(generation_id) != generation_id:
+        return jsonify({"status": "error", "message": "Video not found"}), 404
+
+    partial_path = progressive_path(generation_id, "fmp4")
+    if not os.path.exists(partial_path):
+        # Rendering has finished (or never streamed), serve the final video
+        video_path = resolve_artifact(generation_id, "video")
+        if not video_path:
+            return jsonify({"status": "error", "message": "Video not found"}), 404
+        return send_artifact(video_path, "video/mp4", f"{generation_id}.mp4")
+
+    # Keep the file open, it is renamed to the final video once rendered
+    file = open(partial_path, "rb")
+
+    def follow():
+        try:
+            while True:
+                chunk = file.read(256 * 1024)
+                if chunk:
+                    yield chunk
+                elif is_generation_active(generation_id) and os.path.exists(partial_path):
+                    time.sleep(0.5)
+                else:
+                    # Drain whatever was written last
+                    rest = file.read()
+                    if rest:
+                        yield rest
+                    break
+        finally:
+            file.close()
+
+    return Response(follow(), mimetype="video/mp4", headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/stream/video/<generation_id>/<filename>")
+def stream_video_segment(generation_id, filename):
+    """Serve the HLS playlist and segments of a generation, while and after rendering"""
+    stream_dir = os.path.dirname(progressive_path(generation_id, "hls"))
+    if os.path.basename(generation_id) != generation_id or not os.path.isdir(stream_dir):
+        return jsonify({"status": "error", "message": "Stream not found"}), 404
+
+    if filename.endswith(".m3u8"):
+        # The playlist grows while rendering, don't let anyone cache it
+        response = send_from_directory(stream_dir, filename, mimetype="application/vnd.apple.mpegurl", max_age=0)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return send_from_directory(stream_dir, filename, mimetype="video/mp2t", max_age=ARTIFACT_MAX_AGE)
+
+
 @app.route("/download/script/<generation_id>")
 def download_script(generation_id):
     try:
-        script_path = os.path.join("temp", generation_id, "script.txt")
-        if not os.path.exists(script_path):
+        script_path = resolve_artifact(generation_id, "script")
+        if not script_path:
             return jsonify({
                 "status": "error",
                 "message": "Script file not found"
             }), 404
-        return send_file(
-            script_path,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name='script.txt'
-        )
+        return send_artifact(script_path, "text/plain", "script.txt")
     except Exception as e:
         print(colored(f"[-] Error downloading script: {str(e)}", "red"))
         return jsonify({
@@ -536,6 +1149,115 @@ def download_script(generation_id):
         }), 500
 
 
+@app.route("/download/poster/<generation_id>")
+def download_poster(generation_id):
+    """Download the poster frame of a generation"""
+    poster_path = resolve_artifact(generation_id, "poster")
+    if not poster_path:
+        return jsonify({
+            "status": "error",
+            "message": "Poster not found"
+        }), 404
+    return send_artifact(poster_path, f"image/{PREVIEW_MIMETYPES[preview.PREVIEW_FORMAT]}", f"poster.{preview.PREVIEW_FORMAT}")
+
+
+@app.route("/download/sprite/<generation_id>")
+def download_sprite(generation_id):
+    """Download the scrub preview sprite sheet of a generation"""
+    sprite_path = resolve_artifact(generation_id, "sprite")
+    if not sprite_path:
+        return jsonify({
+            "status": "error",
+            "message": "Sprite sheet not found"
+        }), 404
+    return send_artifact(sprite_path, f"image/{PREVIEW_MIMETYPES[preview.PREVIEW_FORMAT]}", f"sprite.{preview.PREVIEW_FORMAT}")
+
+
+@app.route("/download/sprite/<generation_id>/layout")
+def download_sprite_layout(generation_id):
+    """Describe the sprite sheet: seconds per thumbnail, grid and thumbnail size"""
+    layout_path = resolve_artifact(generation_id, "sprite_layout")
+    if not layout_path:
+        return jsonify({
+            "status": "error",
+            "message": "Sprite sheet not found"
+        }), 404
+    return send_artifact(layout_path, "application/json", "sprite.json")
+
+
+@app.route("/download/profile/<generation_id>")
+def download_profile(generation_id):
+    """Download the profile of a generation: ?format=pstats, speedscope or stages (default)"""
+    fmt = request.args.get("format", "stages")
+    if fmt not in PROFILE_DOWNLOADS:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown profile format, use one of {', '.join(PROFILE_DOWNLOADS)}"
+        }), 400
+
+    profile_path = resolve_artifact(generation_id, f"profile_{fmt}")
+    if not profile_path:
+        return jsonify({
+            "status": "error",
+            "message": "Profile not found"
+        }), 404
+    return send_artifact(profile_path, *PROFILE_DOWNLOADS[fmt])
+
+
+@app.route("/api/upload/<generation_id>", methods=["GET"])
+def upload_status(generation_id):
+    """Get the status of the YouTube upload of a generation"""
+    upload = UPLOADS.find(generation_id)
+    if upload is None:
+        return jsonify({"status": "not_found", "message": "No upload for this generation"}), 404
+    return jsonify(upload)
+
+
+@app.route("/api/janitor", methods=["GET"])
+def janitor_report():
+    """Report what the last janitor run removed"""
+    return jsonify(janitor.LAST_REPORT)
+
+
+@app.route("/api/admission", methods=["GET"])
+def admission_report():
+    """Report the CPU and memory budgets and the jobs using or waiting for them"""
+    return jsonify(ADMISSION.report())
+
+
+@app.route("/api/llm", methods=["GET"])
+def llm_report():
+    """Report the requests, errors, timeouts and latencies of every AI model"""
+    return jsonify(LLM_POOL.stats())
+
+
+@app.route("/api/stock/quota", methods=["GET"])
+def stock_quota_report():
+    """Report the Pexels quota left and how many searches were sent, cached or held back"""
+    return jsonify(PEXELS_QUOTA.report())
+
+
+@app.route("/api/startup", methods=["GET"])
+def startup():
+    """Report startup time and which providers have been loaded"""
+    return jsonify(providers.startup_report(STARTUP_SECONDS))
+
+
+# Load the providers listed in PRELOAD_PROVIDERS now, so pre-fork
+# servers (gunicorn --preload) pay for them once in the master process
+providers.preload()
+
+# Continue YouTube uploads which were interrupted by a restart
+if UPLOADS.pending():
+    UPLOADS.start()
+
+# Keep temp, subtitles and final_videos within their disk budget
+janitor.start(is_generation_active)
+
+STARTUP_SECONDS = time.perf_counter() - STARTUP_STARTED
+print(colored(f"[+] Backend started in {STARTUP_SECONDS:.2f}s", "green"))
+
+
 if __name__ == "__main__":
 
     # Run Flask App
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import random
+import hashlib
+import threading
+import subprocess
+
+from typing import List
+from termcolor import colored
+
+# Where the downloaded songs live
+SONGS_DIR = "../Songs"
+
+# Pre-decoded tracks and the index describing them
+LIBRARY_DIR = os.path.join(SONGS_DIR, ".library")
+INDEX_PATH = os.path.join(LIBRARY_DIR, "index.json")
+
+# Every track is stored as raw 16-bit stereo PCM at this rate
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+
+# Files picked up as songs
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".aac", ".ogg", ".flac")
+
+# Volume of the background music relative to the track
+MUSIC_VOLUME = float(os.getenv("MUSIC_VOLUME", 0.1))
+
+# Normalize every track to this RMS loudness in dBFS instead of using MUSIC_VOLUME
+MUSIC_TARGET_DBFS = os.getenv("MUSIC_TARGET_DBFS")
+
+_INDEX = None
+_INDEX_MTIME = None
+_LOCK = threading.Lock()
+
+
+def _ffmpeg() -> str:
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+def _loudness(pcm_path: str) -> float:
+    import numpy as np
+
+    samples = np.memmap(pcm_path, dtype=np.int16, mode="r")
+    if samples.size == 0:
+        return -120.0
+
+    # Sum of squares in chunks, so long tracks don't need a float copy
+    chunk = SAMPLE_RATE * CHANNELS * 10
+    total = 0.0
+    for start in range(0, samples.size, chunk):
+        block = samples[start:start + chunk].astype(np.float32) / 32768.0
+        total += float(np.dot(block, block))
+
+    rms = (total / samples.size) ** 0.5
+    return round(20 * np.log10(max(rms, 1e-6)), 2)
+
+
+def _decode(song_path: str, pcm_path: str) -> dict:
+    # Decode and resample to 44.1 kHz stereo once, mixing then reads raw samples
+    result = subprocess.run(
+        [_ffmpeg(), "-y", "-v", "info", "-i", song_path, "-vn",
+         "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), pcm_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+
+    match = re.search(r"Audio: .*?(\d+) Hz", result.stderr.decode(errors="ignore"))
+    frame_size = CHANNELS * SAMPLE_WIDTH
+
+    return {
+        "duration": os.path.getsize(pcm_path) / frame_size / SAMPLE_RATE,
+        "sampleRate": int(match.group(1)) if match else None,
+        "loudness": _loudness(pcm_path),
+    }
+
+
+def build_index() -> List[dict]:
+    """
+    Indexes the songs directory. Every new or changed song is decoded once
+    to 44.1 kHz PCM, and its duration, source sample rate and loudness are
+    stored in the index.
+
+    Returns:
+        List[dict]: The tracks of the library.
+    """
+    global _INDEX, _INDEX_MTIME
+
+    with _LOCK:
+        os.makedirs(LIBRARY_DIR, exist_ok=True)
+
+        previous = {}
+        if os.path.exists(INDEX_PATH):
+            with open(INDEX_PATH, "r") as file:
+                previous = {track["song"]: track for track in json.load(file)}
+
+        tracks = []
+        for root, dirs, files in os.walk(SONGS_DIR):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in sorted(files):
+                if not name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+
+                song_path = os.path.join(root, name)
+                song = os.path.relpath(song_path, SONGS_DIR)
+                stat = os.stat(song_path)
+
+                track = previous.get(song)
+                if track and track["size"] == stat.st_size and track["mtime"] == stat.st_mtime \
+                        and os.path.exists(os.path.join(LIBRARY_DIR, track["pcm"])):
+                    tracks.append(track)
+                    continue
+
+                pcm = hashlib.sha1(song.encode()).hexdigest() + ".pcm"
+                try:
+                    track = {
+                        "song": song,
+                        "pcm": pcm,
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        **_decode(song_path, os.path.join(LIBRARY_DIR, pcm)),
+                    }
+                    tracks.append(track)
+                except subprocess.CalledProcessError:
+                    print(colored(f"[-] Could not decode song: {song}", "red"))
+
+        # Drop decoded tracks whose song is gone
+        kept = {track["pcm"] for track in tracks}
+        for name in os.listdir(LIBRARY_DIR):
+            if name.endswith(".pcm") and name not in kept:
+                os.remove(os.path.join(LIBRARY_DIR, name))
+
+        with open(INDEX_PATH + ".tmp", "w") as file:
+            json.dump(tracks, file)
+        os.replace(INDEX_PATH + ".tmp", INDEX_PATH)
+
+        _INDEX = tracks
+        _INDEX_MTIME = os.path.getmtime(INDEX_PATH)
+
+    print(colored(f"[+] Indexed {len(tracks)} songs.", "green"))
+    return tracks
+
+
+def load_index() -> List[dict]:
+    """
+    Returns the tracks of the library, building the index if there is none.
+
+    Returns:
+        List[dict]: The tracks of the library.
+    """
+    global _INDEX, _INDEX_MTIME
+
+    if not os.path.exists(INDEX_PATH):
+        return build_index()
+
+    # Reload if another process rebuilt the index
+    mtime = os.path.getmtime(INDEX_PATH)
+    if _INDEX is None or mtime != _INDEX_MTIME:
+        with open(INDEX_PATH, "r") as file:
+            _INDEX = json.load(file)
+        _INDEX_MTIME = mtime
+
+    return _INDEX
+
+
+def choose_track() -> dict:
+    """
+    Chooses a random track from the library.
+
+    Returns:
+        dict: The index entry of the track.
+    """
+    tracks = load_index()
+    if not tracks:
+        raise FileNotFoundError(f"No songs found in {SONGS_DIR}")
+    return random.choice(tracks)
+
+
+def gain(track: dict) -> float:
+    """
+    Returns:
+        float: The volume factor to mix the track with.
+    """
+    if MUSIC_TARGET_DBFS:
+        return 10 ** ((float(MUSIC_TARGET_DBFS) - track["loudness"]) / 20)
+    return MUSIC_VOLUME
+
+
+def load_window(track: dict, duration: float):
+    """
+    Loads the first seconds of a track as a clip, ready to be mixed.
+    Only the samples inside the window are read from disk.
+
+    Args:
+        track (dict): The index entry of the track.
+        duration (float): The length of the window in seconds.
+
+    Returns:
+        AudioArrayClip: The music, with its volume applied.
+    """
+    import numpy as np
+    from moviepy.audio.AudioClip import AudioArrayClip
+
+    samples = np.memmap(os.path.join(LIBRARY_DIR, track["pcm"]), dtype=np.int16, mode="r")
+    frames = min(int(duration * SAMPLE_RATE), samples.size // CHANNELS)
+
+    window = samples[:frames * CHANNELS].reshape(-1, CHANNELS).astype(np.float32)
+    window *= gain(track) / 32768.0
+
+    return AudioArrayClip(window, fps=SAMPLE_RATE)
@@ -0,0 +1,121 @@
+import time
+import queue
+import threading
+
+from typing import Callable, List
+from termcolor import colored
+from local_tts import speak_batch
+
+
+class NarrationFailed(Exception):
+    """Raised when a sentence could not be spoken."""
+
+
+class Narration:
+    """
+    Speaks the sentences of a script in order while they are still being
+    generated. Sentences are added as the script streams in, a background
+    thread turns every one into an audio file right away, so the voice
+    over is mostly done by the time the script is.
+    """
+
+    def __init__(self, voice: str, directory: str):
+        """
+        Args:
+            voice (str): The TTS voice.
+            directory (str): Where the audio files are written.
+        """
+        self.voice = voice
+        self.directory = directory
+        self.sentences: List[str] = []
+        self.paths: List[str] = []
+        self.error = None
+        self.started = time.time()
+        self.first_audio = None
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._speak, name="narration", daemon=True)
+        self._thread.start()
+
+    def add(self, sentence: str) -> None:
+        """
+        Queues a sentence to be spoken.
+
+        Args:
+            sentence (str): The sentence.
+
+        Returns:
+            None
+        """
+        self.sentences.append(sentence)
+        self._queue.put(sentence)
+
+    def close(self) -> None:
+        """
+        Marks the script as complete, no sentences follow.
+
+        Returns:
+            None
+        """
+        self._queue.put(None)
+
+    def cancel(self) -> None:
+        """
+        Stops speaking, the sentence being spoken still completes.
+
+        Returns:
+            None
+        """
+        self._cancelled.set()
+        self._queue.put(None)
+
+    def _speak(self) -> None:
+        closed = False
+        while not closed and not self._cancelled.is_set():
+            # Speak everything which arrived meanwhile as one batch
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get())
+            if None in batch:
+                closed = True
+                batch = batch[:batch.index(None)]
+            if not batch:
+                continue
+
+            try:
+                paths = speak_batch(batch, self.voice, self.directory, cancelled=self._cancelled.is_set)
+            except Exception as e:
+                self.error = NarrationFailed(f"Could not generate audio: {e}")
+                return
+            if paths is None:
+                return
+
+            self.paths += paths
+            if self.first_audio is None:
+                self.first_audio = time.time() - self.started
+                print(colored(f"[+] First sentence spoken after {self.first_audio:.1f}s", "green"))
+
+    def wait(self, on_progress: Callable[[float, str], None] = None, cancelled: Callable[[], bool] = lambda: False) -> List[str]:
+        """
+        Waits until every sentence is spoken, close() must have been called.
+
+        Args:
+            on_progress (Callable): Called with the share of spoken sentences and a message.
+            cancelled (Callable): Returns True once the generation is cancelled.
+
+        Returns:
+            List[str]: The audio files of the sentences in order, None if cancelled.
+        """
+        while self._thread.is_alive():
+            if cancelled():
+                self.cancel()
+                return None
+            if on_progress and self.sentences:
+                on_progress(len(self.paths) / len(self.sentences), f"Generated audio for {len(self.paths)} of {len(self.sentences)} sentences...")
+            self._thread.join(timeout=0.5)
+
+        if self.error:
+            raise self.error
+        if self._cancelled.is_set():
+            return None
+        return self.paths
@@ -0,0 +1,97 @@
+import os
+import math
+import json
+
+import providers
+import processes
+
+from termcolor import colored
+
+# Where the final videos and their previews are written
+FINAL_VIDEOS_DIR = "../final_videos"
+
+# Image format of the poster and the sprite sheet ("jpg" or "webp")
+PREVIEW_FORMAT = os.getenv("PREVIEW_FORMAT", "jpg")
+
+# Seconds between two thumbnails of the sprite sheet, the render places a keyframe at least this often
+PREVIEW_INTERVAL = int(os.getenv("PREVIEW_INTERVAL", 2))
+
+# Width of every thumbnail of the sprite sheet in pixels
+PREVIEW_THUMBNAIL_WIDTH = int(os.getenv("PREVIEW_THUMBNAIL_WIDTH", 180))
+
+# Thumbnails per row of the sprite sheet
+PREVIEW_COLUMNS = 10
+
+
+def keyframe_params(fps: int = 30) -> list:
+    """
+    Returns:
+        list: ffmpeg parameters placing a keyframe every PREVIEW_INTERVAL seconds,
+            so every thumbnail can be taken from a keyframe.
+    """
+    return ["-g", str(PREVIEW_INTERVAL * fps)]
+
+
+def _quality() -> list:
+    return ["-q:v", "75"] if PREVIEW_FORMAT == "webp" else ["-q:v", "3"]
+
+
+def capture_previews(video_path: str, video_id: str) -> dict:
+    """
+    Writes the poster frame and the scrub preview sprite sheet of a video.
+    Only keyframes are decoded: the poster is taken by seeking to the
+    keyframe before it, the sprite sheet from one keyframe per interval.
+
+    Args:
+        video_path (str): The path of the video.
+        video_id (str): The ID of the video.
+
+    Returns:
+        dict: The paths of the poster and the sprite sheet, and the layout of the sprite sheet.
+    """
+    providers.get("moviepy")
+    from moviepy.config import get_setting
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    ffmpeg = get_setting("FFMPEG_BINARY")
+    infos = ffmpeg_parse_infos(video_path)
+    duration = infos["duration"]
+    width, height = infos["video_size"]
+
+    poster_path = os.path.join(FINAL_VIDEOS_DIR, f"{video_id}.poster.{PREVIEW_FORMAT}")
+    sprite_path = os.path.join(FINAL_VIDEOS_DIR, f"{video_id}.sprite.{PREVIEW_FORMAT}")
+    layout_path = os.path.join(FINAL_VIDEOS_DIR, f"{video_id}.sprite.json")
+
+    # The poster skips the first second, which is often a fade or a black frame
+    processes.run([
+        ffmpeg, "-y", "-v", "error",
+        "-ss", str(min(1, duration / 2)), "-noaccurate_seek", "-skip_frame", "nokey",
+        "-i", video_path,
+        "-frames:v", "1", *_quality(), poster_path
+    ])
+
+    # One keyframe per interval, scaled down and tiled into a single image
+    count = max(1, math.ceil(duration / PREVIEW_INTERVAL))
+    columns = min(count, PREVIEW_COLUMNS)
+    rows = math.ceil(count / columns)
+    thumbnail_height = round(height * PREVIEW_THUMBNAIL_WIDTH / width / 2) * 2
+    processes.run([
+        ffmpeg, "-y", "-v", "error",
+        "-skip_frame", "nokey", "-i", video_path,
+        "-vf", f"fps=1/{PREVIEW_INTERVAL},scale={PREVIEW_THUMBNAIL_WIDTH}:{thumbnail_height},tile={columns}x{rows}",
+        "-frames:v", "1", "-an", *_quality(), sprite_path
+    ])
+
+    layout = {
+        "interval": PREVIEW_INTERVAL,
+        "count": count,
+        "columns": columns,
+        "rows": rows,
+        "width": PREVIEW_THUMBNAIL_WIDTH,
+        "height": thumbnail_height,
+    }
+    with open(layout_path, "w", encoding="utf-8") as file:
+        json.dump(layout, file)
+
+    print(colored(f"[+] Poster and sprite sheet saved for {video_id}", "green"))
+    return {"poster": poster_path, "sprite": sprite_path, "layout": layout_path}
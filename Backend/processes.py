@@ -0,0 +1,261 @@
+import os
+import sys
+import types
+import threading
+import providers
+import subprocess
+
+from typing import Dict, List
+from termcolor import colored
+
+# Seconds the subprocesses of a job may run before they are terminated, 0 disables
+JOB_PROCESS_TIMEOUT = int(os.getenv("JOB_PROCESS_TIMEOUT", 3600))
+
+# Address space limit for every ffmpeg/ImageMagick process in MB, 0 disables
+PROCESS_MEMORY_LIMIT_MB = int(os.getenv("PROCESS_MEMORY_LIMIT_MB", 0))
+
+# CPU time limit for every ffmpeg/ImageMagick process in seconds, 0 disables
+PROCESS_CPU_LIMIT = int(os.getenv("PROCESS_CPU_LIMIT", 0))
+
+# Niceness added to every ffmpeg/ImageMagick process
+PROCESS_NICE = int(os.getenv("PROCESS_NICE", 0))
+
+# Seconds to wait for a terminated process before killing it
+TERMINATE_GRACE = 5
+
+# Trackers of the jobs which are currently running, keyed by job ID
+JOBS: Dict[str, "JobProcesses"] = {}
+
+_SCOPE = threading.local()
+
+
+class JobProcesses:
+    """
+    Keeps track of the subprocesses started on behalf of one job, so they
+    can be cleaned up without touching the processes of other jobs.
+    """
+
+    def __init__(self, job_id: str, timeout: int = JOB_PROCESS_TIMEOUT):
+        self.job_id = job_id
+        self.processes: List[subprocess.Popen] = []
+        self.timed_out = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+        if timeout:
+            threading.Thread(target=self._watch, args=(timeout,), daemon=True).start()
+
+    def add(self, process: subprocess.Popen) -> None:
+        """
+        Starts tracking a process.
+
+        Args:
+            process (subprocess.Popen): The process.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            # Forget about processes which have exited already
+            self.processes = [p for p in self.processes if p.poll() is None]
+            self.processes.append(process)
+
+    def running(self) -> List[subprocess.Popen]:
+        """
+        Returns:
+            List[subprocess.Popen]: The tracked processes which are still running.
+        """
+        with self._lock:
+            return [p for p in self.processes if p.poll() is None]
+
+    def terminate(self) -> int:
+        """
+        Terminates every tracked process which is still running.
+
+        Returns:
+            int: The amount of processes which had to be stopped.
+        """
+        running = self.running()
+        for process in running:
+            process.terminate()
+
+        for process in running:
+            try:
+                process.wait(timeout=TERMINATE_GRACE)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        return len(running)
+
+    def close(self) -> None:
+        """
+        Stops the watchdog and every process left behind by the job.
+
+        Returns:
+            None
+        """
+        self._done.set()
+        stopped = self.terminate()
+        if stopped:
+            print(colored(f"[+] Stopped {stopped} leftover processes of job {self.job_id}", "green"))
+
+    def _watch(self, timeout: int) -> None:
+        if not self._done.wait(timeout):
+            self.timed_out = True
+            print(colored(f"[-] Job {self.job_id} exceeded {timeout}s, stopping its processes.", "red"))
+            self.terminate()
+
+
+class PoolProcess:
+    """
+    Lets a JobProcesses track a multiprocessing.Process, like a worker of
+    a ProcessPoolExecutor, the same way as a subprocess.
+    """
+
+    def __init__(self, process):
+        self.process = process
+
+    def poll(self) -> int:
+        return self.process.exitcode
+
+    def terminate(self) -> None:
+        self.process.terminate()
+
+    def kill(self) -> None:
+        self.process.kill()
+
+    def wait(self, timeout: float = None) -> int:
+        self.process.join(timeout)
+        if self.process.exitcode is None:
+            raise subprocess.TimeoutExpired(f"process {self.process.pid}", timeout)
+        return self.process.exitcode
+
+
+def _limit_resources() -> None:
+    # Runs in the child between fork and exec
+    import resource
+
+    if PROCESS_MEMORY_LIMIT_MB:
+        limit = PROCESS_MEMORY_LIMIT_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if PROCESS_CPU_LIMIT:
+        resource.setrlimit(resource.RLIMIT_CPU, (PROCESS_CPU_LIMIT, PROCESS_CPU_LIMIT))
+    if PROCESS_NICE:
+        os.nice(PROCESS_NICE)
+
+
+class TrackedPopen(subprocess.Popen):
+    """
+    Popen which registers the process with the job of the current thread,
+    and applies the configured resource limits to it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        tracker = current()
+        limited = PROCESS_MEMORY_LIMIT_MB or PROCESS_CPU_LIMIT or PROCESS_NICE
+        if tracker is not None and limited and os.name != "nt" and kwargs.get("preexec_fn") is None:
+            kwargs["preexec_fn"] = _limit_resources
+
+        super().__init__(*args, **kwargs)
+
+        if tracker is not None:
+            tracker.add(self)
+
+
+def run(cmd: List[str], timeout: float = None) -> subprocess.CompletedProcess:
+    """
+    Runs a command as a tracked process of the current job.
+
+    Args:
+        cmd (List[str]): The command.
+        timeout (float): Seconds after which the process is killed.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process, raises if it failed.
+    """
+    with TrackedPopen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            raise
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def current() -> "JobProcesses":
+    """
+    Returns:
+        JobProcesses: The tracker of the job running in this thread, if any.
+    """
+    return getattr(_SCOPE, "tracker", None)
+
+
+def bind(tracker: "JobProcesses") -> None:
+    """
+    Attributes the processes started by the calling thread to a job.
+    Worker threads of a job call this with the job's tracker.
+
+    Args:
+        tracker (JobProcesses): The tracker of the job, or None to unbind.
+
+    Returns:
+        None
+    """
+    _SCOPE.tracker = tracker
+
+
+def start_job(job_id: str) -> "JobProcesses":
+    """
+    Starts tracking the processes of a job running in the calling thread.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        JobProcesses: The tracker of the job.
+    """
+    tracker = JobProcesses(job_id)
+    JOBS[job_id] = tracker
+    bind(tracker)
+    return tracker
+
+
+def end_job(job_id: str) -> None:
+    """
+    Stops the processes left behind by a job and forgets about it.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        None
+    """
+    tracker = JOBS.pop(job_id, None)
+    if tracker is not None:
+        tracker.close()
+    if current() is tracker:
+        bind(None)
+
+
+def install(_=None) -> None:
+    """
+    Routes the subprocesses moviepy starts (ffmpeg readers and writers,
+    ImageMagick for TextClip) through TrackedPopen.
+
+    Returns:
+        None
+    """
+    tracked = types.ModuleType("subprocess")
+    tracked.__dict__.update(subprocess.__dict__)
+    tracked.Popen = TrackedPopen
+
+    for name, module in list(sys.modules.items()):
+        if name.startswith("moviepy") and getattr(module, "sp", None) is subprocess:
+            module.sp = tracked
+
+
+# Track moviepy's processes as soon as it is loaded
+providers.on_load("moviepy", install)
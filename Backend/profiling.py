@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import random
+import cProfile
+import threading
+
+from typing import Dict, List
+from termcolor import colored
+
+# Where the profiles are written, next to the final video
+FINAL_VIDEOS_DIR = "../final_videos"
+
+# Share of all generations which are profiled, on top of the ones asking for it
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+
+# Seconds between two stack samples of a profiled generation
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.01))
+
+# The files written for a profiled generation, by format
+PROFILE_FILES = {
+    "pstats": "{id}.profile.pstats",
+    "speedscope": "{id}.profile.speedscope.json",
+    "stages": "{id}.profile.json",
+}
+
+
+def _cpu_children() -> float:
+    try:
+        import resource
+    except ImportError:
+        # Windows has no rusage, the CPU time of ffmpeg and ImageMagick isn't counted there
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class JobProfiler:
+    """
+    Profiles the thread running a generation: cProfile for exact call
+    counts and CPU time, a stack sampler for a wall clock view (time spent
+    waiting on ffmpeg and ImageMagick shows up where Python waits for
+    them), and the wall and CPU time of every stage.
+    """
+
+    def __init__(self, generation_id: str):
+        self.generation_id = generation_id
+        self.thread_id = threading.get_ident()
+        self.profile = cProfile.Profile()
+        self.profiling = False
+        self.stages: List[dict] = []
+        self.stage = None
+
+        # Stack samples: frame table, and per stage the sampled stacks with their weights
+        self.frames: List[dict] = []
+        self.frame_ids: Dict[tuple, int] = {}
+        self.samples: Dict[str, list] = {}
+        self.started = time.time()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{generation_id}", daemon=True)
+
+    def start(self) -> None:
+        """
+        Starts profiling the calling thread.
+
+        Returns:
+            None
+        """
+        try:
+            self.profile.enable()
+            self.profiling = True
+        except ValueError:
+            # Another generation is being profiled with cProfile, the sampler still runs
+            print(colored(f"[!] cProfile is busy, only sampling generation {self.generation_id}", "yellow"))
+        self._sampler.start()
+        self.stage_changed("setup")
+
+    def stage_changed(self, stage: str) -> None:
+        """
+        Closes the timing of the current stage and opens the next one.
+        Must be called from the profiled thread.
+
+        Args:
+            stage (str): The stage starting now, or None when it finished.
+
+        Returns:
+            None
+        """
+        now = time.time(), time.thread_time(), _cpu_children()
+        if self.stages and "wall" not in self.stages[-1]:
+            current = self.stages[-1]
+            current["wall"] = round(now[0] - current.pop("_wall"), 3)
+            current["cpu"] = round(now[1] - current.pop("_cpu"), 3)
+            current["childrenCpu"] = round(now[2] - current.pop("_children"), 3)
+
+        self.stage = stage
+        if stage is not None:
+            self.stages.append({"stage": stage, "_wall": now[0], "_cpu": now[1], "_children": now[2]})
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        if key not in self.frame_ids:
+            self.frame_ids[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return self.frame_ids[key]
+
+    def _sample(self) -> None:
+        last = time.time()
+        while not self._done.wait(PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.time()
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+
+            self.samples.setdefault(self.stage or "other", []).append((stack, now - last))
+            last = now
+
+    def speedscope(self) -> dict:
+        """
+        Returns:
+            dict: The stack samples in speedscope's file format, one profile per stage.
+        """
+        profiles = []
+        for stage, samples in self.samples.items():
+            total = sum(weight for _, weight in samples)
+            profiles.append({
+                "type": "sampled",
+                "name": stage,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": [stack for stack, _ in samples],
+                "weights": [weight for _, weight in samples],
+            })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"Generation {self.generation_id}",
+            "exporter": "autovideomaker",
+            "shared": {"frames": self.frames},
+            "profiles": profiles,
+        }
+
+    def stop(self) -> dict:
+        """
+        Stops profiling and writes the profiles next to the final video.
+
+        Returns:
+            dict: The paths of the written profiles, by format.
+        """
+        self.stage_changed(None)
+        if self.profiling:
+            self.profile.disable()
+        self._done.set()
+        self._sampler.join()
+
+        paths = {fmt: os.path.join(FINAL_VIDEOS_DIR, name.format(id=self.generation_id)) for fmt, name in PROFILE_FILES.items()}
+        os.makedirs(FINAL_VIDEOS_DIR, exist_ok=True)
+
+        if self.profiling:
+            self.profile.dump_stats(paths["pstats"])
+        else:
+            paths.pop("pstats")
+
+        with open(paths["speedscope"], "w", encoding="utf-8") as file:
+            json.dump(self.speedscope(), file)
+
+        with open(paths["stages"], "w", encoding="utf-8") as file:
+            json.dump({
+                "generationId": self.generation_id,
+                "wall": round(time.time() - self.started, 3),
+                "stages": self.stages,
+            }, file, indent=2)
+
+        print(colored(f"[+] Saved profile of generation {self.generation_id}", "green"))
+        return paths
+
+
+def start(generation_id: str, requested: bool = False) -> JobProfiler:
+    """
+    Starts profiling a generation in the calling thread, if it asked for
+    it or was picked by PROFILE_SAMPLE_RATE.
+
+    Args:
+        generation_id (str): The ID of the generation.
+        requested (bool): Whether the request asked to be profiled.
+
+    Returns:
+        JobProfiler: The profiler, or None if the generation isn't profiled.
+    """
+    if not requested and random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+
+    profiler = JobProfiler(generation_id)
+    profiler.start()
+    print(colored(f"[*] Profiling generation {generation_id}", "blue"))
+    return profiler
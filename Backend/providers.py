@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+import importlib
+
+from typing import Callable, Dict, List
+from termcolor import colored
+
+# Loaders for every lazily imported provider, keyed by name
+LOADERS: Dict[str, Callable] = {}
+
+# Modules which have already been loaded
+LOADED: Dict[str, object] = {}
+
+# Seconds it took to load each provider
+LOAD_TIMES: Dict[str, float] = {}
+
+# Callbacks run once a provider has been loaded, keyed by name
+LOAD_HOOKS: Dict[str, List[Callable]] = {}
+
+_LOCK = threading.RLock()
+
+
+def register(name: str, loader: Callable) -> None:
+    """
+    Registers a provider which is loaded on first use.
+
+    Args:
+        name (str): The name of the provider.
+        loader (Callable): Function returning the loaded module or client.
+
+    Returns:
+        None
+    """
+    LOADERS[name] = loader
+
+
+def on_load(name: str, hook: Callable) -> None:
+    """
+    Registers a callback which receives the provider once it is loaded.
+    If the provider is loaded already, the callback runs right away.
+
+    Args:
+        name (str): The name of the provider.
+        hook (Callable): The callback.
+
+    Returns:
+        None
+    """
+    with _LOCK:
+        LOAD_HOOKS.setdefault(name, []).append(hook)
+        if name in LOADED:
+            hook(LOADED[name])
+
+
+def get(name: str):
+    """
+    Returns a provider, loading it on first use.
+
+    Args:
+        name (str): The name of the provider.
+
+    Returns:
+        any: The loaded module or client.
+    """
+    if name in LOADED:
+        return LOADED[name]
+
+    with _LOCK:
+        if name not in LOADED:
+            if name not in LOADERS:
+                raise KeyError(f"Unknown provider: {name}")
+
+            started = time.perf_counter()
+            provider = LOADERS[name]()
+            LOAD_TIMES[name] = time.perf_counter() - started
+            LOADED[name] = provider
+
+            for hook in LOAD_HOOKS.get(name, []):
+                hook(provider)
+
+            print(colored(f"[+] Loaded {name} in {LOAD_TIMES[name]:.2f}s", "green"))
+
+    return LOADED[name]
+
+
+def preload(names: List[str] = None) -> None:
+    """
+    Loads providers ahead of time. Meant for pre-fork servers
+    (e.g. gunicorn --preload), so the import cost is paid once in the
+    master process and shared copy-on-write by the workers.
+
+    Args:
+        names (List[str]): The providers to load, defaults to PRELOAD_PROVIDERS
+            from the environment ("all" loads every registered provider).
+
+    Returns:
+        None
+    """
+    if names is None:
+        names = [name.strip() for name in os.getenv("PRELOAD_PROVIDERS", "").split(",") if name.strip()]
+
+    if "all" in names:
+        names = list(LOADERS.keys())
+
+    for name in names:
+        try:
+            get(name)
+        except Exception as e:
+            print(colored(f"[-] Could not preload {name}: {e}", "red"))
+
+
+def startup_report(startup_seconds: float = None) -> dict:
+    """
+    Reports how long the backend took to start and which providers are loaded.
+
+    Args:
+        startup_seconds (float): Time it took to import and set up the app.
+
+    Returns:
+        dict: The report.
+    """
+    return {
+        "startupSeconds": startup_seconds,
+        "loaded": {name: round(LOAD_TIMES[name], 3) for name in LOADED},
+        "lazy": [name for name in LOADERS if name not in LOADED],
+    }
+
+
+def _load_moviepy():
+    editor = importlib.import_module("moviepy.editor")
+
+    from PIL import Image
+    if not hasattr(Image, 'ANTIALIAS'):
+        # For Pillow 10.0.0+
+        Image.ANTIALIAS = Image.Resampling.LANCZOS
+
+    from moviepy.config import change_settings
+    change_settings({"IMAGEMAGICK_BINARY": os.getenv("IMAGEMAGICK_BINARY")})
+
+    return editor
+
+
+def _load_openai():
+    openai = importlib.import_module("openai")
+    openai.api_key = os.getenv('OPENAI_API_KEY')
+    return openai
+
+
+def _load_genai():
+    genai = importlib.import_module("google.generativeai")
+    genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+    return genai
+
+
+def _load_g4f():
+    g4f = importlib.import_module("g4f")
+    importlib.import_module("g4f.client")
+    return g4f
+
+
+register("moviepy", _load_moviepy)
+register("openai", _load_openai)
+register("genai", _load_genai)
+register("g4f", _load_g4f)
+register("assemblyai", lambda: importlib.import_module("assemblyai"))
+register("srt_equalizer", lambda: importlib.import_module("srt_equalizer"))
+register("youtube", lambda: importlib.import_module("youtube"))
+register("coqui", lambda: importlib.import_module("TTS.api"))
+register("pyttsx3", lambda: importlib.import_module("pyttsx3"))
+register("numpy", lambda: importlib.import_module("numpy"))
@@ -0,0 +1,268 @@
+"""
+Keeps track of the Pexels API quota from the X-Ratelimit-* headers of its
+responses, and caches search results. Both are kept in files shared by
+every process and worker pointed at PEXELS_STATE_DIR, so they spend one
+budget between them instead of each assuming the whole quota is theirs.
+"""
+import os
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+from typing import Callable, List
+from termcolor import colored
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, processes share the files without locking them
+    fcntl = None
+
+# Where the quota and cached search results are kept, a shared volume for worker nodes
+PEXELS_STATE_DIR = os.getenv("PEXELS_STATE_DIR", os.getenv("STOCK_LIBRARY_DIR", "../stock"))
+
+# Requests per window assumed until Pexels reports its limit
+PEXELS_QUOTA_LIMIT = int(os.getenv("PEXELS_QUOTA_LIMIT", 200))
+
+# Share of the quota left below which requests are shaped: smaller pages, stale cache hits, low priority jobs wait
+PEXELS_QUOTA_LOW = float(os.getenv("PEXELS_QUOTA_LOW", 0.2))
+
+# Results asked for per search while the quota is low
+PEXELS_LOW_PER_PAGE = int(os.getenv("PEXELS_LOW_PER_PAGE", 5))
+
+# Seconds search results are reused for, older ones are still used while the quota is low
+PEXELS_CACHE_SECONDS = int(os.getenv("PEXELS_CACHE_SECONDS", 24 * 3600))
+
+# Most search results kept, the oldest are dropped first
+PEXELS_CACHE_ENTRIES = int(os.getenv("PEXELS_CACHE_ENTRIES", 2000))
+
+# Longest a low priority job waits for the quota to reset
+PEXELS_DEFER_SECONDS = int(os.getenv("PEXELS_DEFER_SECONDS", 3600))
+
+# Seconds to back off after a 429 which doesn't say when to retry
+PEXELS_BACKOFF_SECONDS = 60
+
+
+class QuotaExhausted(Exception):
+    """Raised instead of calling Pexels while its quota is used up."""
+
+
+def _read(path: str, default: dict) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def _write(path: str, data: dict) -> None:
+    # Write next to the target and rename, so readers never see a partial file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def _header(headers, name: str) -> float:
+    value = headers.get(name) if headers else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PexelsQuota:
+    """
+    The requests left in the current Pexels window. Every search reserves
+    one before it is sent, so concurrent workers don't all spend the last
+    request, and the headers of the response then set the exact count.
+    """
+
+    def __init__(self, directory: str = PEXELS_STATE_DIR, limit: int = PEXELS_QUOTA_LIMIT):
+        self.path = os.path.join(directory, ".pexels_quota.json")
+        self.cache_path = os.path.join(directory, ".pexels_cache.json")
+        self.default_limit = limit
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        # One process and thread at a time reads, changes and writes the state
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path + ".lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = _read(self.path, {"limit": self.default_limit, "remaining": None, "reset": None})
+                # A new window starts with the whole quota
+                if state["reset"] is not None and time.time() >= state["reset"]:
+                    state["remaining"] = None
+                    state["reset"] = None
+                try:
+                    yield state
+                finally:
+                    # Counters change even when a request is refused
+                    _write(self.path, state)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _level(state: dict) -> float:
+        if state["remaining"] is None or not state["limit"]:
+            return 1.0
+        return max(state["remaining"], 0) / state["limit"]
+
+    def low(self) -> bool:
+        """
+        Returns:
+            bool: Whether less than PEXELS_QUOTA_LOW of the quota is left.
+        """
+        with self._state() as state:
+            return self._level(state) < PEXELS_QUOTA_LOW
+
+    def acquire(self, per_page: int) -> int:
+        """
+        Reserves a request.
+
+        Args:
+            per_page (int): The amount of results the search wants.
+
+        Returns:
+            int: The amount of results to ask for, fewer while the quota is low.
+        """
+        with self._state() as state:
+            if state["remaining"] is not None and state["remaining"] <= 0:
+                state["rejected"] = state.get("rejected", 0) + 1
+                reset_in = max(0, round(state["reset"] - time.time())) if state["reset"] else 0
+                raise QuotaExhausted(f"Pexels quota used up, it resets in {reset_in}s")
+
+            low = self._level(state) < PEXELS_QUOTA_LOW
+            if state["remaining"] is not None:
+                state["remaining"] -= 1
+            state["requests"] = state.get("requests", 0) + 1
+
+        return min(per_page, PEXELS_LOW_PER_PAGE) if low else per_page
+
+    def update(self, status: int, headers) -> None:
+        """
+        Takes the quota from the headers of a Pexels response.
+
+        Args:
+            status (int): The status code of the response.
+            headers: The headers of the response.
+
+        Returns:
+            None
+        """
+        limit = _header(headers, "X-Ratelimit-Limit")
+        remaining = _header(headers, "X-Ratelimit-Remaining")
+        reset = _header(headers, "X-Ratelimit-Reset")
+
+        with self._state() as state:
+            if limit:
+                state["limit"] = int(limit)
+
+            if status == 429:
+                retry_after = _header(headers, "Retry-After")
+                state["remaining"] = 0
+                state["reset"] = reset or time.time() + (retry_after or PEXELS_BACKOFF_SECONDS)
+                state["throttled"] = state.get("throttled", 0) + 1
+                print(colored(f"[!] Pexels quota used up until {time.ctime(state['reset'])}", "yellow"))
+            elif remaining is not None:
+                # Responses of one window can arrive out of order, the lowest count is the latest
+                if reset == state["reset"] and state["remaining"] is not None:
+                    remaining = min(remaining, state["remaining"])
+                state["remaining"] = int(remaining)
+                state["reset"] = reset
+
+    def cached(self, query: str, per_page: int) -> List[dict]:
+        """
+        Looks up the results of an earlier search.
+
+        Args:
+            query (str): The search term.
+            per_page (int): The amount of results the search wants.
+
+        Returns:
+            List[dict]: The duration and URL of every video found, None if the search has to be sent.
+        """
+        entry = _read(self.cache_path, {}).get(query.lower())
+        if entry is None:
+            return None
+
+        with self._state() as state:
+            low = self._level(state) < PEXELS_QUOTA_LOW
+            fresh = time.time() - entry["time"] < PEXELS_CACHE_SECONDS
+            # A search which found fewer than it asked for found everything there is
+            complete = entry["perPage"] >= per_page or len(entry["videos"]) < entry["perPage"]
+            # Stale or short results beat spending the last requests
+            if not low and not (fresh and complete):
+                return None
+            state["cacheHits"] = state.get("cacheHits", 0) + 1
+
+        return entry["videos"][:per_page]
+
+    def store(self, query: str, per_page: int, videos: List[dict]) -> None:
+        """
+        Caches the results of a search.
+
+        Args:
+            query (str): The search term.
+            per_page (int): The amount of results asked for.
+            videos (List[dict]): The duration and URL of every video found.
+
+        Returns:
+            None
+        """
+        with self._state():
+            cache = _read(self.cache_path, {})
+            cache[query.lower()] = {"time": time.time(), "perPage": per_page, "videos": videos}
+            if len(cache) > PEXELS_CACHE_ENTRIES:
+                newest = sorted(cache, key=lambda key: cache[key]["time"])[-PEXELS_CACHE_ENTRIES:]
+                cache = {key: cache[key] for key in newest}
+            _write(self.cache_path, cache)
+
+    def wait(self, cancelled: Callable[[], bool] = lambda: False, timeout: float = PEXELS_DEFER_SECONDS) -> bool:
+        """
+        Waits while the quota is low, until it resets or timeout seconds passed.
+
+        Args:
+            cancelled (Callable): Returns True once the generation is cancelled.
+            timeout (float): The longest to wait in seconds.
+
+        Returns:
+            bool: False if cancelled.
+        """
+        deadline = time.time() + timeout
+        deferred = False
+        while time.time() < deadline:
+            with self._state() as state:
+                if self._level(state) >= PEXELS_QUOTA_LOW:
+                    break
+                if not deferred:
+                    state["deferred"] = state.get("deferred", 0) + 1
+                    deferred = True
+            if cancelled():
+                return False
+            time.sleep(1)
+        return True
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: The quota left, when it resets, and how many searches were sent, cached, rejected, throttled and deferred.
+        """
+        with self._state() as state:
+            return {
+                "limit": state["limit"],
+                "remaining": state["remaining"],
+                "resetIn": max(0, round(state["reset"] - time.time())) if state["reset"] else None,
+                "level": round(self._level(state), 3),
+                "low": self._level(state) < PEXELS_QUOTA_LOW,
+                **{key: state.get(key, 0) for key in ("requests", "cacheHits", "rejected", "throttled", "deferred")},
+            }
+
+
+# The quota of PEXELS_API_KEY
+QUOTA = PexelsQuota()
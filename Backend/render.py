@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import uuid
+import multiprocessing
+
+import edl
+import artifacts
+import providers
+import processes
+
+from typing import Callable, List, Tuple
+from termcolor import colored
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from taskqueue import TaskQueue
+from preview import keyframe_params
+from video import fit_to_portrait, subtitle_generator, FINAL_VIDEOS_DIR
+
+# Processes rendering segments of a video at once, 1 renders the whole video in one pass
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 1))
+
+# Frame rate of every rendered segment
+FPS = edl.FPS
+
+# Segments render in forked pool processes which start with moviepy already imported. Where processes
+# can't be forked they would re-run main.py on start, so every segment runs render.py in its own interpreter
+FORK_WORKERS = "fork" in multiprocessing.get_all_start_methods()
+
+# How segments move frames from the decoder to the encoder: "moviepy" or "ring" (see framering.py)
+FRAME_TRANSPORT = os.getenv("FRAME_TRANSPORT", "moviepy")
+
+
+def _segment_subtitles(subtitles_path: str, start: float, end: float) -> List[Tuple[Tuple[float, float], str]]:
+    from moviepy.video.tools.subtitles import file_to_subtitles
+
+    # Cues overlapping the segment, moved onto its own timeline
+    cues = []
+    for (ta, tb), text in file_to_subtitles(subtitles_path):
+        if tb > start and ta < end:
+            cues.append(((max(ta, start) - start, min(tb, end) - start), text))
+    return cues
+
+
+def _render_segment(spec: dict) -> str:
+    """
+    Renders one segment of the final video, without audio. Runs in a
+    worker process, see _render_local().
+
+    Args:
+        spec (dict): The segment, see render_parallel().
+
+    Returns:
+        str: The path of the rendered segment.
+    """
+    mpy = providers.get("moviepy")
+    from moviepy.video.tools.subtitles import SubtitlesClip
+
+    job_id = f"{spec['videoId']}-segment-{spec['index']}"
+    processes.start_job(job_id)
+    source = None
+    try:
+        if spec.get("transport", FRAME_TRANSPORT) == "ring":
+            from framering import render_segment
+            return render_segment(spec, fps=FPS)
+
+        source = mpy.VideoFileClip(spec["source"], audio=False)
+        clip = source.subclip(spec["start"], min(spec["end"], source.duration)).set_duration(spec["duration"])
+        clip = fit_to_portrait(clip.set_fps(FPS))
+
+        if spec["subtitlesPath"]:
+            cues = _segment_subtitles(spec["subtitlesPath"], spec["timelineStart"], spec["timelineStart"] + spec["duration"])
+            if cues:
+                subtitles = SubtitlesClip(cues, subtitle_generator(spec["textColor"]))
+                clip = mpy.CompositeVideoClip([clip, subtitles.set_pos(spec["subtitlesPosition"])])
+
+        clip.write_videofile(
+            spec["path"],
+            threads=spec["threads"],
+            codec='libx264',
+            audio=False,
+            fps=FPS,
+            ffmpeg_params=keyframe_params(FPS),
+            logger=None
+        )
+        return spec["path"]
+    finally:
+        if source is not None:
+            source.close()
+        processes.end_job(job_id)
+
+
+def _start_worker() -> None:
+    # Runs once in every pool process, the same limits as for any process of the job
+    if os.name != "nt":
+        processes._limit_resources()
+    providers.get("moviepy")
+
+
+def _run_worker(spec: dict, tracker: "processes.JobProcesses") -> str:
+    processes.bind(tracker)
+
+    spec_path = os.path.splitext(spec["path"])[0] + ".json"
+    with open(spec_path, "w", encoding="utf-8") as file:
+        json.dump(spec, file)
+
+    processes.run([sys.executable, os.path.abspath(__file__), spec_path])
+    return spec["path"]
+
+
+def _render_local(specs: List[dict], cancelled: Callable[[], bool], on_progress: Callable[[float], None]) -> None:
+    # One pool per job, its processes are tracked as processes of the job so cancelling or a timeout stops them
+    tracker = processes.current()
+    workers = max(1, min(RENDER_WORKERS, len(specs)))
+    if FORK_WORKERS:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"), initializer=_start_worker)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+    pending = set()
+    try:
+        if FORK_WORKERS:
+            pending = {executor.submit(_render_segment, spec) for spec in specs}
+            # The fork context starts every process of the pool with the first submit
+            if tracker is not None:
+                for process in executor._processes.values():
+                    tracker.add(processes.PoolProcess(process))
+        else:
+            pending = {executor.submit(_run_worker, spec, tracker) for spec in specs}
+
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_EXCEPTION)
+            for future in done:
+                # Raises the error of a failed segment
+                future.result()
+            if on_progress:
+                on_progress(1 - len(pending) / len(specs))
+            if pending and cancelled():
+                raise InterruptedError("Render cancelled")
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        if tracker is not None:
+            tracker.terminate()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _render_remote(queue: TaskQueue, specs: List[dict], cancelled: Callable[[], bool], on_progress: Callable[[float], None]) -> None:
+    # Workers exchange inputs and outputs through the artifact store
+    keys = {}
+    payloads = []
+    for spec in specs:
+        for path in (spec["source"], spec["subtitlesPath"]):
+            if path and path not in keys:
+                keys[path] = artifacts.put(path)
+        payloads.append({
+            **spec,
+            "source": keys[spec["source"]],
+            "subtitlesPath": keys.get(spec["subtitlesPath"]),
+            "path": None,
+        })
+
+    results = queue.run("render_segment", payloads, specs[0]["videoId"] if specs else None, on_progress, cancelled)
+    for spec, result in zip(specs, results):
+        os.replace(artifacts.get(result["artifact"], os.path.dirname(spec["path"])), spec["path"])
+
+
+def render_parallel(video_paths: List[str], tts_path: str, subtitles_path: str, threads: int, subtitles_position: str, text_color: str, video_id: str = None, directory: str = "../temp", cancelled: Callable[[], bool] = lambda: False, queue: TaskQueue = None, on_progress: Callable[[float], None] = None) -> Tuple[str, str]:
+    """
+    Creates the final video by rendering its segments in parallel worker
+    processes, then joining them with the voice over in a single ffmpeg
+    pass that copies the video stream. Produces the same video as
+    combine_videos() followed by generate_video().
+
+    Args:
+        video_paths (List[str]): The paths to the stock videos.
+        tts_path (str): The path to the text-to-speech audio.
+        subtitles_path (str): The path to the subtitles, or None.
+        threads (int): The number of threads to use, shared by the workers.
+        subtitles_position (str): The position of the subtitles.
+        text_color (str): The color of the subtitles.
+        video_id (str): The ID to name the final video after, a new UUID is used if omitted.
+        directory (str): The directory to write the segments to.
+        cancelled (Callable): Tells whether the render should be abandoned.
+        queue (TaskQueue): Hand the segments to worker nodes instead of rendering them here.
+        on_progress (Callable): Called with the share of rendered segments.
+
+    Returns:
+        Tuple[str, str]: The filename of the final video and the video_id
+    """
+    from moviepy.config import get_setting
+
+    final_video_id = video_id or str(uuid.uuid4())
+    segments_dir = os.path.join(directory, "segments")
+    os.makedirs(segments_dir, exist_ok=True)
+    os.makedirs(FINAL_VIDEOS_DIR, exist_ok=True)
+    output_path = os.path.join(FINAL_VIDEOS_DIR, f"{final_video_id}.mp4")
+
+    # Every segment renders one clip of the edit decision list, already cut on whole frames
+    plan = edl.build(video_paths, audio_path=tts_path, fps=FPS)
+    specs = []
+    for index, clip in enumerate(plan["clips"]):
+        specs.append({
+            **clip,
+            "index": index,
+            "videoId": final_video_id,
+            "subtitlesPath": subtitles_path and os.path.abspath(subtitles_path),
+            "subtitlesPosition": tuple(subtitles_position.split(",")),
+            "textColor": text_color,
+            "threads": max(1, threads // RENDER_WORKERS),
+            "path": os.path.abspath(os.path.join(segments_dir, f"{index:04d}.mp4")),
+        })
+
+    print(colored(f"[+] Rendering {len(specs)} segments with {RENDER_WORKERS} workers...", "blue"))
+    started = time.time()
+
+    if queue is not None:
+        _render_remote(queue, specs, cancelled, on_progress)
+    else:
+        _render_local(specs, cancelled, on_progress)
+
+    print(colored(f"[+] Rendered {len(specs)} segments in {time.time() - started:.1f}s", "green"))
+
+    # Join the segments and add the voice over, only the audio is encoded
+    concat_path = os.path.join(segments_dir, "segments.txt")
+    with open(concat_path, "w", encoding="utf-8") as file:
+        for spec in specs:
+            file.write(f"file '{spec['path']}'\n")
+
+    processes.run([
+        get_setting("FFMPEG_BINARY"), "-y", "-v", "error",
+        "-f", "concat", "-safe", "0", "-i", concat_path,
+        "-i", tts_path,
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "copy", "-c:a", "aac", "-shortest",
+        "-movflags", "+faststart", output_path
+    ])
+
+    return f"{final_video_id}.mp4", final_video_id
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "r", encoding="utf-8") as file:
+        _render_segment(json.load(file))
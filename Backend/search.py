@@ -1,63 +1,64 @@
-import requests
+import http_client
 
 from typing import List
 from termcolor import colored
+from quota import QUOTA
+
+def _best_file(video: dict) -> str:
+    # Only the downloadable file with the largest resolution
+    best_url = ""
+    best_res = 0
+    for video_file in video["video_files"]:
+        # Check if video has a valid download link
+        if ".com/video-files" in video_file["link"] and video_file["width"] * video_file["height"] > best_res:
+            best_url = video_file["link"]
+            best_res = video_file["width"] * video_file["height"]
+    return best_url
 
 def search_for_stock_videos(query: str, api_key: str, it: int, min_dur: int) -> List[str]:
     """
-    Searches for stock videos based on a query.
+    Searches for stock videos based on a query. Results of earlier
+    searches are reused, and fewer results are asked for while the Pexels
+    quota is low, see quota.PexelsQuota.
 
     Args:
         query (str): The query to search for.
         api_key (str): The API key to use.
+        it (int): The amount of results to search through.
+        min_dur (int): The minimum duration of a video in seconds.
 
     Returns:
         List[str]: A list of stock videos.
+
+    Raises:
+        QuotaExhausted: If the quota is used up until it resets.
+        requests.HTTPError: If Pexels refused the search.
     """
-    
-    # Build headers
-    headers = {
-        "Authorization": api_key
-    }
+    videos = QUOTA.cached(query, it)
+
+    if videos is None:
+        # Build headers
+        headers = {
+            "Authorization": api_key
+        }
 
-    # Build URL
-    qurl = f"https://api.pexels.com/videos/search?query={query}&per_page={it}"
+        # Build URL
+        qurl = "https://api.pexels.com/videos/search"
 
-    # Send the request
-    r = requests.get(qurl, headers=headers)
+        # Send the request
+        per_page = QUOTA.acquire(it)
+        r = http_client.get(qurl, headers=headers, params={"query": query, "per_page": per_page})
+        QUOTA.update(r.status_code, r.headers)
+        r.raise_for_status()
 
-    # Parse the response
-    response = r.json()
+        # Parse each video
+        videos = [{"duration": video["duration"], "url": _best_file(video)} for video in r.json()["videos"]]
+        QUOTA.store(query, per_page, videos)
+    else:
+        print(colored(f"\t=> \"{query}\" served from the search cache", "cyan"))
 
-    # Parse each video
-    raw_urls = []
-    video_url = []
-    video_res = 0
-    try:
-        # loop through each video in the result
-        for i in range(it):
-            #check if video has desired minimum duration
-            if response["videos"][i]["duration"] < min_dur:
-                continue
-            raw_urls = response["videos"][i]["video_files"]
-            temp_video_url = ""
-            
-            # loop through each url to determine the best quality
-            for video in raw_urls:
-                # Check if video has a valid download link
-                if ".com/video-files" in video["link"]:
-                    # Only save the URL with the largest resolution
-                    if (video["width"]*video["height"]) > video_res:
-                        temp_video_url = video["link"]
-                        video_res = video["width"]*video["height"]
-                        
-            # add the url to the return list if it's not empty
-            if temp_video_url != "":
-                video_url.append(temp_video_url)
-                
-    except Exception as e:
-        print(colored("[-] No Videos found.", "red"))
-        print(colored(e, "red"))
+    # Only videos with the desired minimum duration and a download link
+    video_url = [video["url"] for video in videos[:it] if video["duration"] >= min_dur and video["url"]]
 
     # Let user know
     print(colored(f"\t=> \"{query}\" found {len(video_url)} Videos", "cyan"))
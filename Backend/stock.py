@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import shutil
+import threading
+
+from typing import Dict, List, Set
+from termcolor import colored
+from edl import probe
+from search import search_for_stock_videos
+from quota import QUOTA, QuotaExhausted
+
+# Directory of local stock clips, subdirectories and sidecar files name their tags
+STOCK_LIBRARY_DIR = os.getenv("STOCK_LIBRARY_DIR", "../stock")
+STOCK_INDEX_PATH = os.path.join(STOCK_LIBRARY_DIR, ".index.json")
+
+# Providers asked for clips, in order, until a search term has enough results
+STOCK_PROVIDERS = [name.strip() for name in os.getenv("STOCK_PROVIDERS", "local,pexels").split(",") if name.strip()]
+
+# Copy downloaded Pexels clips into the local library, tagged with their search term
+STOCK_INGEST_PEXELS = os.getenv("STOCK_INGEST_PEXELS", "false").lower() == "true"
+
+# Files picked up as clips
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".webm", ".mkv")
+
+# Words which say nothing about what a clip shows
+STOPWORDS = {"a", "an", "and", "at", "by", "for", "from", "in", "of", "on", "or", "the", "to", "with", "video", "clip", "stock", "footage", "pexels"}
+
+# How much a match counts, explicit tags say more than file names
+TAG_WEIGHT = 2
+KEYWORD_WEIGHT = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Args:
+        text (str): A search term, file name or tag.
+
+    Returns:
+        List[str]: The lower case words of the text, without stopwords and numbers.
+    """
+    words = re.split(r"[^a-z0-9]+", text.lower())
+    return [word for word in words if len(word) > 1 and not word.isdigit() and word not in STOPWORDS]
+
+
+def _sidecar_tags(path: str) -> List[str]:
+    # clip.mp4 is tagged by clip.json ({"tags": [...]}) or clip.txt (comma separated)
+    base = os.path.splitext(path)[0]
+    if os.path.exists(base + ".json"):
+        with open(base + ".json", "r", encoding="utf-8") as file:
+            return list(json.load(file).get("tags", []))
+    if os.path.exists(base + ".txt"):
+        with open(base + ".txt", "r", encoding="utf-8") as file:
+            return [tag.strip() for tag in file.read().split(",") if tag.strip()]
+    return []
+
+
+class LocalLibrary:
+    """
+    A directory of stock clips, searchable by tag. The clips are indexed by
+    their tags (sidecar files and subdirectories) and the words of their
+    file names in an inverted index, which is held in memory. Probed
+    durations and resolutions are cached in STOCK_INDEX_PATH, so only new
+    or changed clips are probed again.
+    """
+
+    def __init__(self, directory: str = STOCK_LIBRARY_DIR, index_path: str = STOCK_INDEX_PATH):
+        self.directory = directory
+        self.index_path = index_path
+        self.clips: Dict[str, dict] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._loaded = False
+
+    def _add_postings(self, path: str, clip: dict) -> None:
+        for word in clip["keywords"]:
+            self.postings.setdefault(word, {})[path] = KEYWORD_WEIGHT
+        for word in clip["tags"]:
+            self.postings.setdefault(word, {})[path] = TAG_WEIGHT
+
+    def _describe(self, path: str, stat: os.stat_result) -> dict:
+        relative = os.path.relpath(path, self.directory)
+        folders = os.path.dirname(relative).split(os.sep)
+
+        tags = set()
+        for tag in _sidecar_tags(path) + folders:
+            tags.update(tokenize(tag))
+
+        return {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "tags": sorted(tags),
+            "keywords": sorted(set(tokenize(os.path.splitext(os.path.basename(path))[0])) - tags),
+            **probe(path),
+        }
+
+    def build(self) -> int:
+        """
+        Indexes the library. Clips which didn't change keep their cached
+        metadata, new and changed clips are probed.
+
+        Returns:
+            int: The amount of indexed clips.
+        """
+        cached = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                cached = json.load(file)
+
+        clips = {}
+        probed = 0
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.lower().endswith(VIDEO_EXTENSIONS):
+                    continue
+
+                path = os.path.abspath(os.path.join(root, name))
+                stat = os.stat(path)
+                clip = cached.get(path)
+                if clip and clip["size"] == stat.st_size and clip["mtime"] == stat.st_mtime:
+                    clips[path] = clip
+                    continue
+
+                try:
+                    clips[path] = self._describe(path, stat)
+                    probed += 1
+                except Exception as e:
+                    print(colored(f"[-] Could not index stock clip {path}: {e}", "red"))
+
+        with self._lock:
+            self.clips = clips
+            self.postings = {}
+            for path, clip in clips.items():
+                self._add_postings(path, clip)
+            self._loaded = True
+            self._save()
+
+        print(colored(f"[+] Indexed {len(clips)} stock clips ({probed} probed).", "green"))
+        return len(clips)
+
+    def _save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.clips, file)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def _ensure_loaded(self) -> None:
+        with self._build_lock:
+            if not self._loaded:
+                self.build()
+
+    def search(self, query: str, count: int, min_duration: float = 0, min_height: int = 0) -> List[str]:
+        """
+        Finds the clips best matching a search term.
+
+        Args:
+            query (str): The search term.
+            count (int): The maximum amount of clips.
+            min_duration (float): The minimum duration of a clip in seconds.
+            min_height (int): The minimum height of a clip in pixels.
+
+        Returns:
+            List[str]: The paths of the clips, best match first.
+        """
+        self._ensure_loaded()
+
+        scores: Dict[str, int] = {}
+        matches = []
+        with self._lock:
+            for word in set(tokenize(query)):
+                for path, weight in self.postings.get(word, {}).items():
+                    scores[path] = scores.get(path, 0) + weight
+
+            for path, score in scores.items():
+                clip = self.clips[path]
+                if clip["duration"] < min_duration or clip["height"] < min_height:
+                    continue
+                matches.append((-score, -clip["width"] * clip["height"], path))
+
+        return [path for _, _, path in sorted(matches)[:count]]
+
+    def ingest(self, path: str, tags: List[str], name: str = None) -> str:
+        """
+        Copies a clip into the library and indexes it.
+
+        Args:
+            path (str): The clip.
+            tags (List[str]): What the clip shows, e.g. the search term it was found for.
+            name (str): The file name in the library, the name of the clip if omitted.
+
+        Returns:
+            str: The path of the clip in the library.
+        """
+        self._ensure_loaded()
+
+        target = os.path.abspath(os.path.join(self.directory, "ingested", name or os.path.basename(path)))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not os.path.exists(target):
+            shutil.copyfile(path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+
+        # Tags of earlier ingests of the same clip are kept
+        existing = set(_sidecar_tags(target))
+        with open(os.path.splitext(target)[0] + ".json", "w", encoding="utf-8") as file:
+            json.dump({"tags": sorted(existing | set(tags))}, file)
+
+        clip = self._describe(target, os.stat(target))
+        with self._lock:
+            self.clips[target] = clip
+            self._add_postings(target, clip)
+            self._save()
+
+        return target
+
+
+def ingest_downloads(clips: List[tuple]) -> None:
+    """
+    Adds downloaded clips to the local library, see LocalLibrary.ingest().
+
+    Args:
+        clips (List[tuple]): The path, tags and library file name of every clip.
+
+    Returns:
+        None
+    """
+    for path, tags, name in clips:
+        try:
+            LIBRARY.ingest(path, tags, name)
+        except Exception as e:
+            print(colored(f"[-] Could not add {name} to the stock library: {e}", "red"))
+
+
+class PexelsProvider:
+    """Searches the Pexels API."""
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("PEXELS_API_KEY")
+
+    def search(self, query: str, count: int, min_duration: float = 0) -> List[str]:
+        return search_for_stock_videos(query, self.api_key, count, min_duration)
+
+
+class LocalProvider:
+    """Searches the local stock library."""
+
+    def __init__(self, library: LocalLibrary):
+        self.library = library
+
+    def search(self, query: str, count: int, min_duration: float = 0) -> List[str]:
+        results = self.library.search(query, count, min_duration)
+        print(colored(f"\t=> \"{query}\" found {len(results)} local clips", "cyan"))
+        return results
+
+
+# The shared local library
+LIBRARY = LocalLibrary()
+
+# Every known provider by name, see STOCK_PROVIDERS
+PROVIDERS = {
+    "local": LocalProvider(LIBRARY),
+    "pexels": PexelsProvider(),
+}
+
+
+def search(query: str, count: int, min_duration: float, exclude: Set[str] = frozenset()) -> List[str]:
+    """
+    Asks the providers in STOCK_PROVIDERS for clips of a search term, until
+    one finds a clip which isn't used yet.
+
+    Args:
+        query (str): The search term.
+        count (int): The amount of results to ask every provider for.
+        min_duration (float): The minimum duration of a clip in seconds.
+        exclude (Set[str]): Clips which are used already.
+
+    Returns:
+        List[str]: URLs or local paths of clips, best first.
+
+    Raises:
+        Exception: The error of a failed provider, if no provider found a clip which isn't used yet.
+    """
+    order = STOCK_PROVIDERS
+    # While the Pexels quota is low, every other provider is asked first
+    if "pexels" in order and QUOTA.low():
+        order = [name for name in order if name != "pexels"] + ["pexels"]
+
+    results = []
+    errors = []
+    for name in order:
+        provider = PROVIDERS.get(name)
+        if provider is None:
+            print(colored(f"[-] Unknown stock provider: {name}", "red"))
+            continue
+
+        try:
+            results += [clip for clip in provider.search(query, count, min_duration) if clip not in results]
+        except Exception as e:
+            print(colored(f"[-] Stock provider {name} failed: {e}", "red"))
+            errors.append(e)
+
+        if any(clip not in exclude for clip in results):
+            return results
+
+    # An exhausted quota says more than the other failures
+    if errors:
+        raise next((e for e in errors if isinstance(e, QuotaExhausted)), errors[0])
+    return results
+
+
+def is_local(clip: str) -> bool:
+    """
+    Args:
+        clip (str): A search result.
+
+    Returns:
+        bool: Whether the clip is a file of the local library rather than a URL.
+    """
+    return not re.match(r"^https?://", clip)
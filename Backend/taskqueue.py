@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import uuid
+import socket
+
+from typing import Callable, Dict, List
+from termcolor import colored
+
+# Shared queue directory the coordinator and every worker node can reach
+TASK_QUEUE_DIR = os.getenv("TASK_QUEUE_DIR", "../queue")
+
+# Seconds a claimed task may go without a heartbeat before another worker takes it over
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", 120))
+
+# Times a task is handed out before it fails for good
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", 3))
+
+# Seconds results are kept in done/ when nobody collects them, e.g. of cancelled or crashed coordinators
+TASK_RESULT_RETENTION_SECONDS = int(os.getenv("TASK_RESULT_RETENTION_SECONDS", 24 * 3600))
+
+
+class TaskFailed(Exception):
+    """Raised when a task failed on every attempt."""
+
+
+def _write(path: str, task: dict) -> None:
+    # Write next to the target and rename, so readers never see a partial task
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(task, file)
+    os.replace(temp_path, path)
+
+
+def _read(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+class TaskQueue:
+    """
+    A queue of stage tasks kept as files in a shared directory:
+
+        pending/<kind>.<id>.json    waiting for a worker
+        claimed/<kind>.<id>.json    being worked on, touched by heartbeats
+        done/<id>.json              the result or the error
+
+    A task is claimed by renaming it from pending to claimed, which only
+    one worker can win. Claims whose heartbeat is older than the lease
+    are put back into pending, so tasks of a crashed worker aren't lost,
+    until they were handed out TASK_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, directory: str = TASK_QUEUE_DIR, lease: int = TASK_LEASE_SECONDS):
+        self.directory = directory
+        self.lease = lease
+        for state in ("pending", "claimed", "done"):
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state: str, name: str) -> str:
+        return os.path.join(self.directory, state, name)
+
+    def submit(self, kind: str, payload: dict, job_id: str = None) -> str:
+        """
+        Adds a task to the queue.
+
+        Args:
+            kind (str): The kind of the task, workers pick tasks by kind.
+            payload (dict): The input of the task, must be JSON serializable.
+            job_id (str): The generation the task belongs to.
+
+        Returns:
+            str: The ID of the task.
+        """
+        task_id = uuid.uuid4().hex
+        _write(self._path("pending", f"{kind}.{task_id}.json"), {
+            "id": task_id,
+            "kind": kind,
+            "jobId": job_id,
+            "payload": payload,
+            "attempts": 0,
+            "submittedAt": time.time(),
+        })
+        return task_id
+
+    def claim(self, kinds: List[str], worker_id: str) -> dict:
+        """
+        Claims the oldest pending task of the given kinds.
+
+        Args:
+            kinds (List[str]): The kinds of tasks the worker runs.
+            worker_id (str): The ID of the worker.
+
+        Returns:
+            dict: The task, or None if there is none.
+        """
+        names = [name for name in os.listdir(os.path.join(self.directory, "pending")) if name.endswith(".json")]
+        candidates = []
+        for name in names:
+            try:
+                candidates.append((os.path.getmtime(self._path("pending", name)), name))
+            except OSError:
+                pass
+
+        for _, name in sorted(candidates):
+            if name.split(".")[0] not in kinds:
+                continue
+            claimed_path = self._path("claimed", name)
+            try:
+                os.rename(self._path("pending", name), claimed_path)
+            except OSError:
+                # Another worker was faster
+                continue
+
+            task = _read(claimed_path)
+            task.update({"worker": worker_id, "claimedAt": time.time(), "attempts": task["attempts"] + 1})
+            _write(claimed_path, task)
+            return task
+
+        return None
+
+    def heartbeat(self, task: dict, progress: float = None) -> None:
+        """
+        Renews the lease of a claimed task, and records its progress.
+
+        Args:
+            task (dict): The task.
+            progress (float): The progress of the task between 0 and 1.
+
+        Returns:
+            None
+        """
+        if progress is not None:
+            task["progress"] = progress
+        # A worker whose lease ran out must not bring back or take over the claim
+        if self._owns(task):
+            _write(self._path("claimed", f"{task['kind']}.{task['id']}.json"), task)
+
+    def complete(self, task: dict, result: dict) -> None:
+        """
+        Records the result of a task.
+
+        Args:
+            task (dict): The task.
+            result (dict): The output of the task, must be JSON serializable.
+
+        Returns:
+            None
+        """
+        task.update({"status": "done", "result": result, "finishedAt": time.time()})
+        _write(self._path("done", f"{task['id']}.json"), task)
+        self._release(task)
+
+    def fail(self, task: dict, error: str) -> None:
+        """
+        Puts a failed task back into the queue, or records the error once
+        it failed TASK_MAX_ATTEMPTS times.
+
+        Args:
+            task (dict): The task.
+            error (str): What went wrong.
+
+        Returns:
+            None
+        """
+        if not self._owns(task):
+            # Requeued meanwhile, the next attempt is already pending or running
+            return
+
+        task["error"] = error
+        if task["attempts"] < TASK_MAX_ATTEMPTS:
+            _write(self._path("pending", f"{task['kind']}.{task['id']}.json"), task)
+        else:
+            task.update({"status": "failed", "finishedAt": time.time()})
+            _write(self._path("done", f"{task['id']}.json"), task)
+        self._release(task)
+
+    def _owns(self, task: dict) -> bool:
+        # Whether the claim of the task is still the one the caller made
+        try:
+            claim = _read(self._path("claimed", f"{task['kind']}.{task['id']}.json"))
+        except (OSError, ValueError):
+            return False
+        return claim.get("worker") == task.get("worker") and claim.get("claimedAt") == task.get("claimedAt")
+
+    def _release(self, task: dict) -> None:
+        if not self._owns(task):
+            return
+        try:
+            os.remove(self._path("claimed", f"{task['kind']}.{task['id']}.json"))
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, task_ids: List[str]) -> None:
+        for task_id in task_ids:
+            try:
+                os.remove(self._path("done", f"{task_id}.json"))
+            except FileNotFoundError:
+                pass
+
+    def requeue_expired(self) -> int:
+        """
+        Puts claimed tasks whose lease ran out back into the queue, or
+        fails them once they were handed out TASK_MAX_ATTEMPTS times, and
+        removes results nobody collected within TASK_RESULT_RETENTION_SECONDS.
+
+        Returns:
+            int: The amount of tasks put back.
+        """
+        requeued = 0
+        exhausted = 0
+        for name in os.listdir(os.path.join(self.directory, "claimed")):
+            if not name.endswith(".json"):
+                continue
+            path = self._path("claimed", name)
+            try:
+                if time.time() - os.path.getmtime(path) < self.lease:
+                    continue
+                task = _read(path)
+            except (OSError, ValueError):
+                # Released or being written meanwhile
+                continue
+
+            try:
+                if task["attempts"] < TASK_MAX_ATTEMPTS:
+                    os.rename(path, self._path("pending", name))
+                    requeued += 1
+                    continue
+                # Its worker crashed on every attempt, record the failure before the claim goes away
+                task.update({
+                    "status": "failed",
+                    "error": task.get("error") or f"Worker stopped responding on all {task['attempts']} attempts",
+                    "finishedAt": time.time(),
+                })
+                _write(self._path("done", f"{task['id']}.json"), task)
+                os.remove(path)
+                exhausted += 1
+            except OSError:
+                pass
+
+        if requeued:
+            print(colored(f"[!] Requeued {requeued} tasks of unresponsive workers", "yellow"))
+        if exhausted:
+            print(colored(f"[-] Failed {exhausted} tasks whose workers stopped responding on every attempt", "red"))
+
+        for name in os.listdir(os.path.join(self.directory, "done")):
+            if not name.endswith(".json"):
+                continue
+            try:
+                if time.time() - os.path.getmtime(self._path("done", name)) >= TASK_RESULT_RETENTION_SECONDS:
+                    os.remove(self._path("done", name))
+            except OSError:
+                pass
+
+        return requeued
+
+    def status(self, task_id: str, kind: str) -> dict:
+        """
+        Args:
+            task_id (str): The ID of the task.
+            kind (str): The kind of the task.
+
+        Returns:
+            dict: The task with its "status" (pending, claimed, done or failed).
+        """
+        for state, path in [
+            ("done", self._path("done", f"{task_id}.json")),
+            ("claimed", self._path("claimed", f"{kind}.{task_id}.json")),
+            ("pending", self._path("pending", f"{kind}.{task_id}.json")),
+        ]:
+            try:
+                task = _read(path)
+            except (OSError, ValueError):
+                # Moved between states while looking, or not written completely
+                continue
+            task.setdefault("status", state)
+            return task
+
+        return {"id": task_id, "kind": kind, "status": "pending"}
+
+    def cancel(self, task_ids: List[str], kind: str) -> None:
+        """
+        Removes tasks which haven't been claimed yet.
+
+        Args:
+            task_ids (List[str]): The IDs of the tasks.
+            kind (str): The kind of the tasks.
+
+        Returns:
+            None
+        """
+        for task_id in task_ids:
+            try:
+                os.remove(self._path("pending", f"{kind}.{task_id}.json"))
+            except FileNotFoundError:
+                pass
+
+    def run(self, kind: str, payloads: List[dict], job_id: str = None,
+            on_progress: Callable[[float], None] = None, cancelled: Callable[[], bool] = lambda: False,
+            allow_failures: bool = False, poll_interval: float = 1) -> List[dict]:
+        """
+        Submits a task for every payload and waits until workers finished
+        all of them.
+
+        Args:
+            kind (str): The kind of the tasks.
+            payloads (List[dict]): The input of every task.
+            job_id (str): The generation the tasks belong to.
+            on_progress (Callable): Called with the overall progress between 0 and 1.
+            cancelled (Callable): Tells whether to stop waiting.
+            allow_failures (bool): Return None for failed tasks instead of raising.
+            poll_interval (float): Seconds between two looks at the queue.
+
+        Returns:
+            List[dict]: The result of every task, in the order of the payloads.
+        """
+        task_ids = [self.submit(kind, payload, job_id) for payload in payloads]
+        results: Dict[str, dict] = {}
+
+        while len(results) < len(task_ids):
+            if cancelled():
+                self.cancel(task_ids, kind)
+                self._forget(task_ids)
+                raise InterruptedError(f"Waiting for {kind} tasks was cancelled")
+
+            self.requeue_expired()
+
+            progress = 0.0
+            for task_id in task_ids:
+                if task_id in results:
+                    progress += 1
+                    continue
+
+                task = self.status(task_id, kind)
+                if task["status"] == "failed" and allow_failures:
+                    print(colored(f"[-] {kind} task {task_id} failed: {task.get('error')}", "red"))
+                    results[task_id] = None
+                    progress += 1
+                elif task["status"] == "failed":
+                    self.cancel(task_ids, kind)
+                    self._forget(task_ids)
+                    raise TaskFailed(f"{kind} task {task_id} failed: {task.get('error')}")
+                elif task["status"] == "done":
+                    results[task_id] = task["result"]
+                    progress += 1
+                else:
+                    progress += task.get("progress") or 0
+
+            if on_progress:
+                on_progress(progress / len(task_ids))
+            if len(results) < len(task_ids):
+                time.sleep(poll_interval)
+
+        self._forget(task_ids)
+        return [results[task_id] for task_id in task_ids]
+
+
+def worker_id() -> str:
+    """
+    Returns:
+        str: An ID for a worker process, unique across nodes.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
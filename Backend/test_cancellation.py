@@ -0,0 +1,53 @@
+import os
+import time
+
+# main.py checks these on import, and would start the janitor thread
+os.environ.setdefault("PEXELS_API_KEY", "test")
+os.environ.setdefault("TIKTOK_SESSION_ID", "test")
+os.environ.setdefault("IMAGEMAGICK_BINARY", "auto-detect")
+os.environ["JANITOR_INTERVAL"] = "0"
+
+import janitor
+import main
+
+
+def test_cancelled_generation_can_be_resumed_and_cleaned_up(tmp_path, monkeypatch):
+    # The backend works relative to Backend/, keep everything inside tmp_path
+    backend = tmp_path / "Backend"
+    backend.mkdir()
+    monkeypatch.chdir(backend)
+    client = main.app.test_client()
+
+    # Cancel while the generation waits for admission, like /api/cancel does from the frontend
+    def admit(job_id, cost, cancelled):
+        client.post("/api/cancel", json={"generationId": job_id})
+        assert cancelled()
+        return None
+
+    monkeypatch.setattr(main.ADMISSION, "admit", admit)
+
+    response = client.post("/api/generate", json={"videoSubject": "cats", "voice": "en_us_001"}).get_json()
+    generation_id = response["generation_id"]
+    assert response["message"] == "Video generation was cancelled."
+
+    progress = client.get(f"/api/progress/{generation_id}").get_json()
+    assert progress["status"] == "cancelled"
+    assert not main.is_generation_active(generation_id)
+
+    # Resuming is allowed again, and cancelled again here
+    resumed = client.post(f"/api/generate/{generation_id}/resume")
+    assert resumed.status_code == 200
+    assert resumed.get_json()["message"] == "Video generation was cancelled."
+
+    # The janitor removes what the cancelled generation left behind, once it is old enough
+    workspace = tmp_path / "temp" / generation_id
+    workspace.mkdir(parents=True, exist_ok=True)
+    (workspace / "clip.mp4").write_bytes(b"0" * 16)
+    old = time.time() - 2 * 24 * 3600
+    for path in (tmp_path / "temp").rglob("*"):
+        os.utime(path, (old, old))
+
+    monkeypatch.setattr(janitor, "ARTIFACT_STORE_DIR", str(tmp_path / "artifacts"))
+    report = janitor.run(main.is_generation_active)
+    assert generation_id in [entry["jobId"] for entry in report["removed"]]
+    assert not workspace.exists()
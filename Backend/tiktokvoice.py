@@ -8,11 +8,10 @@
 
 import base64
 import requests
-import threading
+import http_client
 
 from typing import List
 from termcolor import colored
-from playsound import playsound
 
 
 VOICES = [
@@ -97,7 +96,7 @@ def split_string(string: str, chunk_size: int) -> List[str]:
 # checking if the website that provides the service is available
 def get_api_response() -> requests.Response:
     url = f'{ENDPOINTS[current_endpoint].split("/a")[0]}'
-    response = requests.get(url)
+    response = http_client.get(url)
     return response
 
 
@@ -113,7 +112,7 @@ def generate_audio(text: str, voice: str) -> bytes:
     url = f"{ENDPOINTS[current_endpoint]}"
     headers = {"Content-Type": "application/json"}
     data = {"text": text, "voice": voice}
-    response = requests.post(url, headers=headers, json=data)
+    response = http_client.post(url, headers=headers, json=data)
     return response.content
 
 
@@ -166,34 +165,19 @@ def tts(
         else:
             # Split longer text into smaller parts
             text_parts = split_string(text, 299)
-            audio_base64_data = [None] * len(text_parts)
 
-            # Define a thread function to generate audio for each text part
-            def generate_audio_thread(text_part, index):
+            # Generate audio for every text part concurrently over the shared connections
+            def generate_audio_part(text_part):
                 audio = generate_audio(text_part, voice)
                 if current_endpoint == 0:
-                    base64_data = str(audio).split('"')[5]
-                else:
-                    base64_data = str(audio).split('"')[3].split(",")[1]
+                    return str(audio).split('"')[5]
+                return str(audio).split('"')[3].split(",")[1]
 
-                if audio_base64_data == "error":
-                    print(colored("[-] This voice is unavailable right now", "red"))
-                    return "error"
+            audio_base64_data = http_client.map_concurrent(generate_audio_part, text_parts)
 
-                audio_base64_data[index] = base64_data
-
-            threads = []
-            for index, text_part in enumerate(text_parts):
-                # Create and start a new thread for each text part
-                thread = threading.Thread(
-                    target=generate_audio_thread, args=(text_part, index)
-                )
-                thread.start()
-                threads.append(thread)
-
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
+            if "error" in audio_base64_data:
+                print(colored("[-] This voice is unavailable right now", "red"))
+                return
 
             # Concatenate the base64 data in the correct order
             audio_base64_data = "".join(audio_base64_data)
@@ -201,6 +185,7 @@ def tts(
         save_audio_file(audio_base64_data, filename)
         print(colored(f"[+] Audio file saved successfully as '{filename}'", "green"))
         if play_sound:
+            from playsound import playsound
             playsound(filename)
 
     except Exception as e:
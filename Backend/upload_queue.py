@@ -0,0 +1,224 @@
+import os
+import copy
+import json
+import time
+import queue
+import threading
+import providers
+
+from uuid import uuid4
+from typing import Callable, Dict, List
+from termcolor import colored
+
+# Where the state of the upload queue is persisted
+UPLOADS_DIR = "../uploads"
+STATE_PATH = os.path.join(UPLOADS_DIR, "queue.json")
+
+# Uploads running at once, at most one per channel
+UPLOAD_WORKERS = int(os.getenv("YOUTUBE_UPLOAD_WORKERS", 2))
+
+# Times an upload is retried from its session before it fails
+UPLOAD_ATTEMPTS = int(os.getenv("YOUTUBE_UPLOAD_ATTEMPTS", 3))
+
+
+class UploadQueue:
+    """
+    Uploads videos to YouTube in background threads.
+
+    Every upload is persisted together with its resumable session URI, so
+    an upload interrupted by a restart continues where it stopped instead
+    of sending the whole file again. Uploads to different channels run in
+    parallel, up to the amount of workers.
+
+    The client for a channel comes from service_factory, which defaults to
+    the cached, authenticated client of youtube.py. Pass a factory built
+    against a local stand-in of the upload endpoint to test the queue.
+    """
+
+    def __init__(self, state_path: str = STATE_PATH, workers: int = UPLOAD_WORKERS, service_factory: Callable = None):
+        self.state_path = state_path
+        self.workers = max(1, workers)
+        self.service_factory = service_factory
+        self.uploads: Dict[str, dict] = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._channel_locks: Dict[str, threading.Lock] = {}
+        self._started = False
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                self.uploads = json.load(file)
+
+    def start(self) -> None:
+        """
+        Starts the workers and re-queues every upload which hadn't finished.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        for upload in sorted(self.uploads.values(), key=lambda upload: upload["created"]):
+            if upload["status"] in ("queued", "uploading"):
+                self._queue.put(upload["id"])
+
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"youtube-upload-{i}", daemon=True).start()
+
+    def pending(self) -> List[dict]:
+        """
+        Returns:
+            List[dict]: The uploads which haven't finished yet.
+        """
+        with self._lock:
+            return [upload for upload in self.uploads.values() if upload["status"] in ("queued", "uploading")]
+
+    def enqueue(self, generation_id: str, video_path: str, title: str, description: str, category: str, keywords: str, privacy_status: str, channel: str = None) -> dict:
+        """
+        Queues the upload of a video.
+
+        Args:
+            generation_id (str): The generation the video belongs to.
+            video_path (str): The path to the video.
+            title (str): The title of the video.
+            description (str): The description of the video.
+            category (str): The category ID of the video.
+            keywords (str): Comma separated keywords.
+            privacy_status (str): "public", "private" or "unlisted".
+            channel (str): The channel to upload to, None for the default one.
+
+        Returns:
+            dict: The upload.
+        """
+        upload = {
+            "id": str(uuid4()),
+            "generationId": generation_id,
+            "channel": channel,
+            "options": {
+                "file": os.path.abspath(video_path),
+                "title": title,
+                "description": description,
+                "category": category,
+                "keywords": keywords,
+                "privacyStatus": privacy_status,
+            },
+            "status": "queued",
+            "created": time.time(),
+            "attempts": 0,
+            "resumableUri": None,
+            "progress": 0,
+            "videoId": None,
+            "error": None,
+        }
+
+        with self._lock:
+            self.uploads[upload["id"]] = upload
+        self._save()
+
+        self.start()
+        self._queue.put(upload["id"])
+        print(colored(f"[+] Queued YouTube upload {upload['id']} for generation {generation_id}", "blue"))
+        return upload
+
+    def find(self, generation_id: str) -> dict:
+        """
+        Args:
+            generation_id (str): The ID of the generation.
+
+        Returns:
+            dict: The latest upload of a generation, or None.
+        """
+        with self._lock:
+            uploads = [upload for upload in self.uploads.values() if upload["generationId"] == generation_id]
+        return max(uploads, key=lambda upload: upload["created"]) if uploads else None
+
+    def _save(self) -> None:
+        with self._lock:
+            # Upload threads only change entries under the lock, so the snapshot is consistent
+            snapshot = copy.deepcopy(self.uploads)
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(self.state_path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(snapshot, file, indent=2)
+            os.replace(self.state_path + ".tmp", self.state_path)
+
+    def _update(self, upload: dict, **changes) -> None:
+        # Every change of an upload goes through here, then the state is persisted
+        with self._lock:
+            upload.update(changes)
+        self._save()
+
+    def _channel_lock(self, channel: str) -> threading.Lock:
+        with self._lock:
+            return self._channel_locks.setdefault(channel or "", threading.Lock())
+
+    def _work(self) -> None:
+        while True:
+            upload = self.uploads[self._queue.get()]
+            # The first enqueue() queues its upload from start() too
+            if upload["status"] not in ("queued", "uploading"):
+                continue
+
+            channel_lock = self._channel_lock(upload["channel"])
+            if not channel_lock.acquire(blocking=False):
+                # Another worker is uploading to this channel, come back later
+                self._queue.put(upload["id"])
+                time.sleep(1)
+                continue
+
+            try:
+                self._upload(upload)
+            finally:
+                channel_lock.release()
+
+    def _upload(self, upload: dict) -> None:
+        youtube = providers.get("youtube")
+        from apiclient.errors import HttpError
+
+        refresh = upload.get("refresh", False)
+        self._update(upload, status="uploading", attempts=upload["attempts"] + 1, refresh=False)
+
+        def persist(insert_request):
+            # Remember the session, so a restart continues from here
+            self._update(upload, resumableUri=insert_request.resumable_uri, progress=insert_request.resumable_progress)
+
+        try:
+            if self.service_factory is not None:
+                service = self.service_factory(upload["channel"])
+            else:
+                # Re-read the credentials if the last attempt was rejected, never ask for them from this thread
+                service = youtube.get_authenticated_service(upload["channel"], refresh=refresh, interactive=False)
+            insert_request = youtube.build_insert_request(service, upload["options"])
+
+            if upload["resumableUri"]:
+                # Ask the server how much of the file it already has
+                print(colored(f"[+] Resuming YouTube upload {upload['id']} at {upload['progress']} bytes", "blue"))
+                youtube.resume_request(insert_request, upload["resumableUri"])
+
+            response = youtube.resumable_upload(insert_request, on_chunk=persist)
+
+            self._update(upload, status="done", videoId=response.get("id"))
+            print(colored(f"[+] Uploaded video ID: {upload['videoId']}", "green"))
+        except Exception as e:
+            changes = {"error": str(e)}
+
+            if isinstance(e, HttpError) and e.resp.status in [401, 403]:
+                # Rebuild the client with fresh credentials on the next attempt
+                changes["refresh"] = True
+            if isinstance(e, HttpError) and e.resp.status == 404:
+                # The session expired, start a new one
+                changes.update(resumableUri=None, progress=0)
+
+            # Missing credentials or an invalid channel don't fix themselves by retrying
+            retriable = not isinstance(e, (youtube.CredentialsMissing, ValueError))
+            changes["status"] = "queued" if retriable and upload["attempts"] < UPLOAD_ATTEMPTS else "failed"
+            self._update(upload, **changes)
+            if changes["status"] == "queued":
+                self._queue.put(upload["id"])
+            print(colored(f"[-] YouTube upload {upload['id']} failed: {e}", "red"))
+
+
+# Queue shared by the backend
+UPLOADS = UploadQueue()
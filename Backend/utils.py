@@ -1,10 +1,10 @@
 import os
 import sys
 import json
-import random
 import logging
+import music
 import zipfile
-import requests
+import http_client
 
 from termcolor import colored
 
@@ -58,12 +58,8 @@ def fetch_songs(zip_url: str) -> None:
             # Skip if songs are already downloaded
             return
 
-        # Download songs
-        response = requests.get(zip_url)
-
-        # Save the zip file
-        with open("../Songs/songs.zip", "wb") as file:
-            file.write(response.content)
+        # Download songs, streaming the zip file to disk
+        http_client.download(zip_url, "../Songs/songs.zip")
 
         # Unzip the file
         with zipfile.ZipFile("../Songs/songs.zip", "r") as file:
@@ -74,6 +70,9 @@ def fetch_songs(zip_url: str) -> None:
 
         logger.info(colored(" => Downloaded Songs to ../Songs.", "green"))
 
+        # Decode and index the songs once, instead of on every video
+        music.build_index()
+
     except Exception as e:
         logger.error(colored(f"Error occurred while fetching songs: {str(e)}", "red"))
 
@@ -85,10 +84,9 @@ def choose_random_song() -> str:
         str: The path to the chosen song.
     """
     try:
-        songs = os.listdir("../Songs")
-        song = random.choice(songs)
+        song = music.choose_track()["song"]
         logger.info(colored(f"Chose song: {song}", "green"))
-        return f"../Songs/{song}"
+        return os.path.join(music.SONGS_DIR, song)
     except Exception as e:
         logger.error(colored(f"Error occurred while choosing random song: {str(e)}", "red"))
 
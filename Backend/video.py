@@ -1,43 +1,63 @@
 import os
 import uuid
+import shutil
 
-import requests
-import srt_equalizer
-import assemblyai as aai
+import edl
+import providers
+import processes
+import http_client
 
-from typing import List, Tuple
-from moviepy.editor import *
+from typing import TYPE_CHECKING, Callable, List, Tuple
 from termcolor import colored
 from dotenv import load_dotenv
 from datetime import timedelta
-from moviepy.video.fx.all import crop
-from moviepy.video.tools.subtitles import SubtitlesClip
-from PIL import Image
+from edl import crop_box
+from preview import keyframe_params
+
+if TYPE_CHECKING:
+    from moviepy.editor import AudioFileClip
 
 load_dotenv("../.env")
 
 ASSEMBLY_AI_API_KEY = os.getenv("ASSEMBLY_AI_API_KEY")
 
-if not hasattr(Image, 'ANTIALIAS'):
-    # For Pillow 10.0.0+
-    Image.ANTIALIAS = Image.Resampling.LANCZOS
+# Where the final videos are written
+FINAL_VIDEOS_DIR = "../final_videos"
+
+# Progressive output modes of the final render
+PROGRESSIVE_MODES = ("fmp4", "hls")
+
+# Length of every fragment/segment of the progressive output in seconds
+PROGRESSIVE_SEGMENT_SECONDS = int(os.getenv("PROGRESSIVE_SEGMENT_SECONDS", 2))
+
+# Maximum amount of ffmpeg decoders running at once while combining videos
+MAX_OPEN_DECODERS = int(os.getenv("MAX_OPEN_DECODERS", 4))
 
 
-def save_video(video_url: str, directory: str = "../temp") -> str:
+def save_video(video_url: str, directory: str = "../temp", on_progress: Callable[[int, int], None] = None) -> str:
     """
     Saves a video from a given URL and returns the path to the video.
 
     Args:
-        video_url (str): The URL of the video to save.
+        video_url (str): The URL of the video to save, or the path of a local clip.
         directory (str): The path of the temporary directory to save the video to
+        on_progress (Callable): Called with the bytes downloaded so far and the total size.
 
     Returns:
         str: The path to the saved video.
     """
     video_id = uuid.uuid4()
     video_path = f"{directory}/{video_id}.mp4"
-    with open(video_path, "wb") as f:
-        f.write(requests.get(video_url).content)
+
+    # Clips of the local stock library are linked instead of downloaded
+    if os.path.isfile(video_url):
+        try:
+            os.link(video_url, video_path)
+        except OSError:
+            shutil.copyfile(video_url, video_path)
+        return video_path
+
+    http_client.download(video_url, video_path, on_progress=on_progress)
 
     return video_path
 
@@ -65,6 +85,7 @@ def __generate_subtitles_assemblyai(audio_path: str, voice: str) -> str:
     else:
         lang_code = voice
 
+    aai = providers.get("assemblyai")
     aai.settings.api_key = ASSEMBLY_AI_API_KEY
     config = aai.TranscriptionConfig(language_code=lang_code)
     transcriber = aai.Transcriber(config=config)
@@ -74,7 +95,7 @@ def __generate_subtitles_assemblyai(audio_path: str, voice: str) -> str:
     return subtitles
 
 
-def __generate_subtitles_locally(sentences: List[str], audio_clips: List[AudioFileClip]) -> str:
+def __generate_subtitles_locally(sentences: List[str], audio_clips: List["AudioFileClip"]) -> str:
     """
     Generates subtitles from a given audio file and returns the path to the subtitles.
 
@@ -107,7 +128,7 @@ def __generate_subtitles_locally(sentences: List[str], audio_clips: List[AudioFi
     return "\n".join(subtitles)
 
 
-def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[AudioFileClip], voice: str) -> str:
+def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List["AudioFileClip"], voice: str, directory: str = "../subtitles") -> str:
     """
     Generates subtitles from a given audio file and returns the path to the subtitles.
 
@@ -115,6 +136,7 @@ def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[
         audio_path (str): The path to the audio file to generate subtitles from.
         sentences (List[str]): all the sentences said out loud in the audio clips
         audio_clips (List[AudioFileClip]): all the individual audio clips which will make up the final audio track
+        directory (str): The directory to save the subtitles to
 
     Returns:
         str: The path to the generated subtitles.
@@ -122,10 +144,10 @@ def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[
 
     def equalize_subtitles(srt_path: str, max_chars: int = 10) -> None:
         # Equalize subtitles
-        srt_equalizer.equalize_srt_file(srt_path, srt_path, max_chars)
+        providers.get("srt_equalizer").equalize_srt_file(srt_path, srt_path, max_chars)
 
     # Save subtitles
-    subtitles_path = f"../subtitles/{uuid.uuid4()}.srt"
+    subtitles_path = f"{directory}/{uuid.uuid4()}.srt"
 
     if ASSEMBLY_AI_API_KEY is not None and ASSEMBLY_AI_API_KEY != "":
         print(colored("[+] Creating subtitles using AssemblyAI", "blue"))
@@ -148,7 +170,176 @@ def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[
     return subtitles_path
 
 
-def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration: int, threads: int) -> str:
+class ClipPool:
+    """
+    Opens every source video once and shares its reader between all the
+    timeline segments cut from it.
+
+    Each segment holds a reference on its source. Once the render has moved
+    past the last segment of a source, its ffmpeg decoder is terminated.
+    At most max_decoders decoders run at once, idle ones are suspended
+    (least recently used first) and restart lazily on their next frame.
+    """
+
+    def __init__(self, max_decoders: int = None):
+        self.max_decoders = max(1, max_decoders or MAX_OPEN_DECODERS)
+        self.clips = {}
+        self.refs = {}
+        self.last_used = {}
+        self.pending = []
+        self._tick = 0
+
+    def acquire(self, path: str, timeline_end: float):
+        """
+        Returns the shared clip of a source, for a segment ending at timeline_end.
+
+        Args:
+            path (str): The path to the source video.
+            timeline_end (float): When the segment ends in the combined video.
+
+        Returns:
+            VideoFileClip: The shared source clip.
+        """
+        self._open(path)
+        self.refs[path] += 1
+        self.pending.append((timeline_end, path))
+        self.touch(path)
+        return self.clips[path]
+
+    def duration(self, path: str) -> float:
+        """
+        Returns the duration of a source video, without taking a reference.
+
+        Args:
+            path (str): The path to the source video.
+
+        Returns:
+            float: The duration in seconds.
+        """
+        return self._open(path).duration
+
+    def _open(self, path: str):
+        if path not in self.clips:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Input video not found: {path}")
+            self.clips[path] = providers.get("moviepy").VideoFileClip(path, audio=False)
+            self.refs[path] = 0
+            self.touch(path)
+        return self.clips[path]
+
+    def touch(self, path: str) -> None:
+        """
+        Marks the decoder of a source as in use and suspends the least
+        recently used other decoders beyond the limit.
+
+        Args:
+            path (str): The path to the source video.
+
+        Returns:
+            None
+        """
+        self._tick += 1
+        self.last_used[path] = self._tick
+
+        running = [p for p, clip in self.clips.items() if p != path and clip.reader.proc is not None]
+        excess = len(running) + 1 - self.max_decoders
+        if excess > 0:
+            for p in sorted(running, key=lambda p: self.last_used.get(p, 0))[:excess]:
+                self.clips[p].reader.close()
+
+    def release_until(self, t: float) -> None:
+        """
+        Drops the references of every segment which ends before t.
+
+        Args:
+            t (float): The current time of the render.
+
+        Returns:
+            None
+        """
+        while self.pending and self.pending[0][0] <= t:
+            _, path = self.pending.pop(0)
+            self.refs[path] -= 1
+            if self.refs[path] == 0:
+                # Stop the decoder, the clip is closed together with the pool
+                self.clips[path].reader.close()
+
+    def close(self) -> None:
+        """
+        Closes every source clip.
+
+        Returns:
+            None
+        """
+        for clip in self.clips.values():
+            try:
+                clip.close()
+            except Exception:
+                pass
+        self.clips.clear()
+        self.refs.clear()
+        self.pending.clear()
+
+
+def fit_to_portrait(clip, size: Tuple[int, int] = (1080, 1920)):
+    """
+    Crops a clip to 9:16 around its center and resizes it.
+
+    Args:
+        clip (VideoClip): The clip.
+        size (Tuple[int, int]): The target size.
+
+    Returns:
+        VideoClip: The cropped and resized clip.
+    """
+    from moviepy.video.fx.all import crop
+
+    # Not all videos are same size,
+    # so we need to resize them
+    box = crop_box(clip.w, clip.h, size)
+    clip = crop(clip, x1=box["x"], y1=box["y"], width=box["width"], height=box["height"])
+    return clip.resize(size)
+
+
+def subtitle_generator(text_color: str):
+    """
+    Returns:
+        Callable: Makes the TextClip of a subtitle.
+    """
+    mpy = providers.get("moviepy")
+
+    return lambda txt: mpy.TextClip(
+        txt,
+        font="../fonts/bold_font.ttf",
+        fontsize=100,
+        color=text_color,
+        stroke_color="black",
+        stroke_width=5,
+    )
+
+
+def frame_logger(on_progress: Callable[[float], None]):
+    """
+    Makes a moviepy logger which reports the share of frames written.
+
+    Args:
+        on_progress (Callable): Called with the share of frames written, between 0 and 1.
+
+    Returns:
+        ProgressBarLogger: The logger, to pass to write_videofile().
+    """
+    from proglog import ProgressBarLogger
+
+    class FrameLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # "t" counts the video frames, "chunk" the audio chunks
+            if bar == "t" and attr == "index" and self.bars[bar].get("total"):
+                on_progress(value / self.bars[bar]["total"])
+
+    return FrameLogger()
+
+
+def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration: int, threads: int, directory: str = "../temp", on_progress: Callable[[float], None] = None) -> str:
     """
     Combines a list of videos into one video and returns the path to the combined video.
 
@@ -157,16 +348,21 @@ def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration:
         max_duration (int): The maximum duration of the combined video.
         max_clip_duration (int): The maximum duration of each clip.
         threads (int): The number of threads to use for the video processing.
+        directory (str): The directory to write the combined video to
+        on_progress (Callable): Called with the share of frames written.
 
     Returns:
         str: The path to the combined video.
     """
+    mpy = providers.get("moviepy")
+
+    pool = ClipPool()
     try:
         # Create temp directory if it doesn't exist
-        os.makedirs("../temp", exist_ok=True)
+        os.makedirs(directory, exist_ok=True)
         
         video_id = str(uuid.uuid4())
-        combined_video_path = os.path.abspath(f"../temp/{video_id}.mp4")
+        combined_video_path = os.path.abspath(f"{directory}/{video_id}.mp4")
         
         # Required duration of each clip
         req_dur = max_duration / len(video_paths)
@@ -175,45 +371,24 @@ def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration:
         print(colored(f"[+] Each clip will be maximum {req_dur} seconds long.", "blue"))
         print(colored(f"[+] Output path: {combined_video_path}", "blue"))
 
+        # Lay out the timeline from the file headers, then cut every segment from its shared source
+        plan = edl.build(video_paths, audio_duration=max_duration, max_clip_duration=max_clip_duration)
+
         clips = []
-        tot_dur = 0
-        # Add downloaded clips over and over until the duration of the audio (max_duration) has been reached
-        while tot_dur < max_duration:
-            for video_path in video_paths:
-                if not os.path.exists(video_path):
-                    raise FileNotFoundError(f"Input video not found: {video_path}")
-                    
-                clip = VideoFileClip(video_path)
-                clip = clip.without_audio()
-                # Check if clip is longer than the remaining audio
-                if (max_duration - tot_dur) < clip.duration:
-                    clip = clip.subclip(0, (max_duration - tot_dur))
-                # Only shorten clips if the calculated clip length (req_dur) is shorter than the actual clip to prevent still image
-                elif req_dur < clip.duration:
-                    clip = clip.subclip(0, req_dur)
-                clip = clip.set_fps(30)
-
-                # Not all videos are same size,
-                # so we need to resize them
-                if round((clip.w/clip.h), 4) < 0.5625:
-                    clip = crop(clip, width=clip.w, height=round(clip.w/0.5625),
-                              x_center=clip.w / 2,
-                              y_center=clip.h / 2)
-                else:
-                    clip = crop(clip, width=round(0.5625*clip.h), height=clip.h,
-                              x_center=clip.w / 2,
-                              y_center=clip.h / 2)
-                clip = clip.resize((1080, 1920))
-
-                if clip.duration > max_clip_duration:
-                    clip = clip.subclip(0, max_clip_duration)
-
-                clips.append(clip)
-                tot_dur += clip.duration
-
-        final_clip = concatenate_videoclips(clips)
+        for segment in plan["clips"]:
+            source = pool.acquire(segment["source"], segment["timelineStart"] + segment["duration"])
+            clip = source.subclip(segment["start"], segment["end"]) if segment["duration"] < source.duration else source
+
+            # Keep track of which decoder is in use
+            clip = clip.fl(lambda gf, t, path=segment["source"]: pool.touch(path) or gf(t))
+            clip = clip.set_fps(30)
+            clips.append(fit_to_portrait(clip))
+
+        final_clip = mpy.concatenate_videoclips(clips)
+        # Stop the decoders of sources which are not needed anymore
+        final_clip = final_clip.fl(lambda gf, t: pool.release_until(t) or gf(t))
         final_clip = final_clip.set_fps(30)
-        final_clip.write_videofile(combined_video_path, threads=threads)
+        final_clip.write_videofile(combined_video_path, threads=threads, logger=frame_logger(on_progress) if on_progress else "bar")
 
         # Verify the file was created
         if not os.path.exists(combined_video_path):
@@ -224,16 +399,30 @@ def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration:
 
     except Exception as e:
         print(colored(f"[-] Error in combine_videos: {str(e)}", "red"))
-        # Clean up any partial clips
-        for clip in clips:
-            try:
-                clip.close()
-            except:
-                pass
         raise
 
+    finally:
+        # Close every source reader, whether the render succeeded or not
+        pool.close()
+
 
-def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str, threads: int, subtitles_position: str, text_color: str) -> Tuple[str, str]:
+def progressive_path(video_id: str, mode: str) -> str:
+    """
+    Returns where the progressive output of a video is written while it renders.
+
+    Args:
+        video_id (str): The ID of the video.
+        mode (str): "fmp4" or "hls".
+
+    Returns:
+        str: The fragmented MP4 file, or the HLS playlist.
+    """
+    if mode == "hls":
+        return os.path.join(FINAL_VIDEOS_DIR, f"{video_id}.hls", "index.m3u8")
+    return os.path.join(FINAL_VIDEOS_DIR, f"{video_id}.partial.mp4")
+
+
+def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str, threads: int, subtitles_position: str, text_color: str, video_id: str = None, progressive: str = None, on_progress: Callable[[float], None] = None) -> Tuple[str, str]:
     """
     This function creates the final video, with subtitles and audio.
 
@@ -244,27 +433,28 @@ def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str,
         threads (int): The number of threads to use for the video processing.
         subtitles_position (str): The position of the subtitles.
         text_color (str): The color of the subtitles.
+        video_id (str): The ID to name the final video after, a new UUID is used if omitted.
+        progressive (str): Write a stream which can be played while rendering,
+            "fmp4" for a fragmented MP4 or "hls" for HLS segments.
+        on_progress (Callable): Called with the share of frames written.
 
     Returns:
         Tuple[str, str]: The filename of the final video and the video_id
     """
+    mpy = providers.get("moviepy")
+    from moviepy.video.tools.subtitles import SubtitlesClip
+
+    logger = frame_logger(on_progress) if on_progress else "bar"
     try:
         # Make a generator that returns a TextClip when called with consecutive
-        generator = lambda txt: TextClip(
-            txt,
-            font="../fonts/bold_font.ttf",
-            fontsize=100,
-            color=text_color,
-            stroke_color="black",
-            stroke_width=5,
-        )
+        generator = subtitle_generator(text_color)
 
         # Split the subtitles position into horizontal and vertical
         horizontal_subtitles_position, vertical_subtitles_position = subtitles_position.split(",")
 
         # Load the video and audio clips
-        video_clip = VideoFileClip(combined_video_path)
-        audio_clip = AudioFileClip(tts_path)
+        video_clip = mpy.VideoFileClip(combined_video_path)
+        audio_clip = mpy.AudioFileClip(tts_path)
 
         # Ensure audio duration matches video duration
         if audio_clip.duration > video_clip.duration:
@@ -274,7 +464,7 @@ def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str,
 
         # Burn the subtitles into the video
         subtitles = SubtitlesClip(subtitles_path, generator)
-        result = CompositeVideoClip([
+        result = mpy.CompositeVideoClip([
             video_clip,
             subtitles.set_pos((horizontal_subtitles_position, vertical_subtitles_position))
         ])
@@ -282,20 +472,58 @@ def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str,
         # Set the audio
         result = result.set_audio(audio_clip)
 
-        # Generate UUID for final video name
-        final_video_id = str(uuid.uuid4())
-        final_video_dir = "../final_videos"
+        # Name the final video after the generation, or a fresh UUID
+        final_video_id = video_id or str(uuid.uuid4())
+        final_video_dir = FINAL_VIDEOS_DIR
         os.makedirs(final_video_dir, exist_ok=True)
         output_path = os.path.join(final_video_dir, f"{final_video_id}.mp4")
 
-        # Write the final video with audio codec specified
-        result.write_videofile(
-            output_path,
-            threads=threads or 2,
-            codec='libx264',
-            audio_codec='aac',
-            fps=30
-        )
+        if progressive in PROGRESSIVE_MODES:
+            stream_path = progressive_path(final_video_id, progressive)
+            os.makedirs(os.path.dirname(stream_path), exist_ok=True)
+
+            # Keyframes every 2 seconds, so every fragment/segment can be played on its own
+            ffmpeg_params = ["-g", str(PROGRESSIVE_SEGMENT_SECONDS * 30)]
+            if progressive == "hls":
+                ffmpeg_params += [
+                    "-f", "hls",
+                    "-hls_time", str(PROGRESSIVE_SEGMENT_SECONDS),
+                    "-hls_playlist_type", "event",
+                    "-hls_segment_filename", os.path.join(os.path.dirname(stream_path), "segment_%05d.ts"),
+                ]
+            else:
+                ffmpeg_params += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+
+            result.write_videofile(
+                stream_path,
+                threads=threads or 2,
+                codec='libx264',
+                audio_codec='aac',
+                fps=30,
+                ffmpeg_params=ffmpeg_params,
+                logger=logger
+            )
+
+            if progressive == "hls":
+                # Remux the segments into the final MP4, without re-encoding
+                from moviepy.config import get_setting
+                processes.run([
+                    get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-i", stream_path,
+                    "-c", "copy", "-bsf:a", "aac_adtstoasc", "-movflags", "+faststart", output_path
+                ])
+            else:
+                os.replace(stream_path, output_path)
+        else:
+            # Write the final video with audio codec specified, keyframes are spaced for the previews
+            result.write_videofile(
+                output_path,
+                threads=threads or 2,
+                codec='libx264',
+                audio_codec='aac',
+                fps=30,
+                ffmpeg_params=keyframe_params(),
+                logger=logger
+            )
 
         # Close the clips to free up resources
         video_clip.close()
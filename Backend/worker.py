@@ -0,0 +1,152 @@
+"""
+Runs stage tasks of generations handed out by the coordinator. Start any
+number of workers, on any node which can reach TASK_QUEUE_DIR and
+ARTIFACT_STORE_DIR:
+
+    python worker.py --kinds download,tts,render_segment --processes 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+import artifacts
+
+from typing import Callable, Dict
+from termcolor import colored
+from dotenv import load_dotenv
+
+load_dotenv("../.env")
+
+from video import save_video
+from local_tts import speak_batch
+from render import _render_segment
+from taskqueue import TaskQueue, worker_id
+
+# Where workers keep the inputs and outputs of the task they run, outside of the janitor's job workspaces
+WORKER_SCRATCH_DIR = os.getenv("WORKER_SCRATCH_DIR", "../worker_scratch")
+
+# Seconds to wait before looking for work again when the queue is empty
+WORKER_IDLE_SECONDS = float(os.getenv("WORKER_IDLE_SECONDS", 1))
+
+
+def handle_download(payload: dict, scratch: str) -> dict:
+    """Downloads a stock video into the artifact store."""
+    return {"artifact": artifacts.put(save_video(payload["url"], directory=scratch))}
+
+
+def handle_tts(payload: dict, scratch: str) -> dict:
+    """Speaks a sentence into the artifact store."""
+    path = speak_batch([payload["text"]], payload["voice"], scratch)[0]
+    return {"artifact": artifacts.put(path)}
+
+
+def handle_render_segment(payload: dict, scratch: str) -> dict:
+    """Renders a segment of a final video into the artifact store."""
+    spec = dict(payload)
+    spec["source"] = artifacts.get(spec["source"], scratch)
+    if spec["subtitlesPath"]:
+        spec["subtitlesPath"] = artifacts.get(spec["subtitlesPath"], scratch)
+    spec["path"] = os.path.abspath(os.path.join(scratch, "segment.mp4"))
+
+    _render_segment(spec)
+    return {"artifact": artifacts.put(spec["path"])}
+
+
+# The kinds of tasks a worker can run
+HANDLERS: Dict[str, Callable[[dict, str], dict]] = {
+    "download": handle_download,
+    "tts": handle_tts,
+    "render_segment": handle_render_segment,
+}
+
+
+def run_task(queue: TaskQueue, task: dict) -> None:
+    """
+    Runs a claimed task, renewing its lease while it runs.
+
+    Args:
+        queue (TaskQueue): The queue the task was claimed from.
+        task (dict): The task.
+
+    Returns:
+        None
+    """
+    scratch = os.path.join(WORKER_SCRATCH_DIR, task["id"])
+    os.makedirs(scratch, exist_ok=True)
+
+    finished = threading.Event()
+
+    def keep_alive():
+        while not finished.wait(queue.lease / 3):
+            queue.heartbeat(task)
+
+    threading.Thread(target=keep_alive, daemon=True).start()
+
+    print(colored(f"[*] Running {task['kind']} task {task['id']} of job {task['jobId']}", "blue"))
+    try:
+        result = HANDLERS[task["kind"]](task["payload"], scratch)
+        finished.set()
+        queue.complete(task, result)
+        print(colored(f"[+] Finished {task['kind']} task {task['id']}", "green"))
+    except Exception as e:
+        finished.set()
+        print(colored(f"[-] {task['kind']} task {task['id']} failed: {e}", "red"))
+        queue.fail(task, str(e))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def work(kinds: list) -> None:
+    """
+    Claims and runs tasks of the given kinds until interrupted.
+
+    Args:
+        kinds (list): The kinds of tasks to run.
+
+    Returns:
+        None
+    """
+    queue = TaskQueue()
+    me = worker_id()
+    print(colored(f"[+] Worker {me} waiting for {', '.join(kinds)} tasks", "green"))
+
+    while True:
+        queue.requeue_expired()
+        task = queue.claim(kinds, me)
+        if task is None:
+            time.sleep(WORKER_IDLE_SECONDS)
+            continue
+        run_task(queue, task)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run stage tasks of video generations.")
+    parser.add_argument("--kinds", default=",".join(HANDLERS), help="Comma separated kinds of tasks to run")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start on this node")
+    args = parser.parse_args()
+
+    kinds = [kind for kind in args.kinds.split(",") if kind]
+    unknown = [kind for kind in kinds if kind not in HANDLERS]
+    if unknown:
+        parser.error(f"Unknown task kinds: {', '.join(unknown)}")
+
+    if args.processes > 1:
+        # One interpreter per worker, rendering is CPU bound
+        children = [
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--kinds", ",".join(kinds)])
+            for _ in range(args.processes)
+        ]
+        try:
+            for child in children:
+                child.wait()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+    else:
+        try:
+            work(kinds)
+        except KeyboardInterrupt:
+            print(colored("[!] Worker stopped.", "yellow"))
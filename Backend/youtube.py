@@ -1,8 +1,10 @@
 import os
+import re
 import sys
 import time
 import random
 import httplib2
+import threading
 
 from termcolor import colored
 from oauth2client.file import Storage
@@ -58,39 +60,106 @@ https://developers.google.com/api-client-library/python/guide/aaa_client_secrets
 """
 
 VALID_PRIVACY_STATUSES = ("public", "private", "unlisted")  
+
+# Size of every upload request in MB, the file is sent in one request if 0.
+# Smaller chunks mean less to resend when a connection drops.
+UPLOAD_CHUNK_MB = int(os.getenv("YOUTUBE_UPLOAD_CHUNK_MB", 8))
+
+# Discovery document to build the client from, lets a local stand-in of the API be used
+DISCOVERY_URL = os.getenv("YOUTUBE_DISCOVERY_URL")
+
+# Names a channel's credentials file may be named after
+CHANNEL_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Authenticated clients, keyed by the channel they upload to
+_SERVICES = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+class CredentialsMissing(Exception):
+    """Raised when a channel has no valid credentials and may not ask for them."""
+
+
+def credentials_file(channel: str = None) -> str:
+    """
+    Returns the file the OAuth credentials of a channel are stored in.
+
+    Args:
+        channel (str): The name of the channel, None for the default one.
+
+    Returns:
+        str: The path to the credentials file.
+
+    Raises:
+        ValueError: If the name of the channel isn't made of letters, digits, "_" and "-".
+    """
+    if channel:
+        # The name becomes part of a path, it must not leave the backend directory
+        if not CHANNEL_NAME.match(channel):
+            raise ValueError(f"Invalid YouTube channel name: {channel!r}")
+        return f"./oauth2-{channel}.json"
+    return f"{sys.argv[0]}-oauth2.json"
   
   
-def get_authenticated_service():
+def get_authenticated_service(channel: str = None, refresh: bool = False, interactive: bool = True):
     """
-    This method retrieves the YouTube service.
+    This method retrieves the YouTube service. The client is built and
+    authorized once per channel, and reused afterwards.
+
+    Args:
+        channel (str): The channel to upload to, None for the default one.
+        refresh (bool): Whether to re-read the credentials and rebuild the client.
+        interactive (bool): Whether missing credentials may be asked for in the
+            browser or console. Background threads can't answer, they pass False.
 
     Returns:
         any: The authenticated YouTube service.
+
+    Raises:
+        CredentialsMissing: If the credentials are missing or invalid and interactive is False.
     """
-    flow = flow_from_clientsecrets(CLIENT_SECRETS_FILE,
-                                   scope=SCOPES,
-                                   message=MISSING_CLIENT_SECRETS_MESSAGE)
+    with _SERVICES_LOCK:
+        if channel in _SERVICES and not refresh:
+            return _SERVICES[channel]
 
-    storage = Storage(f"{sys.argv[0]}-oauth2.json")
-    credentials = storage.get()
+        flow = flow_from_clientsecrets(CLIENT_SECRETS_FILE,
+                                       scope=SCOPES,
+                                       message=MISSING_CLIENT_SECRETS_MESSAGE)
 
-    if credentials is None or credentials.invalid:
-        flags = argparser.parse_args()
-        credentials = run_flow(flow, storage, flags)
+        storage = Storage(credentials_file(channel))
+        credentials = storage.get()
 
-    return build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
-                 http=credentials.authorize(httplib2.Http()))
+        if credentials is None or credentials.invalid:
+            if not interactive:
+                raise CredentialsMissing(
+                    f"No valid YouTube credentials in {credentials_file(channel)}, authorize the channel with "
+                    f"python -c \"import youtube; youtube.get_authenticated_service({channel!r})\""
+                )
+            flags = argparser.parse_args()
+            credentials = run_flow(flow, storage, flags)
 
-def initialize_upload(youtube: any, options: dict):
+        if DISCOVERY_URL:
+            service = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
+                            http=credentials.authorize(httplib2.Http()),
+                            discoveryServiceUrl=DISCOVERY_URL,
+                            static_discovery=False)
+        else:
+            service = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
+                            http=credentials.authorize(httplib2.Http()))
+
+        _SERVICES[channel] = service
+        return service
+
+def build_insert_request(youtube: any, options: dict):
     """
-    This method uploads a video to YouTube.
+    This method builds the request which creates and uploads a video.
 
     Args:
         youtube (any): The authenticated YouTube service.
         options (dict): The options to upload the video with.
 
     Returns:
-        response: The response from the upload process.
+        HttpRequest: The resumable insert request.
     """
 
     tags = None
@@ -111,22 +180,54 @@ def initialize_upload(youtube: any, options: dict):
         }
     }
 
+    chunksize = UPLOAD_CHUNK_MB * 1024 * 1024 if UPLOAD_CHUNK_MB > 0 else -1
+
     # Call the API's videos.insert method to create and upload the video.
-    insert_request = youtube.videos().insert(
+    return youtube.videos().insert(
         part=",".join(body.keys()),
         body=body,
-        media_body=MediaFileUpload(options['file'], chunksize=-1, resumable=True)
+        media_body=MediaFileUpload(options['file'], chunksize=chunksize, resumable=True)
     )
 
-    return resumable_upload(insert_request)
+def resume_request(insert_request, resumable_uri: str):
+    """
+    Points an insert request at the session of an earlier attempt. The
+    next chunk first asks the server how much of the file it already has.
+
+    Args:
+        insert_request (HttpRequest): The request, see build_insert_request().
+        resumable_uri (str): The session URI of the earlier attempt.
+
+    Returns:
+        HttpRequest: The request.
+    """
+    insert_request.resumable_uri = resumable_uri
+    # The client library has no public way to resume a session, this is the state it resumes from after an error
+    insert_request._in_error_state = True
+    return insert_request
+
+def initialize_upload(youtube: any, options: dict):
+    """
+    This method uploads a video to YouTube.
+
+    Args:
+        youtube (any): The authenticated YouTube service.
+        options (dict): The options to upload the video with.
+
+    Returns:
+        response: The response from the upload process.
+    """
+    return resumable_upload(build_insert_request(youtube, options))
 
-def resumable_upload(insert_request: MediaFileUpload):
+def resumable_upload(insert_request: MediaFileUpload, on_chunk=None):
     """
     This method implements an exponential backoff strategy to resume a  
     failed upload.
 
     Args:
         insert_request (MediaFileUpload): The request to insert the video.
+        on_chunk (Callable): Called with the request after every chunk, e.g. to
+            persist its resumable_uri and resumable_progress.
 
     Returns:
         response: The response from the upload process.
@@ -138,6 +239,12 @@ def resumable_upload(insert_request: MediaFileUpload):
         try:
             print(colored(" => Uploading file...", "magenta"))
             status, response = insert_request.next_chunk()
+            error = None
+            if on_chunk is not None:
+                on_chunk(insert_request)
+            if response is None:
+                # More chunks to go
+                continue
             if 'id' in response:
                 print(f"Video id '{response['id']}' was successfully uploaded.")
                 return response
@@ -183,8 +290,8 @@ def upload_video(video_path, title, description, category, keywords, privacy_sta
     except HttpError as e:
         print(colored(f"[-] An HTTP error {e.resp.status} occurred:\n{e.content}", "red"))
         if e.resp.status in [401, 403]:
-            # Here you could refresh the credentials and retry the upload  
-            youtube = get_authenticated_service() # This will prompt for re-authentication if necessary
+            # Refresh the credentials and retry the upload  
+            youtube = get_authenticated_service(refresh=True) # This will prompt for re-authentication if necessary
             video_response = initialize_upload(youtube, {
                 'file': video_path,
                 'title': title,